@@ -1,27 +1,46 @@
 # -*- coding: utf-8 -*-
 """
-This file provides ConflictDetector with three API method.
+This file provides ConflictDetector with four API methods.
 !! Please call method 'start' before using APIs and provides the path of CoreNLP directory.
 
 Method 'requirement_model' models Natural Language requirements into tuples.
 Method 'requirement_conflict_detect' detects conflicts in Natural Language requirements.
 Method 'tuples_conflict_detect' detects conflicts in requirement tuples.
+Method 'incremental_conflict_detect' detects conflicts in Natural Language requirements changed since its last call.
 """
-import os
-from typing import List
+import contextlib, multiprocessing.pool, os, sys
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
 
-from FSARC.detection import Detector
-from FSARC.modelling import model
+from config import CoreNLP_batch, conflict_flush
+from FSARC import spill
+from FSARC.incremental import DetectionState
+from FSARC.modelio import ModelWriter, is_model_file, read_model
+from FSARC.modelling import model, model_batch, model_parallel, modelling_pool
 from FSARC.nlp import start, close
-from FSARC.Requirement import Req
+from FSARC.Requirement import Req, Entity
+
+
+def read_batches(fin: TextIO, size: int = CoreNLP_batch) -> Iterator[List[str]]:
+    lines = []
+    for line in fin:
+        lines.append(line)
+        if len(lines) == size:
+            yield lines
+            lines = []
+    if len(lines) > 0:
+        yield lines
 
 
 class ConflictDetector:
     is_start :bool = False
 
     @classmethod
-    def start(cls):
-        start()
+    def start(cls, lazy: bool = True):
+        """
+        initialize CoreNLP
+        :param lazy: launch the CoreNLP server only when a sentence is missing in the parse cache
+        """
+        start(lazy)
         cls.is_start = True
 
     @classmethod
@@ -30,14 +49,19 @@ class ConflictDetector:
         close()
 
     @classmethod
-    def requirement_model(cls, req_file: str = None, model_file: str = None, original_req: bool = False) -> None:
+    def requirement_model(cls, req_file: str = None, model_file: str = None, original_req: bool = False,
+                          workers: int = 1, binary: bool = False) -> None:
         """
         modelling requirements from req_file to tuples, then print to model_file, otherwise print to screen if not given
         :param req_file: path of original requirement file
         :param model_file: path of modelled requirement file
-        :param original_req: print the original requirements or not
+        :param original_req: print the original requirements or not, not for binary model files
+        :param workers: number of worker processes for modelling
+        :param binary: write model_file in the binary format, which is loaded faster by 'tuples_conflict_detect'
         """
         cls.check_start()
+        # entities of former runs are not shared with this one
+        Entity.reset()
         if req_file is None:
             req = input()
             if original_req:
@@ -49,77 +73,153 @@ class ConflictDetector:
             print('Invalid file path. Please check the path and call again.')
             return
         print(f'requirements: {req_file} -> modelled requirements: {model_file}')
-        with open(req_file, encoding='UTF-8') as fin:
-            fout = open(model_file, 'w', encoding='UTF-8') if model_file is not None else None
-            for line in fin:
-                line = line[: -1] if line[-1] == '\n' else line
-                if original_req:
-                    print(line, file=fout)
-                for req in model(line):
-                    print(req, file=fout, end='')
-                print('\n', file=fout)
-            if fout is not None:
-                fout.close()
+        if binary and model_file is not None:
+            with open(req_file, encoding='UTF-8') as fin, ModelWriter(model_file) as writer, \
+                    cls.modelling_workers(workers) as pool:
+                for lines in read_batches(fin, CoreNLP_batch * workers * 8):
+                    for reqs in cls.model_lines(lines, workers, pool):
+                        writer.write_line(reqs)
+            return
+        with open(req_file, encoding='UTF-8') as fin, cls.modelling_workers(workers) as pool:
+            # the output of a batch is written at once through a large buffer
+            fout = open(model_file, 'w', encoding='UTF-8', buffering=1 << 20) if model_file is not None else sys.stdout
+            try:
+                for lines in read_batches(fin, CoreNLP_batch * workers * 8):
+                    lines = [line[: -1] if line[-1] == '\n' else line for line in lines]
+                    texts = []
+                    for line, reqs in zip(lines, cls.model_lines(lines, workers, pool)):
+                        if original_req:
+                            texts.append(line + '\n')
+                        texts.extend([str(req) for req in reqs])
+                        texts.append('\n\n')
+                    fout.write(''.join(texts))
+            finally:
+                if fout is not sys.stdout:
+                    fout.close()
 
 
     @classmethod
-    def requirement_conflict_detect(cls, req_file: str, conflict_file: str = None) -> None:
+    def requirement_conflict_detect(cls, req_file: str, conflict_file: str = None, workers: int = 1) -> None:
         """
         detecting conflicts in requirements from req_file, then print to model_file, otherwise print to screen if not given
         :param req_file: path of original requirement file
         :param conflict_file: path of conflict file
+        :param workers: number of worker processes for modelling and for conflict detecting
         """
         cls.check_start()
+        # entities of former runs are not shared with this one
+        Entity.reset()
         if not os.path.isfile(req_file):
             print('Invalid file path. Please check the path and call again.')
             return
         print(f'requirements: {req_file} -> conflicts: {conflict_file}')
-        modelled_reqs = []
-        count = 1
-        with open(req_file, encoding='UTF-8') as fin:
-            for line in fin:
-                for r in model(line):
-                    r.reqid = count
-                    count += 1
-                    modelled_reqs.append(r)
-        cls.conflict_detect(modelled_reqs, conflict_file)
+        with open(req_file, encoding='UTF-8') as fin, cls.modelling_workers(workers) as pool:
+            modelled_lines = (reqs for lines in read_batches(fin, CoreNLP_batch * workers * 8)
+                              for reqs in cls.model_lines(lines, workers, pool))
+            cls.conflict_detect(cls.numbered(modelled_lines), conflict_file, workers)
 
 
     @classmethod
-    def tuples_conflict_detect(cls, model_file: str, conflict_file: str = None) -> None:
+    def tuples_conflict_detect(cls, model_file: str, conflict_file: str = None, workers: int = 1) -> None:
         """
         detecting conflicts in requirements from model_file, then print to model_file, otherwise print to screen if not given
-        :param model_file: path of modelled requirement file
+        :param model_file: path of modelled requirement file, in the text or the binary format
         :param conflict_file: path of conflict file
+        :param workers: number of worker processes for conflict detecting
         """
         cls.check_start()
+        # entities of former runs are not shared with this one
+        Entity.reset()
         if not os.path.isfile(model_file):
             print('Invalid file path. Please check the path and call again.')
             return
         print(f'modelled requirements: {model_file} -> conflicts: {conflict_file}')
-        modelled_reqs = []
-        count = 1
+        if is_model_file(model_file):
+            cls.conflict_detect(cls.numbered(read_model(model_file)), conflict_file, workers)
+            return
         with open(model_file, encoding='UTF-8') as fin:
-            for line in fin:
-                if len(line) > 10:
-                    r = Req.str2Req(line)
-                    r.reqid = count
-                    count += 1
-                    modelled_reqs.append(r)
-        cls.conflict_detect(modelled_reqs, conflict_file)
+            cls.conflict_detect(cls.numbered([Req.str2Req(line)] for line in fin if len(line) > 10),
+                                conflict_file, workers)
 
 
     @classmethod
-    def conflict_detect(cls, modelled_reqs: List[Req], conflict_file: str = None):
-        conflicts = Detector.detect(modelled_reqs)
+    def incremental_conflict_detect(cls, req_file: str, state_file: str, conflict_file: str = None) -> None:
+        """
+        detecting conflicts in requirements from req_file, only the changed requirements are modelled and compared,
+        the results are the same as 'requirement_conflict_detect'
+        :param req_file: path of original requirement file
+        :param state_file: path of detection state, which is created at the first call and updated at each call
+        :param conflict_file: path of conflict file
+        """
+        cls.check_start()
+        # entities of former runs are not shared with this one
+        Entity.reset()
+        if not os.path.isfile(req_file):
+            print('Invalid file path. Please check the path and call again.')
+            return
+        print(f'requirements: {req_file}, state: {state_file} -> conflicts: {conflict_file}')
+        with open(req_file, encoding='UTF-8') as fin:
+            lines = fin.readlines()
+        state = DetectionState.load(state_file)
+        print('conflict detecting ...')
+        conflicts = state.update(lines)
+        print('conflict detecting finished.')
+        state.save(state_file)
+        cls.write_conflicts(conflicts, conflict_file)
+
+
+    @classmethod
+    def conflict_detect(cls, modelled_reqs: Iterable[Req], conflict_file: str = None, workers: int = 1):
+        """
+        :param modelled_reqs: the requirements, which are spilled to disk beyond the ceiling detect_memory in config
+        :param workers: number of worker processes sharing the requirement pairs
+        """
+        cls.write_conflicts(spill.detect_iter(modelled_reqs, workers), conflict_file)
+
+    @classmethod
+    def numbered(cls, modelled_lines: Iterable[List[Req]]) -> Iterator[Req]:
+        """ the requirements of the lines, numbered from 1 """
+        count = 1
+        for reqs in modelled_lines:
+            for r in reqs:
+                r.reqid = count
+                count += 1
+                yield r
+
+    @classmethod
+    def write_conflicts(cls, conflicts: Iterable[Tuple[str, List[Req]]], conflict_file: str = None):
+        """
+        write the conflicts once they are found, the file is flushed every conflict_flush conflicts
+        """
         fout = open(conflict_file, 'w', encoding='UTF-8') if conflict_file is not None else None
-        for conflict in conflicts:
-            print(conflict[0], file=fout)
-            for r in conflict[1]:
-                print(r, file=fout, end='')
-            print(file=fout)
-        if fout is not None:
-            fout.close()
+        try:
+            for count, conflict in enumerate(conflicts, 1):
+                print(conflict[0], file=fout)
+                for r in conflict[1]:
+                    print(r, file=fout, end='')
+                print(file=fout)
+                if count % conflict_flush == 0 and fout is not None:
+                    fout.flush()
+        finally:
+            if fout is not None:
+                fout.close()
+
+    @classmethod
+    def model_lines(cls, lines: List[str], workers: int, pool: Optional[multiprocessing.pool.Pool] = None) \
+            -> List[List[Req]]:
+        if workers > 1:
+            return model_parallel(lines, workers, pool)
+        return model_batch(lines)
+
+    @classmethod
+    @contextlib.contextmanager
+    def modelling_workers(cls, workers: int) -> Iterator[Optional[multiprocessing.pool.Pool]]:
+        """ worker processes modelling all batches of a file, None for modelling in this process """
+        if workers <= 1:
+            yield None
+            return
+        with modelling_pool(workers) as pool:
+            yield pool
 
     @classmethod
     def check_start(cls):
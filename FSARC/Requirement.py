@@ -2,7 +2,8 @@
 """
 This file provides classes for requirements data structure.
 """
-from typing import List, Union
+import contextlib, threading
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
 
 def str2tuples(tuples: List[str]) -> tuple:
     # agent
@@ -10,12 +11,12 @@ def str2tuples(tuples: List[str]) -> tuple:
     # operation
     operation = Operation()
     predicate = tuples[1]
-    if operation[:5] == 'ABLE ':
+    if predicate[:5] == 'ABLE ':
         operation.Able = True
-        predicate = operation[5:]
-    elif operation[:4] == 'NOT ':
+        predicate = predicate[5:]
+    if predicate[:4] == 'NOT ':
         operation.Not = True
-        predicate = operation[4:]
+        predicate = predicate[4:]
     operation.predicate = predicate
     # input & output
     entity_str_list = tuples[2].split(', ')
@@ -27,7 +28,31 @@ def str2tuples(tuples: List[str]) -> tuple:
     return agent, operation, Input, output, restriction
 
 
+class Symbols:
+    """
+    entity keys, predicates and restrictions interned to integer IDs, equal values have equal IDs,
+    so the signatures, the blocking and the screening compare integers.
+    The IDs are of this process, they are not pickled with the entities.
+    """
+    ids : Dict[object, int] = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def id(cls, value) -> int:
+        if (i := cls.ids.get(value)) is None:
+            with cls.lock:
+                if (i := cls.ids.get(value)) is None:
+                    i = cls.ids[value] = len(cls.ids)
+        return i
+
+    @classmethod
+    def id_tuple(cls, values: List[str]) -> Tuple[int, ...]:
+        return tuple([cls.id(value) for value in values])
+
+
 class Operation:
+    __slots__ = ('predicate', 'Not', 'Able')
+
     def __init__(self):
         self.predicate  : str   = ''
         self.Not        : bool  = False
@@ -35,12 +60,19 @@ class Operation:
     def __repr__(self):
         return f"{'ABLE ' if self.Able else ''}{'NOT ' if self.Not else ''}{self.predicate}"
 
+    @property
+    def pid(self) -> int:
+        """ ID of the predicate """
+        return Symbols.id(self.predicate)
+
 
 class Req:
     """
     Requirement 8 tuples:
     (id, groupid, event, agent, operation, input, output, restriction)
     """
+    __slots__ = ('reqid', 'groupid', 'event', 'agent', 'operation', 'input', 'output', 'restriction')
+
     def __init__(self, reqid: int):
         self.reqid      : int               = reqid
         self.groupid    : int               = 0
@@ -55,6 +87,21 @@ class Req:
         event = ', '.join([str(c) for c in self.event]) if len(self.event) != 0 else '*always*'
         return f'({self.reqid}) , ({self.groupid}) , ({event}) , {tuples_to_str(self)}\n'
 
+    def with_event(self, event: List['Condition']) -> 'Req':
+        """ a requirement sharing all tuples but the event with this one, instead of a deep copy """
+        req = Req(self.reqid)
+        req.groupid, req.event = self.groupid, event
+        req.agent, req.operation, req.input, req.output = self.agent, self.operation, self.input, self.output
+        req.restriction = self.restriction
+        return req
+
+    def signature(self) -> tuple:
+        """
+        hashable structure of the requirement without its IDs,
+        requirements of equal signatures have the same results of all rules
+        """
+        return tuple([c.signature() for c in self.event]), tuples_signature(self)
+
     @classmethod
     def str2Req(cls, s: str):
         s = s[1: -1]
@@ -81,6 +128,8 @@ class Condition:
     event clause 5 tuples:
     (agent, operation, input, output, restriction)
     """
+    __slots__ = ('agent', 'operation', 'input', 'output', 'restriction')
+
     def __init__(self):
         self.agent      : Entity        = Entity('')
         self.operation  : Operation     = Operation()
@@ -91,6 +140,9 @@ class Condition:
     def __repr__(self):
         return f'{{{tuples_to_str(self)}}}'
 
+    def signature(self) -> tuple:
+        return tuples_signature(self)
+
     @classmethod
     def str2Condition(cls, tuple_str: str):
         tuples = (tuple_str[1: -1]).split(') , (')
@@ -101,7 +153,10 @@ class Condition:
 
 class Entity:
     """ entities in requirements """
-    entities: list = []         # all entities in requirements
+    __slots__ = ('base', 'modifier', 'is_all', 'parts', 'entirety', '_modset', '_eid')
+    entities: Dict[tuple, 'Entity'] = {}    # all entities in requirements, by their keys
+    lock = threading.Lock()
+    local = threading.local()               # entities of a thread in its own scope, see 'thread_scope'
 
     def __init__(self, base: str):
         self.base       : str           = base
@@ -109,6 +164,8 @@ class Entity:
         self.is_all     : bool          = False
         self.parts      : List[Entity]  = []
         self.entirety   : Entity        = Entity('') if base != '' else None
+        self._modset    : Optional[FrozenSet[str]] = None   # modifiers of the interned entity
+        self._eid       : int           = -1    # ID of the key of the interned entity, -1 if not known
 
     def __repr__(self):
         if self.base == '':
@@ -127,22 +184,93 @@ class Entity:
     def __eq__(self, other):
         if self is None or other is None:
             return False
+        if self is other:
+            return True
+        if self._eid >= 0 and other._eid >= 0:
+            return self._eid == other._eid
         return self.base == other.base \
                and self.is_all == other.is_all \
                and self.entirety == other.entirety \
-               and len(set(self.modifier)) == len(set(other.modifier)) \
-                    == len(set(self.modifier) | set(other.modifier))
+               and self.modset == other.modset
+
+    @property
+    def modset(self) -> FrozenSet[str]:
+        """ modifiers as a set, kept once the entity is interned, whose modifiers are not changed any more """
+        return self._modset if self._modset is not None else frozenset(self.modifier)
+
+    def key(self) -> tuple:
+        """ hashable key of the entity, two entities are equal if and only if their keys are equal """
+        entirety = self.entirety.key() if self.entirety is not None else None
+        return self.base, self.is_all, self.modset, entirety
+
+    @property
+    def eid(self) -> int:
+        """ ID of the key of the entity, two entities are equal if and only if their IDs are equal """
+        if self._eid >= 0:
+            return self._eid
+        eid = Symbols.id(self.key())
+        # the modifiers of an entity which is not interned may still be changed
+        if self._modset is not None:
+            self._eid = eid
+        return eid
+
+    def agent_id(self) -> int:
+        """ ID of the base and the modifiers, which are compared by the 'equal' operator of agents """
+        return Symbols.id((self.base, self.modset))
+
+    def __getstate__(self) -> dict:
+        # the IDs of another process are not those of this one
+        return {name: getattr(self, name) for name in self.__slots__ if name != '_eid'}
+
+    def __setstate__(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._eid = -1
+
+    @classmethod
+    def intern(cls, entity: 'Entity') -> 'Entity':
+        """ if there is already an equal entity in Entity.entities, use the existing one """
+        entity._modset, entity._eid = frozenset(entity.modifier), -1
+        key = entity.key()
+        entities = getattr(cls.local, 'entities', cls.entities)
+        if (existing := entities.get(key)) is not None:
+            return existing
+        with cls.lock:
+            if (existing := entities.get(key)) is not None:
+                return existing
+            entities[key] = entity
+        return entity
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.entities = {}
+
+    @classmethod
+    @contextlib.contextmanager
+    def scope(cls) -> Iterator[None]:
+        """ entities interned in the scope are dropped when leaving it, such as the entities of one run """
+        entities = cls.entities
+        cls.entities = {}
+        try:
+            yield
+        finally:
+            cls.entities = entities
+
+    @classmethod
+    @contextlib.contextmanager
+    def thread_scope(cls) -> Iterator[Dict[tuple, 'Entity']]:
+        """ entities interned by the current thread in the scope are kept in the yielded dict only """
+        cls.local.entities = {}
+        try:
+            yield cls.local.entities
+        finally:
+            del cls.local.entities
 
     @classmethod
     def str2entity(cls, s: str):
         # *system*
         if s == '*system*':
-            for e in Entity.entities:
-                if e.base == '':
-                    return e
-            e = Entity('')
-            Entity.entities.append(e)
-            return e
+            return cls.intern(Entity(''))
         entity = Entity('')
         # 'ALL'
         if s[:3] == 'ALL':
@@ -160,16 +288,7 @@ class Entity:
             entity.entirety = cls.str2entity(s[index+4: -1])
         else:
             entity.base = s
-        # if there is already an entity in Entity.entities, use the existing one
-        flag = True
-        for e in Entity.entities:
-            if entity == e:
-                entity = e
-                flag = False
-                break
-        if flag:
-            Entity.entities.append(entity)
-        return entity
+        return cls.intern(entity)
 
 
 def tuples_to_str(t: Union[Req, Condition]) -> str:
@@ -180,6 +299,13 @@ def tuples_to_str(t: Union[Req, Condition]) -> str:
     return '(' + ') , ('.join(elements) + ')'
 
 
+def tuples_signature(t: Union[Req, Condition]) -> tuple:
+    entity_id = lambda e: e.eid if e is not None else -1
+    operation = (t.operation.pid, t.operation.Able, t.operation.Not)
+    return (entity_id(t.agent), operation, tuple([entity_id(e) for e in t.input]),
+            tuple([entity_id(e) for e in t.output]), Symbols.id_tuple(t.restriction))
+
+
 class RequirementError(Exception):
     def __init__(self, reason: str, sentence: str, location: str):
         self.reason = reason
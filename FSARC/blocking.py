@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides the blocking stage of conflict detecting.
+
+Most rules can only be satisfied by two tuples with equal agents and predicates.
+Class 'Gate' derives such necessary equalities of a rule from its syntax tree in rules.yml.
+Class 'Blocker' indexes the requirements by the keys of the gates,
+and gives the candidate requirements which may satisfy a rule with a given requirement.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from FSARC.Requirement import Req, Symbols
+
+WILD = None     # key component which matches any value, the agent 'ALL ...' is equal to any agent
+Slot = tuple    # ('x' or 'y', None for the requirement itself) or ('x' or 'y', 'event', index of the 'for') for its conditions
+
+
+class Gate:
+    """
+    necessary condition of a rule(x, y): some key of x equals some key of y.
+    A key is made of the IDs of the agent and the predicate of the tuples in the slots of x and y.
+    """
+    def __init__(self, slots: Dict[str, Slot], components: List[Tuple[str, str]], need_event: Set[str]):
+        """
+        :param slots: the tuples giving the keys of 'x' and of 'y'
+        :param components: (kind, side) of each key component, kind is 'agent' or 'predicate',
+                           side is the side whose agent is the first operand of 'equal', which can be a wildcard
+        :param need_event: sides whose event must not be empty
+        """
+        self.slots      : Dict[str, Slot]       = slots
+        self.components : List[Tuple[str, str]] = components
+        self.need_event : Set[str]              = need_event
+
+    def keys(self, req: Req, side: str) -> Set[tuple]:
+        if side in self.need_event and len(req.event) == 0:
+            return set()
+        field = self.slots[side][1]
+        tuples_list = [req] if field is None else getattr(req, field)
+        keys = set()
+        for t in tuples_list:
+            key = []
+            for kind, wild_side in self.components:
+                if kind == 'predicate':
+                    key.append(t.operation.pid)
+                elif side == wild_side and t.agent.is_all:
+                    key.append(WILD)
+                else:
+                    key.append(t.agent.agent_id())
+            keys.add(tuple(key))
+        return keys
+
+    @classmethod
+    def derive(cls, rules: dict, rule_name: str) -> Optional['Gate']:
+        """
+        derive the gate of a rule from the single rules that all its true results need,
+        None if there is no such single rule
+        """
+        atoms, need_event = cls.atoms(rules, rule_name)
+        # group the equalities by the slots they compare, and use the largest group
+        groups: Dict[Tuple[Slot, Slot], List[Tuple[str, str]]] = {}
+        for kind, slot1, slot2, _ in atoms:
+            if slot1[0] == slot2[0]:
+                continue
+            slot_x, slot_y = (slot1, slot2) if slot1[0] == 'x' else (slot2, slot1)
+            component = (kind, slot1[0])
+            group = groups.setdefault((slot_x, slot_y), [])
+            if component not in group:
+                group.append(component)
+        if len(groups) == 0:
+            return None
+        (slot_x, slot_y), components = max(groups.items(), key=lambda item: len(item[1]))
+        return cls({'x': slot_x, 'y': slot_y}, components, need_event)
+
+    @classmethod
+    def atoms(cls, rules: dict, rule_name: str) -> Tuple[List[Tuple[str, Slot, Slot, str]], Set[str]]:
+        """
+        single rules comparing agents or operations that all true results of a rule need
+        :return: (field, slot of operand 1, slot of operand 2, relation) of each single rule,
+                 and the sides whose event must not be empty
+        """
+        atoms, need_event = [], set()
+        cls.necessary(rules, rules[rule_name], ('x', None), ('y', None), atoms, need_event)
+        return atoms, need_event
+
+    @classmethod
+    def necessary(cls, rules: dict, rule, slot1: Slot, slot2: Slot,
+                  atoms: List[Tuple[str, Slot, Slot, str]], need_event: Set[str]) -> None:
+        """
+        collect the single rules needed by a rule applied to the tuples in slot1 and slot2
+        """
+        if type(rule) != dict:
+            index1, field1, relation, index2, field2 = tuple(rule.split(' '))
+            slots = {'1': slot1, '2': slot2}
+            a, b = slots[index1], slots[index2]
+            if field1 == field2 == 'agent' and relation == 'equal':
+                atoms.append(('agent', a, b, relation))
+            elif field1 == field2 == 'operation':
+                # all relations of operations need equal predicates
+                atoms.append(('predicate', a, b, relation))
+            elif field1 == field2 == 'event' and relation in ['equal', 'include']:
+                # the condition set operators need a pair of conditions
+                for slot in [a, b]:
+                    if slot[1] is None:
+                        need_event.add(slot[0])
+            return
+        label = list(rule.keys())[0]
+        content = rule[label]
+        if label == 'and':
+            for sub_rule in content:
+                cls.necessary(rules, sub_rule, slot1, slot2, atoms, need_event)
+        elif label == 'function':
+            cls.necessary(rules, rules[content], slot1, slot2, atoms, need_event)
+        elif label == 'for' and content['label'] == 'or' and slot1[1] is None and slot2[1] is None:
+            # some condition in the event of the 1st tuple satisfies the rule,
+            # the conditions of different 'for' are different slots
+            slot = (slot1[0], content['field'], len(atoms))
+            if str(content['index']) == '1':
+                cls.necessary(rules, content['condition'], slot, slot2, atoms, need_event)
+            else:
+                cls.necessary(rules, content['condition'], slot2, slot, atoms, need_event)
+        # 'or', 'not' and 'for all' need nothing in general
+
+
+class EntityGate(Gate):
+    """
+    gate of 'input output interlock': some output entity of x includes some input entity of y,
+    so it has the same base as the input entity or as the entirety of the input entity
+    """
+    def __init__(self):
+        super().__init__({'x': ('x', None), 'y': ('y', None)}, [], set())
+
+    def keys(self, req: Req, side: str) -> Set[tuple]:
+        if side == 'x':
+            return {(Symbols.id(e.base),) for e in req.output}
+        keys = {(Symbols.id(e.base),) for e in req.input}
+        keys.update([(Symbols.id(e.entirety.base),) for e in req.input if e.entirety is not None])
+        return keys
+
+
+class KeyIndex:
+    """ inverted index from keys to requirement indexes, keys may contain wildcards """
+    def __init__(self):
+        self.exact      : Dict[tuple, List[int]]    = {}
+        self.wild       : Dict[tuple, List[int]]    = {}
+        self.projections: Dict[Tuple[bool, ...], Dict[tuple, List[int]]] = {}
+
+    def add(self, key: tuple, index: int) -> None:
+        (self.wild if WILD in key else self.exact).setdefault(key, []).append(index)
+
+    def find(self, key: tuple) -> Iterable[int]:
+        pattern = tuple([c is WILD for c in key])
+        if any(pattern):
+            # all exact keys matching the other components
+            if pattern not in self.projections:
+                projection = self.projections[pattern] = {}
+                for k, indexes in self.exact.items():
+                    projection.setdefault(project(k, pattern), []).extend(indexes)
+            yield from self.projections[pattern].get(project(key, pattern), [])
+        else:
+            yield from self.exact.get(key, [])
+        for k, indexes in self.wild.items():
+            if all([c1 is WILD or c2 is WILD or c1 == c2 for c1, c2 in zip(k, key)]):
+                yield from indexes
+
+
+def project(key: tuple, pattern: Tuple[bool, ...]) -> tuple:
+    return tuple([c for c, wild in zip(key, pattern) if not wild])
+
+
+class Blocker:
+    def __init__(self, rules: dict, rule_names: List[str]):
+        """
+        :param rules: the rules in rules.yml
+        :param rule_names: the rules judged for requirement pairs
+        """
+        self.gates: Dict[str, Optional[Gate]] = {}
+        for rule_name in rule_names:
+            if rule_name == 'input output interlock':
+                self.gates[rule_name] = EntityGate()
+            else:
+                self.gates[rule_name] = Gate.derive(rules, rule_name)
+        self.keys   : Dict[str, Dict[str, List[Set[tuple]]]]    = {}
+        self.indexes: Dict[str, Dict[str, KeyIndex]]            = {}
+
+    def build(self, requirements: List[Req]) -> None:
+        for rule_name, gate in self.gates.items():
+            if gate is None:
+                continue
+            self.keys[rule_name], self.indexes[rule_name] = {}, {}
+            for side in ['x', 'y']:
+                keys = self.keys[rule_name][side] = [gate.keys(req, side) for req in requirements]
+                index = self.indexes[rule_name][side] = KeyIndex()
+                for i, req_keys in enumerate(keys):
+                    for key in req_keys:
+                        index.add(key, i)
+
+    def forward(self, rule_name: str, index: int) -> Optional[Set[int]]:
+        """ indexes j such that rule(requirements[index], requirements[j]) may be true, None for all """
+        return self.find(rule_name, index, 'x', 'y')
+
+    def backward(self, rule_name: str, index: int) -> Optional[Set[int]]:
+        """ indexes j such that rule(requirements[j], requirements[index]) may be true, None for all """
+        return self.find(rule_name, index, 'y', 'x')
+
+    def find(self, rule_name: str, index: int, side: str, other_side: str) -> Optional[Set[int]]:
+        if self.gates[rule_name] is None:
+            return None
+        result = set()
+        other_index = self.indexes[rule_name][other_side]
+        for key in self.keys[rule_name][side][index]:
+            result.update(other_index.find(key))
+        return result
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides a persistent cache of CoreNLP parsing results.
+
+Class 'ParseCache' stores the results in a SQLite file, keyed by the normalized text and the annotator config,
+which is the config of the cache or the properties of a request, such as those of batch requests.
+The least recently used results are evicted when the cache exceeds its size.
+Worker processes share the file: reads take no lock, writes are committed one by one,
+and a process waits for the lock held by another one up to a timeout.
+"""
+from typing import Dict, Iterator, Optional
+import contextlib, hashlib, json, sqlite3, threading
+
+from config import parse_cache_timeout
+
+TOUCHED_FLUSH = 1000    # access times kept before they are written by a read
+RECOUNT = 1000          # results inserted before the size is counted again, other processes also insert
+
+
+class ParseCache:
+    def __init__(self, path: str, max_size: int, config: dict, timeout: float = parse_cache_timeout):
+        """
+        :param path: path of the SQLite cache file
+        :param max_size: maximum number of cached results
+        :param config: annotator config of CoreNLP, results of different configs are cached separately
+        :param timeout: seconds to wait for the cache locked by another process
+        """
+        self.path       : str   = path
+        self.max_size   : int   = max_size
+        self.config     : str   = json.dumps(config, sort_keys=True)
+        self.timeout    : float = timeout
+        self.lock = threading.Lock()
+        # several processes share the file, each write is committed at once so the lock is held shortly
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self.connection.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        with self.transaction():
+            self.connection.execute('CREATE TABLE IF NOT EXISTS parse '
+                                    '(key TEXT PRIMARY KEY, result TEXT NOT NULL, used INTEGER NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS parse_used ON parse (used)')
+        self.size, clock = self.connection.execute('SELECT COUNT(*), MAX(used) FROM parse').fetchone()
+        self.clock      : int   = clock or 0     # logical time of the last access
+        # access times of the results read, written with the next write instead of by each read
+        self.touched    : Dict[str, int] = {}
+        self.inserted   : int   = 0     # results inserted since the size is counted
+
+    def key(self, text: str, config: dict = None) -> str:
+        """
+        :param config: annotator config of the parsing, the config of the cache if None
+        """
+        config = self.config if config is None else json.dumps(config, sort_keys=True)
+        normalized = ' '.join(text.split())
+        return hashlib.sha256(f'{config}\n{normalized}'.encode('utf-8')).hexdigest()
+
+    def get(self, text: str, config: dict = None) -> Optional[dict]:
+        key = self.key(text, config)
+        with self.lock:
+            row = self.connection.execute('SELECT result FROM parse WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.clock += 1
+            self.touched[key] = self.clock
+            if len(self.touched) >= TOUCHED_FLUSH:
+                with self.transaction():
+                    self.flush_touched()
+        return json.loads(row[0])
+
+    def put(self, text: str, result: dict, config: dict = None) -> None:
+        key = self.key(text, config)
+        value = json.dumps(result, separators=(',', ':'))
+        with self.lock, self.transaction():
+            self.flush_touched()
+            self.clock += 1
+            cursor = self.connection.execute('UPDATE parse SET result = ?, used = ? WHERE key = ?',
+                                             (value, self.clock, key))
+            if cursor.rowcount == 0:
+                self.connection.execute('INSERT INTO parse VALUES (?, ?, ?)', (key, value, self.clock))
+                self.size += 1
+                self.inserted += 1
+            if self.size > self.max_size or self.inserted >= RECOUNT:
+                # other processes may have inserted or evicted results
+                self.size = self.connection.execute('SELECT COUNT(*) FROM parse').fetchone()[0]
+                self.inserted = 0
+                if self.size > self.max_size:
+                    self.evict(self.size - self.max_size)
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """ a write transaction, which takes the lock of the file at its beginning and is committed at its end """
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def flush_touched(self) -> None:
+        if len(self.touched) > 0:
+            self.connection.executemany('UPDATE parse SET used = ? WHERE key = ? AND used < ?',
+                                        [(used, key, used) for key, used in self.touched.items()])
+            self.touched = {}
+
+    def evict(self, count: int) -> None:
+        self.connection.execute('DELETE FROM parse WHERE key IN '
+                                '(SELECT key FROM parse ORDER BY used LIMIT ?)', (count,))
+        self.size -= count
+
+    def close(self) -> None:
+        with self.lock:
+            with self.transaction():
+                self.flush_touched()
+            self.connection.close()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides a compiler which turns the rules in rules.yml into Python functions.
+
+Class 'RuleCompiler' generates one flat function of (x, y) for each rule,
+with short-circuiting 'and'/'or', and with the operator of each single rule resolved at compile time.
+The generated source of each rule can be inspected by method 'source'.
+
+The branches of 'and'/'or' are evaluated in one of the orders
+    authored:   the order in rules.yml
+    estimated:  the cheapest and most decisive branches first, by the estimated cost and selectivity of each branch
+    adaptive:   the estimated order, then the order by the cost and selectivity measured on the first judgements
+The operators have no side effects, so the results are the same in all orders.
+"""
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+ORDERS = ['authored', 'estimated', 'adaptive']
+# estimated cost of the operator of each type, and chance of each relation to be true
+COST = {'entity': 1.0, 'operation': 1.0, 'string set': 2.0, 'entity set': 4.0, 'condition set': 8.0}
+SELECTIVITY = {'equal': 0.1, 'include': 0.2, 'contradict': 0.1}
+FOR_LENGTH = 2      # estimated length of the lists iterated by 'for'
+
+
+class RuleCompiler:
+    def __init__(self, rules: dict, field_types: Dict[str, str], allowed_types: Dict[str, List[str]],
+                 operator_rules: Dict[str, Dict[str, Callable]], order: str = 'authored', sample: int = 0,
+                 adapted: Callable[[Dict[str, Callable]], None] = None):
+        """
+        :param rules: the rules in rules.yml
+        :param field_types: type of each field of the tuples
+        :param allowed_types: types allowed by each relation
+        :param operator_rules: operator function of each relation and type
+        :param order: order of the branches of 'and'/'or', one of ORDERS
+        :param sample: number of judgements measured before the rules are compiled again in the adaptive order
+        :param adapted: called with the functions of the rules compiled again in the adaptive order
+        """
+        if order not in ORDERS:
+            raise ValueError(f'unknown order {order} of rules, it should be one of {ORDERS}')
+        self.rules          : dict                  = rules
+        self.field_types    : Dict[str, str]        = field_types
+        self.allowed_types  : Dict[str, List[str]]  = allowed_types
+        self.order          : str                   = order
+        self.sample         : int                   = sample
+        self.adapted        : Optional[Callable[[Dict[str, Callable]], None]] = adapted
+        self.namespace      : dict                  = {}    # globals of the generated functions
+        self.sources        : Dict[str, str]        = {}
+        self.functions      : Dict[str, Callable]   = {}
+        self.variable_count : int                   = 0
+        # calls, true results and seconds of each branch, by its path in the rules, measured in the adaptive order
+        self.statistics     : Dict[str, List[float]] = {}
+        self.judged         : int                   = 0
+        self.measuring      : bool                  = order == 'adaptive' and sample > 0
+        for relation, type_rules in operator_rules.items():
+            for Type, func in type_rules.items():
+                self.namespace[self.operator_name(relation, Type)] = func
+        self.namespace['_probe'] = self.probe
+        self.namespace['_judge'] = self.judge
+
+    def compile_all(self) -> Dict[str, Callable]:
+        for rule_name in self.rules:
+            self.compile(rule_name)
+        return self.functions
+
+    def compile(self, rule_name: str) -> Callable:
+        if rule_name in self.functions:
+            return self.functions[rule_name]
+        self.variable_count = 0
+        func_name = 'rule_' + '_'.join(rule_name.split())
+        body = self.expression(self.rules[rule_name], "x", "y", rule_name)
+        if self.measuring:
+            body = f'_judge(lambda: {body})'
+        source = f'def {func_name}(x, y):\n    return {body}\n'
+        exec(compile(source, f'<rule {rule_name}>', 'exec'), self.namespace)
+        self.sources[rule_name] = source
+        self.functions[rule_name] = self.namespace[func_name]
+        return self.functions[rule_name]
+
+    def source(self, rule_name: str) -> str:
+        return self.sources[rule_name]
+
+    def expression(self, rule, x: str, y: str, path: str) -> str:
+        """
+        expression of a rule applied to the objects named x and y
+        :param path: path of the rule from the compiled rule, which identifies its statistics
+        """
+        if type(rule) != dict:
+            return self.single_rule(rule, x, y)
+        label = list(rule.keys())[0]
+        content = rule[label]
+        if label in ['or', 'and']:
+            branches = [(sub_rule, f'{path}/{i}') for i, sub_rule in enumerate(content)]
+            expressions = []
+            for sub_rule, sub_path in self.ordered(label, branches):
+                expression = self.expression(sub_rule, x, y, sub_path)
+                expressions.append(f'_probe({sub_path!r}, lambda: {expression})' if self.measuring else expression)
+            return '(' + f' {label} '.join(expressions) + ')'
+        elif label == 'not':
+            return f'(not {self.expression(content, x, y, path + "/not")})'
+        elif label == 'function':
+            # the called rule is inlined
+            return self.expression(self.rules[content], x, y, f'{path}/{content}')
+        elif label == 'for':
+            return self.for_rule(content, x, y, path + '/for')
+        else:
+            raise SyntaxError(f'unknown label {label} in rules')
+
+    def for_rule(self, content: dict, x: str, y: str, path: str) -> str:
+        label, index, field = content['label'], str(content['index']), content['field']
+        self.variable_count += 1
+        obj = f'o{self.variable_count}'
+        if index == '1':
+            condition = self.expression(content['condition'], obj, y, path)
+        elif index == '2':
+            condition = self.expression(content['condition'], y, obj, path)
+        else:
+            raise SyntaxError(f'unknown index {index} in rules')
+        if label == 'or':
+            return f'any({condition} for {obj} in {x}.{field})'
+        elif label == 'and':
+            return f'all({condition} for {obj} in {x}.{field})'
+        else:
+            raise SyntaxError(f'unknown label {label} of for in rules')
+
+    def single_rule(self, rule: str, x: str, y: str) -> str:
+        index1, field1, relation, index2, field2 = tuple(rule.split(' '))
+        objects = {'1': x, '2': y}
+        if index1 not in objects or index2 not in objects:
+            raise SyntaxError(f'unknown index in rule "{rule}"')
+        # the type checks are done once here, instead of every time the rule is judged
+        if field1 not in self.field_types or field2 not in self.field_types:
+            raise TypeError(f'unknown field in rule "{rule}"')
+        Type = self.field_types[field1]
+        if self.field_types[field2] != Type or Type not in self.allowed_types[relation]:
+            raise TypeError(f'{relation} is not allowed between {field1} and {field2}')
+        return f'{self.operator_name(relation, Type)}({objects[index1]}.{field1}, {objects[index2]}.{field2})'
+
+    def ordered(self, label: str, branches: List[Tuple[object, str]]) -> List[Tuple[object, str]]:
+        """
+        branches of 'and'/'or' in the order of evaluation, the order of rules.yml is kept for equal ranks
+        """
+        if self.order == 'authored':
+            return branches
+        measured = [self.measured(sub_path) for _, sub_path in branches]
+        if any([m is None for m in measured]):
+            measured = [self.estimate(sub_rule) for sub_rule, _ in branches]
+        # the expected cost of a branch is paid by each decision it makes,
+        # a false result decides 'and', a true result decides 'or'
+        decisive = [1 - p if label == 'and' else p for _, p in measured]
+        ranks = [cost / d if d > 0 else float('inf') for (cost, _), d in zip(measured, decisive)]
+        return [branch for _, _, branch in sorted(zip(ranks, range(len(branches)), branches))]
+
+    def measured(self, path: str) -> Optional[Tuple[float, float]]:
+        """ measured (seconds, chance to be true) of a branch, None if it is not measured """
+        calls, true, seconds = self.statistics.get(path, (0, 0, 0.0))
+        return (seconds / calls, true / calls) if calls > 0 else None
+
+    def estimate(self, rule) -> Tuple[float, float]:
+        """ estimated (cost, chance to be true) of a rule """
+        if type(rule) != dict:
+            _, field1, relation, _, _ = tuple(rule.split(' '))
+            return COST.get(self.field_types.get(field1), 1.0), SELECTIVITY.get(relation, 0.5)
+        label = list(rule.keys())[0]
+        content = rule[label]
+        if label in ['and', 'or']:
+            # the branches after a deciding branch are not evaluated
+            cost, reach = 0.0, 1.0
+            for sub_cost, p in [self.estimate(sub_rule) for sub_rule in content]:
+                cost += reach * sub_cost
+                reach *= p if label == 'and' else 1 - p
+            return cost, reach if label == 'and' else 1 - reach
+        elif label == 'not':
+            cost, p = self.estimate(content)
+            return cost, 1 - p
+        elif label == 'function':
+            return self.estimate(self.rules[content])
+        elif label == 'for':
+            cost, p = self.estimate(content['condition'])
+            p_all = p ** FOR_LENGTH
+            p_any = 1 - (1 - p) ** FOR_LENGTH
+            return cost * FOR_LENGTH, p_any if content['label'] == 'or' else p_all
+        raise SyntaxError(f'unknown label {label} in rules')
+
+    def probe(self, path: str, branch: Callable[[], bool]) -> bool:
+        """ evaluate a branch and measure it, in the adaptive order """
+        begin = time.perf_counter()
+        result = branch()
+        statistics = self.statistics.setdefault(path, [0, 0, 0.0])
+        statistics[0] += 1
+        statistics[1] += bool(result)
+        statistics[2] += time.perf_counter() - begin
+        return result
+
+    def judge(self, rule: Callable[[], bool]) -> bool:
+        """ judge a rule, the rules are compiled again in the adaptive order after the sample """
+        result = rule()
+        self.judged += 1
+        if self.measuring and self.judged >= self.sample:
+            self.adapt()
+        return result
+
+    def adapt(self) -> None:
+        self.measuring = False
+        self.sources, self.functions = {}, {}
+        self.compile_all()
+        if self.adapted is not None:
+            self.adapted(self.functions)
+
+    @staticmethod
+    def operator_name(relation: str, Type: str) -> str:
+        return f'{relation}_{"_".join(Type.split())}'
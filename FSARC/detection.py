@@ -3,29 +3,45 @@
 This file provides functions to detect conflicts among requirement tuples.
 
 Function 'detect' is the interface for detetcing conflicts among requirement tuples.
+Function 'detect_iter' is the same interface which yields the conflicts once they are found.
+Function 'counters' gives the counts of the rules and the operators judged, when FSARC.profiling is on.
 """
-import os, types, yaml
-from typing import Dict, Set, Tuple
-
-from config import rules_yaml
+import multiprocessing, os, pickle, types, yaml
+from typing import Collection, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from config import condition_memo_size, entity_inclusion, loop_mode, rule_order, rule_sample, rules_yaml, verdict_cache_size
+from FSARC import graph, vectorized
+from FSARC.blocking import Blocker
+from FSARC.compiler import RuleCompiler
+from FSARC.inclusion import EntityInclusion
+from FSARC.profiling import Profiler
 from FSARC.Requirement import *
+from FSARC.verdicts import Signatures, VerdictCache
 
 
-def list_eq(a: list, b: list) -> bool:
-    return len(set(a)) == len(set(b)) == len(set(a) | set(b))
+def list_eq(a: Collection, b: Collection) -> bool:
+    """ a and b have the same elements, frozensets such as Entity.modset are compared without copies """
+    return (a if type(a) is frozenset else set(a)) == (b if type(b) is frozenset else set(b))
 
-def list_gt(a: list, b:list) -> bool:
-    return len(set(a)) == len(set(a) | set(b))
+def list_gt(a: Collection, b: Collection) -> bool:
+    """ a has all elements of b """
+    return (a if type(a) is frozenset else set(a)).issuperset(b)
 
 
 class Operators:
     with open('..' + os.path.sep + rules_yaml, encoding='utf-8') as f:
-        file_content = yaml.load(f.read())
+        file_content = yaml.load(f.read(), Loader=yaml.SafeLoader)
     type: Dict[str, str]
     allowed_types: Dict[str, List[str]]
     equal_rules: Dict[str, types.LambdaType]
     include_rules: Dict[str, types.LambdaType]
     contradict_rules: Dict[str, types.LambdaType]
+    # results of rules between two conditions, by ids of the conditions, kept in one detection run
+    # and cleared when they reach condition_memo_size
+    include_memo: Dict[Tuple[int, int], bool] = {}
+    contradict_memo: Dict[Tuple[int, int], bool] = {}
+    # the include operator of the entities of the requirements in detection
+    inclusion: Optional[EntityInclusion] = None
 
     @classmethod
     def initial(cls):
@@ -40,6 +56,15 @@ class Operators:
             'include': cls.include_rules,
             'contradict': cls.contradict_rules,
         }
+        if Profiler.enabled:
+            for relation, type_rules in cls.operator_rules.items():
+                Profiler.wrap_all('operator', type_rules, relation + ' ')
+        cls.clear_memos()
+        cls.inclusion = None
+
+    @classmethod
+    def clear_memos(cls):
+        cls.include_memo, cls.contradict_memo = {}, {}
 
     @classmethod
     def O(cls, object1, field1, relation, object2, field2) -> bool:
@@ -51,41 +76,87 @@ class Operators:
         Type = cls.type[field1]
         if Type not in cls.allowed_types[relation]:
             raise TypeError()
-        return getattr(Operators, relation)[Type](tuple1, tuple2)
+        return cls.operator_rules[relation][Type](tuple1, tuple2)
 
     @classmethod
     def condition_set_include(cls, a: List[Condition], b: List[Condition]) -> bool:
-        rule = cls.file_content['rules']['condition include']
-        lambda_func = Rules.parse_rule(rule)
-        return any([lambda_func(c2, c1) for c1 in a for c2 in b])
+        return cls.any_condition_pair(Rules.rule_lambdas['condition include'], cls.include_memo,
+                                      [(c2, c1) for c1 in a for c2 in b])
 
     @classmethod
     def entity_set_include(cls, a: List[Entity], b: List[Entity]) -> bool:
+        if cls.inclusion is not None and (result := cls.inclusion.set_include(a, b)) is not None:
+            return result
         lambda_func = Operators.include_rules['entity']
         return all([any([lambda_func(entity_a, entity_b) for entity_a in a]) for entity_b in b])
 
+    @classmethod
+    def entity_any_include(cls, a: List[Entity], b: List[Entity]) -> bool:
+        """ some entity of a includes some entity of b """
+        if cls.inclusion is not None and (result := cls.inclusion.any_include(a, b)) is not None:
+            return result
+        lambda_func = Operators.include_rules['entity']
+        return any(lambda_func(entity_a, entity_b) for entity_a in a for entity_b in b)
+
     @classmethod
     def condition_contradict(cls, a: List[Condition]) -> bool:
-        rule = cls.file_content['rules']['condition contradict']
-        lambda_func = Rules.parse_rule(rule)
-        return any([lambda_func(c1, c2) for c1 in a for c2 in a])
+        return cls.any_condition_pair(Rules.rule_lambdas['condition contradict'], cls.contradict_memo,
+                                      [(c1, c2) for c1 in a for c2 in a])
+
+    @classmethod
+    def any_condition_pair(cls, rule: types.LambdaType, memo: Dict[Tuple[int, int], bool],
+                           pairs: List[Tuple[Condition, Condition]]) -> bool:
+        # the conditions are alive during the detection, so their ids identify them
+        for c1, c2 in pairs:
+            key = (id(c1), id(c2))
+            if (result := memo.get(key)) is None:
+                if len(memo) >= condition_memo_size:
+                    memo.clear()
+                result = memo[key] = rule(c1, c2)
+            if result:
+                return True
+        return False
 
 
 class Rules:
     rule_lambdas = {}
+    rules: dict = {}
+    compiler: RuleCompiler
+    order: str = rule_order
 
     @classmethod
     def judge(cls, req1: Req, req2: Req, rule_name: str) -> bool:
         return cls.rule_lambdas[rule_name](req1, req2)
 
     @classmethod
-    def initial(cls):
+    def initial(cls, compiled: bool = True, order: str = rule_order):
+        """
+        :param compiled: compile the rules into Python functions, otherwise build them from lambdas
+        :param order: order of the branches of 'and'/'or' in the compiled rules, see compiler.ORDERS
+        """
         with open('..' + os.path.sep + rules_yaml, encoding='utf-8') as f:
-            file_content = yaml.load(f.read())
+            file_content = yaml.load(f.read(), Loader=yaml.SafeLoader)
         rules: dict = file_content['rules']
-        for rule_name, rule in rules.items():
-            cls.rule_lambdas[rule_name] = cls.parse_rule(rule)
+        cls.rules = rules
+        cls.order = order if compiled else 'authored'
+        if compiled:
+            cls.compiler = RuleCompiler(rules, Operators.type, Operators.allowed_types, Operators.operator_rules,
+                                        order, rule_sample, cls.adapt)
+            cls.rule_lambdas.update(cls.compiler.compile_all())
+        else:
+            for rule_name, rule in rules.items():
+                cls.rule_lambdas[rule_name] = cls.parse_rule(rule)
         cls.input_output_interlock()
+        if Profiler.enabled:
+            Profiler.wrap_all('rule', cls.rule_lambdas)
+
+    @classmethod
+    def adapt(cls, functions: Dict[str, types.FunctionType]) -> None:
+        """ use the rules compiled again in the adaptive order """
+        functions = dict(functions)
+        if Profiler.enabled:
+            Profiler.wrap_all('rule', functions)
+        cls.rule_lambdas.update(functions)
 
     @classmethod
     def parse_rule(cls, rule) -> types.LambdaType:
@@ -122,7 +193,8 @@ class Rules:
     @classmethod
     def parse_for(cls, content) -> types.LambdaType:
         rule_in_for = cls.parse_rule(content['condition'])
-        label, index, filed = content['label'], content['index'], content['field']
+        # index is an int in rules.yml
+        label, index, filed = content['label'], str(content['index']), content['field']
         if (label, index) == ('or', '1'):
             return lambda x, y: any([rule_in_for(obj, y) for obj in getattr(x, filed)])
         elif (label, index) == ('or', '2'):
@@ -132,7 +204,7 @@ class Rules:
         elif (label, index) == ('and', '2'):
             return lambda x, y: all([rule_in_for(y, obj) for obj in getattr(x, filed)])
         else:
-            SyntaxError()
+            raise SyntaxError()
 
     @classmethod
     def parse_single_rule(cls, rule) -> types.LambdaType:
@@ -152,32 +224,76 @@ class Rules:
     def input_output_interlock(cls):
         event_inconsistency = lambda x, y: not cls.rule_lambdas['event inconsistency'](x, y) \
                                        and not cls.rule_lambdas['event inconsistency'](y, x)
-        entity_inclusion = lambda x, y: \
-            any([Operators.include_rules['entity'](e1, e2) for e1 in x.output for e2 in y.input])
-        cls.rule_lambdas['input output interlock'] = \
-            lambda x, y: event_inconsistency(x, y) and entity_inclusion(x, y)
+        entity_inclusion = lambda x, y: Operators.entity_any_include(x.output, y.input)
+        if cls.order == 'authored':
+            cls.rule_lambdas['input output interlock'] = \
+                lambda x, y: event_inconsistency(x, y) and entity_inclusion(x, y)
+        else:
+            # the entity inclusion is cheaper, and false more often
+            cls.rule_lambdas['input output interlock'] = \
+                lambda x, y: entity_inclusion(x, y) and event_inconsistency(x, y)
 
 
 class Detector:
     conflicts = []
     operation_event_graph, input_output_graph = {}, {}
+    one_way_rules = ['operation inconsistency', 'restriction inconsistency', 'event inconsistency']
+    two_way_rules = ['operation inclusion', 'event inclusion']
+    edge_rules = ['operation event interlock', 'input output interlock']
+    blocker: Optional[Blocker] = None     # Blocker, or vectorized.Screen which has the same methods
+    # signature number of each requirement by its id, and the rule results of the signatures
+    signatures: Dict[int, int] = {}
+    signature_numbers: Signatures = Signatures()
+    verdicts: VerdictCache = VerdictCache(verdict_cache_size)
 
     @classmethod
-    def detect(cls, requirements: List[Req]) -> List[Tuple[str, List[Req]]]:
+    def detect(cls, requirements: List[Req], blocking: bool = True, workers: int = 1,
+               cycles: int = 0, screening: bool = False) -> List[Tuple[str, List[Req]]]:
         """
         conflict detecting function
         :param requirements: all modelled requiremnts for conflict detetcting
+        :param blocking: only judge the rules on requirement pairs which share the keys of the rules
+        :param workers: number of worker processes sharing the requirement pairs
+        :param cycles: if positive, report at most this number of elementary cycles of each interlock graph,
+                       instead of the maximal loops
+        :param screening: screen the requirement pairs with NumPy instead of blocking, if NumPy is installed
         :return: conflict results, (conflict type, [req1, req2, ...])
         """
+        conflicts = list(cls.detect_iter(requirements, blocking, workers, cycles, screening))
+        cls.conflicts = conflicts
+        return conflicts
+
+    @classmethod
+    def detect_iter(cls, requirements: List[Req], blocking: bool = True, workers: int = 1,
+                    cycles: int = 0, screening: bool = False) -> Iterator[Tuple[str, List[Req]]]:
+        """
+        conflict detecting function which yields the conflicts when they are found,
+        conflicts between two requirements come in the order of 'detect', then the interlock conflicts
+        """
         print('conflict detecting ...')
-        cls.initial(len(requirements))
-        cls.traverse_req(requirements)
-        cls.detect_interlock(requirements)
+        cls.initial(len(requirements), blocking, screening)
+        if workers > 1:
+            yield from cls.traverse_parallel(requirements, blocking, workers, screening)
+        else:
+            cls.prepare(requirements)
+            yield from cls.traverse_req(requirements)
+        if cycles > 0:
+            yield from cls.cycle_conflicts(requirements, cycles)
+        else:
+            yield from cls.interlock_conflicts(requirements)
+        if Profiler.enabled:
+            print(Profiler.report())
         print('conflict detecting finished.')
-        return cls.conflicts
 
     @classmethod
-    def initial(cls, length):
+    def counters(cls) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """
+        calls, true results and seconds of each rule and operator, by (kind, name), if profiling is on
+        """
+        return Profiler.counters()
+
+    @classmethod
+    def initial(cls, length, blocking: bool = True, screening: bool = False):
         Operators.initial()
         Rules.initial()
         cls.conflicts = []
@@ -185,76 +301,200 @@ class Detector:
         for index in range(length):
             cls.operation_event_graph[index] = []
             cls.input_output_graph[index] = []
+        rule_names = cls.one_way_rules + cls.two_way_rules + cls.edge_rules
+        if screening and vectorized.np is None:
+            print('NumPy is not installed, requirement pairs are blocked instead of screened.')
+            screening, blocking = False, True
+        if screening:
+            cls.blocker = vectorized.Screen(Rules.rules, rule_names)
+        else:
+            cls.blocker = Blocker(Rules.rules, rule_names) if blocking else None
+        cls.signatures, cls.signature_numbers = {}, Signatures()
+        cls.verdicts = VerdictCache(verdict_cache_size)
+
+    @classmethod
+    def prepare(cls, requirements: List[Req]) -> None:
+        """ index the requirements for the blocking, the entity inclusion if it is enabled and the verdict cache """
+        Operators.inclusion = EntityInclusion(requirements) if entity_inclusion else None
+        if cls.blocker is not None:
+            cls.blocker.build(requirements)
+        if verdict_cache_size > 0:
+            cls.signatures = cls.signature_numbers.index(requirements)
+        else:
+            cls.signatures = {id(r): -1 for r in requirements}
+
+    @classmethod
+    def judge(cls, req1: Req, req2: Req, rule: str) -> bool:
+        """
+        Rules.judge, the results of requirements sharing their signatures with others are cached
+        """
+        signature1, signature2 = cls.signatures[id(req1)], cls.signatures[id(req2)]
+        if signature1 < 0 and signature2 < 0:
+            return Rules.judge(req1, req2, rule)
+        key = (signature1, signature2, rule)
+        if (verdict := cls.verdicts.get(key)) is None:
+            verdict = cls.verdicts.put(key, bool(Rules.judge(req1, req2, rule)))
+        return verdict
+
+    @classmethod
+    def candidates(cls, index1: int, length: int, begin: int = 0) \
+            -> Tuple[List[int], Dict[str, Optional[Set[int]]], Dict[str, Optional[Set[int]]]]:
+        """
+        requirements after index1 and from begin which may satisfy some rule with it
+        :return: indexes of the candidates, candidates of each rule as the 1st and as the 2nd requirement
+        """
+        first = max(index1 + 1, begin)
+        if cls.blocker is None:
+            return list(range(first, length)), {}, {}
+        forward, backward = {}, {}
+        for rule in cls.one_way_rules + cls.two_way_rules + cls.edge_rules:
+            forward[rule] = cls.blocker.forward(rule, index1)
+            if rule not in cls.one_way_rules:
+                backward[rule] = cls.blocker.backward(rule, index1)
+        if any([c is None for c in list(forward.values()) + list(backward.values())]):
+            return list(range(first, length)), forward, backward
+        indexes = set().union(*forward.values(), *backward.values())
+        return sorted([i for i in indexes if i >= first]), forward, backward
+
+    @classmethod
+    def traverse_req(cls, requirements) -> Iterator[Tuple[str, List[Req]]]:
+        for index1 in range(len(requirements)):
+            yield from cls.merge(requirements, index1, cls.traverse_row(requirements, index1))
+
+    @classmethod
+    def traverse_row(cls, requirements: List[Req], index1: int, begin: int = 0) \
+            -> Tuple[List[Tuple[str, int, int]], List[Tuple[int, int, int]]]:
+        """
+        judge the rules on the pairs of requirements[index1] and the requirements after it and from begin
+        :return: conflicts (rule, index of the 1st requirement, index of the 2nd requirement),
+                 edges (graph, begin, end) in the order they are found, graph is the index in edge_rules
+        """
+        conflicts, edges = [], []
+        req1 = requirements[index1]
+        candidates, forward, backward = cls.candidates(index1, len(requirements), begin)
+        # a rule is judged on a pair only if the pair passes the blocking of the rule
+        may_x = lambda rule, i: forward.get(rule) is None or i in forward[rule]
+        may_y = lambda rule, i: backward.get(rule) is None or i in backward[rule]
+        for index2 in candidates:
+            req2 = requirements[index2]
+            if req1.groupid == req2.groupid != 0:
+                continue
+            for rule in cls.one_way_rules:
+                if may_x(rule, index2) and cls.judge(req1, req2, rule):
+                    conflicts.append((rule, index1, index2))
+            for rule in cls.two_way_rules:
+                if may_x(rule, index2) and cls.judge(req1, req2, rule):
+                    conflicts.append((rule, index1, index2))
+                elif may_y(rule, index2) and cls.judge(req2, req1, rule):
+                    conflicts.append((rule, index2, index1))
+            for graph, rule in enumerate(cls.edge_rules):
+                if may_x(rule, index2) and cls.judge(req1, req2, rule):
+                    edges.append((graph, index1, index2))
+                if may_y(rule, index2) and cls.judge(req2, req1, rule):
+                    edges.append((graph, index2, index1))
+        return conflicts, edges
 
     @classmethod
-    def traverse_req(cls, requirements):
-        for index1, req1 in enumerate(requirements):
-            for index2 in range(index1 + 1, len(requirements)):
-                req2 = requirements[index2]
-                if req1.groupid == req2.groupid != 0:
-                    continue
-                for rule in ['operation inconsistency', 'restriction inconsistency', 'event inconsistency']:
-                    if Rules.judge(req1, req2, rule):
-                        cls.conflicts.append((rule, [req1, req2]))
-                for rule in ['operation inclusion', 'event inclusion']:
-                    if Rules.judge(req1, req2, rule):
-                        cls.conflicts.append((rule, [req1, req2]))
-                    elif Rules.judge(req2, req1, rule):
-                        cls.conflicts.append((rule, [req2, req1]))
-                for r_begin, r_end, begin, end in [(req1, req2, index1, index2),
-                                                   (req2, req1, index2, index1)]:
-                    if Rules.judge(r_begin, r_end, 'operation event interlock'):
-                        cls.operation_event_graph[begin].append(end)
-                for r_begin, r_end, begin, end in [(req1, req2, index1, index2),
-                                                   (req2, req1, index2, index1)]:
-                    if Rules.judge(r_begin, r_end, 'input output interlock'):
-                        cls.input_output_graph[begin].append(end)
-
-    @classmethod
-    def detect_interlock(cls, requirements):
-        operation_event_loops = cls.find_loop(cls.operation_event_graph)
-        input_output_loops = cls.find_loop(cls.input_output_graph)
+    def merge(cls, requirements: List[Req], index1: int,
+              row: Tuple[List[Tuple[str, int, int]], List[Tuple[int, int, int]]]) -> Iterator[Tuple[str, List[Req]]]:
+        """ add the edges of a row to the graphs, and yield its conflicts """
+        conflicts, edges = row
+        graphs = [cls.operation_event_graph, cls.input_output_graph]
+        for graph, begin, end in edges:
+            graphs[graph][begin].append(end)
+        for rule, i, j in conflicts:
+            yield rule, [requirements[i], requirements[j]]
+
+    @classmethod
+    def traverse_block(cls, requirements: List[Req], rows: int, begin: int,
+                       positions: List[int]) -> Iterator[Tuple[str, List[Req]]]:
+        """
+        judge the rules on the pairs of requirements[index1] for index1 < rows and the requirements after it and
+        from begin, for the detection of requirements loaded part by part
+        :param positions: index of each requirement in all requirements, which is its vertex in the graphs
+        """
+        # the memos are by the ids of conditions, which are reused by the conditions of another part
+        Operators.clear_memos()
+        cls.prepare(requirements)
+        graphs = [cls.operation_event_graph, cls.input_output_graph]
+        for index1 in range(rows):
+            conflicts, edges = cls.traverse_row(requirements, index1, begin)
+            for graph, i, j in edges:
+                graphs[graph][positions[i]].append(positions[j])
+            for rule, i, j in conflicts:
+                yield rule, [requirements[i], requirements[j]]
+
+    @classmethod
+    def traverse_parallel(cls, requirements: List[Req], blocking: bool, workers: int,
+                          screening: bool = False) -> Iterator[Tuple[str, List[Req]]]:
+        """
+        share the rows of the pair space among worker processes, the rows are merged in order,
+        so the conflicts and the graphs are the same as traverse_req
+        """
+        # the requirements are pickled once and given to each worker when it starts
+        snapshot = pickle.dumps(requirements, pickle.HIGHEST_PROTOCOL)
+        # later rows are shorter, small chunks keep the workers busy till the end
+        size = max(1, len(requirements) // (workers * 16))
+        chunks = [range(i, min(i + size, len(requirements))) for i in range(0, len(requirements), size)]
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(snapshot, blocking, screening)) as pool:
+            for chunk, rows in zip(chunks, pool.imap(traverse_rows, chunks)):
+                for index1, row in zip(chunk, rows):
+                    yield from cls.merge(requirements, index1, row)
+
+    @classmethod
+    def detect_interlock(cls, requirements, loops_list: List[List[Set[int]]] = None):
+        """
+        :param loops_list: loops of operation_event_graph and input_output_graph, found from the graphs if not given
+        """
+        cls.conflicts.extend(cls.interlock_conflicts(requirements, loops_list))
+
+    @classmethod
+    def interlock_conflicts(cls, requirements, loops_list: List[List[Set[int]]] = None) \
+            -> Iterator[Tuple[str, List[Req]]]:
+        if loops_list is None:
+            loops_list = [cls.find_loop(cls.operation_event_graph), cls.find_loop(cls.input_output_graph)]
+        operation_event_loops, input_output_loops = loops_list
         for loops, name in [(operation_event_loops, 'operation event interlock'),
                             (input_output_loops, 'input output interlock')]:
             for loop in loops:
                 if len(loop) > 1:
                     loop_list = list(loop)
                     list.sort(loop_list)
-                    cls.conflicts.append((name, [requirements[i] for i in loop_list]))
+                    yield name, [requirements[i] for i in loop_list]
+
+    @classmethod
+    def cycle_conflicts(cls, requirements, limit: int) -> Iterator[Tuple[str, List[Req]]]:
+        for chain, name in [(cls.operation_event_graph, 'operation event interlock'),
+                            (cls.input_output_graph, 'input output interlock')]:
+            for cycle in cls.find_cycles(chain, limit):
+                if len(cycle) > 1:
+                    yield name, [requirements[i] for i in cycle]
 
     @classmethod
     def find_loop(cls, chain: Dict[int, List[int]]) -> List[Set[int]]:
-        n = len(chain.keys())
-        visited = [False] * n
-        trace = []
-        result = []
-
-        def findCycle(v):
-            if visited[v]:
-                if v in trace:
-                    j = trace.index(v)
-                    s = set(trace[j:])
-                    flag = True
-                    for r in result:
-                        if len(r & s) == len(s):
-                            flag = False
-                            break
-                    if flag:
-                        for r in result:
-                            if len(r & s) == len(r):
-                                result.remove(r)
-                        result.append(s)
-                    return
-                return
-            visited[v] = True
-            trace.append(v)
-            for i in chain[v]:
-                findCycle(i)
-            if len(trace) > 0:
-                trace.pop()
-
-        for now in range(n):
-            visited = [False] * n
-            trace = []
-            findCycle(now)
-        return result
+        """
+        strongly connected components of the graph with a cycle,
+        or the loops of the graph traced from each vertex if loop_mode is 'traced'
+        """
+        if loop_mode == 'traced':
+            return graph.traced_loops(chain)
+        return graph.loops(chain)
+
+    @classmethod
+    def find_cycles(cls, chain: Dict[int, List[int]], limit: int) -> List[List[int]]:
+        """
+        elementary cycles of the graph, at most limit cycles, each in the order of the edges from its least vertex
+        """
+        return list(graph.elementary_cycles(chain, limit))
+
+
+worker_requirements: List[Req] = []
+
+def init_worker(snapshot: bytes, blocking: bool, screening: bool) -> None:
+    global worker_requirements
+    worker_requirements = pickle.loads(snapshot)
+    Detector.initial(len(worker_requirements), blocking, screening)
+    Detector.prepare(worker_requirements)
+
+def traverse_rows(indexes: Iterable[int]) -> List[Tuple[List[Tuple[str, int, int]], List[Tuple[int, int, int]]]]:
+    return [Detector.traverse_row(worker_requirements, index1) for index1 in indexes]
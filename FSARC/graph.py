@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides functions to find loops in the interlock graphs of requirements.
+
+Function 'strongly_connected_components' finds the strongly connected components of a graph by Tarjan's algorithm.
+Function 'loops' gives the maximal loops of a graph, which are its strongly connected components with a cycle,
+FSARC reports them by default.
+Function 'traced_loops' gives the loops found by tracing paths from each vertex, which FSARC reported before.
+Function 'elementary_cycles' enumerates the elementary cycles of a graph by Johnson's algorithm, up to a limit.
+All of them are iterative, so long chains of requirements do not reach the recursion limit.
+"""
+import heapq
+from typing import Dict, Iterator, List, Optional, Set
+
+Graph = Dict[int, List[int]]    # successors of each vertex
+
+
+def strongly_connected_components(graph: Graph) -> List[List[int]]:
+    """
+    :param graph: successors of each vertex, every successor is also a key of the graph
+    :return: vertices of each component, components are in reverse topological order
+    """
+    index: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack: Set[int] = set()
+    result = []
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work: List[tuple] = [(root, iter(graph[root]))]
+        while work:
+            v, successors = work[-1]
+            for w in successors:
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(graph[w])))
+                    break
+                elif w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                # all successors of v are visited
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.remove(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    result.append(component)
+    return result
+
+
+def loops(graph: Graph) -> List[Set[int]]:
+    """
+    maximal loops of a graph, a vertex is in a loop if it can reach itself,
+    two vertices are in the same loop if they can reach each other
+    :return: vertices of each loop, ordered by their least vertices
+    """
+    result = [set(component) for component in strongly_connected_components(graph)
+              if len(component) > 1 or component[0] in graph[component[0]]]
+    result.sort(key=min)
+    return result
+
+
+def traced_loops(graph: Graph) -> List[Set[int]]:
+    """
+    loops found by a depth first search from each vertex, every back edge closes a loop of the vertices in the path,
+    a loop is kept unless it is in a loop found before, and it replaces the loops found before in it
+    a loop is in one strongly connected component, once a kept loop is the whole component,
+    the loops found in it later are not kept, so the vertices reaching only such components are not searched
+    :return: vertices of each loop, in the order they are found
+    """
+    components = strongly_connected_components(graph)
+    component_of = {v: c for c, component in enumerate(components) for v in component}
+    # components reaching each component, and the count of reasons each component is not settled:
+    # it has a cycle but is not a kept loop, or one of the components it reaches is not settled
+    reached_by: List[Set[int]] = [set() for _ in components]
+    unsettled = [0] * len(components)
+    for c, component in enumerate(components):
+        if len(component) > 1 or component[0] in graph[component[0]]:
+            unsettled[c] += 1
+        for d in set(component_of[w] for v in component for w in graph[v]) - {c}:
+            reached_by[d].add(c)
+            unsettled[c] += 1
+    settled: Set[int] = set()
+
+    def settle(c: int) -> None:
+        stack = [c]
+        while stack:
+            c = stack.pop()
+            settled.add(c)
+            for d in reached_by[c]:
+                unsettled[d] -= 1
+                if unsettled[d] == 0:
+                    stack.append(d)
+
+    for c in range(len(components)):
+        if unsettled[c] == 0 and c not in settled:
+            settle(c)
+
+    kept = KeptLoops()
+    member = kept.member
+    for root in graph:
+        if component_of[root] in settled:
+            continue
+        visited = {root}
+        position = {root: 0}    # position of each vertex in the path
+        path = [root]
+        # the least position from which the vertices of the path up to each position are all in a kept loop,
+        # and the bits of those loops, the position after it and all bits if there is no such loop
+        low, common = [], []
+        push_bits(path, 0, member, low, common)
+        work = [iter(graph[root])]
+        while work:
+            for w in work[-1]:
+                if component_of[w] in settled:
+                    continue
+                if w not in visited:
+                    visited.add(w)
+                    position[w] = len(path)
+                    path.append(w)
+                    push_bits(path, len(path) - 1, member, low, common)
+                    work.append(iter(graph[w]))
+                    break
+                # the loop is kept unless its vertices are all in a kept loop
+                if w in position and position[w] < low[-1]:
+                    loop = set(path[position[w]:])
+                    kept.add(loop)
+                    # only the bits of the vertices in the loop are changed, the removed loops are in it
+                    refresh_bits(path, position[w], member, low, common)
+                    if len(loop) == len(components[component_of[w]]):
+                        unsettled[component_of[w]] -= 1
+                        if unsettled[component_of[w]] == 0:
+                            settle(component_of[w])
+            else:
+                work.pop()
+                del position[path.pop()]
+                low.pop()
+                common.pop()
+    return kept.loops
+
+
+def push_bits(path: List[int], top: int, member: Dict[int, int], low: List[int], common: List[int]) -> None:
+    """ append low and common of the vertex at top of path, those of the vertices before it are computed """
+    bits = member.get(path[top], 0)
+    if len(low) > 0 and common[-1] & bits != 0:
+        low.append(low[-1])
+        common.append(common[-1] & bits)
+        return
+    # the loops of the former vertices do not all contain the last one, the vertices from a later position do
+    begin = top if bits != 0 else top + 1
+    while begin > (low[-1] if len(low) > 0 else 0) and bits & member.get(path[begin - 1], 0) != 0:
+        begin -= 1
+        bits &= member.get(path[begin], 0)
+    low.append(begin)
+    common.append(bits if bits != 0 else -1)
+
+
+def refresh_bits(path: List[int], begin: int, member: Dict[int, int], low: List[int], common: List[int]) -> None:
+    """ compute low and common again from begin, the vertices of path from begin are all in the last kept loop """
+    del low[begin:], common[begin:]
+    start = low[-1] if begin > 0 else 0
+    # bits of the loops containing the vertices from each position to begin, the lows are found from them in order
+    suffix = [-1] * (begin - start + 1)
+    for i in range(begin - 1, start - 1, -1):
+        suffix[i - start] = suffix[i - start + 1] & member.get(path[i], 0)
+    bits, lowest = -1, start
+    for top in range(begin, len(path)):
+        bits &= member.get(path[top], 0)
+        while suffix[lowest - start] & bits == 0:
+            lowest += 1
+        low.append(lowest)
+        common.append(suffix[lowest - start] & bits)
+
+
+class KeptLoops:
+    def __init__(self):
+        self.loops  : List[Set[int]]        = []    # kept loops in the order they are found
+        self.ids    : List[int]             = []    # id of each kept loop
+        self.free   : List[int]             = []    # ids not used by the kept loops
+        self.member : Dict[int, int]        = {}    # bits of the ids of the kept loops containing each vertex
+
+    def add(self, loop: Set[int]) -> None:
+        """ keep a loop which is in no kept loop, the kept loops in it are removed """
+        # the kept loops in the loop are those without a vertex out of it
+        outside = 0
+        for v, bits in self.member.items():
+            if v not in loop:
+                outside |= bits
+        subsets, inside = [], 0
+        for v in loop:
+            inside |= self.member.get(v, 0)
+        inside &= ~outside
+        while inside != 0:
+            bit = inside & -inside
+            inside ^= bit
+            subsets.append(self.ids.index(bit.bit_length() - 1))
+        removed = []
+        for i in sorted(subsets):
+            # the loop after a removed one is skipped, as FSARC always did
+            if len(removed) == 0 or removed[-1] != i - 1:
+                removed.append(i)
+        for i in reversed(removed):
+            for v in self.loops[i]:
+                self.member[v] &= ~(1 << self.ids[i])
+            heapq.heappush(self.free, self.ids[i])
+            del self.loops[i], self.ids[i]
+        new_id = heapq.heappop(self.free) if len(self.free) > 0 else len(self.ids)
+        for v in loop:
+            self.member[v] = self.member.get(v, 0) | 1 << new_id
+        self.loops.append(loop)
+        self.ids.append(new_id)
+
+
+def elementary_cycles(graph: Graph, limit: Optional[int] = None) -> Iterator[List[int]]:
+    """
+    elementary cycles of a graph, each cycle starts from its least vertex,
+    the cycles are generated in the order of their least vertices
+    :param limit: the most number of cycles generated, no limit if None, cycles may grow exponentially in dense graphs
+    """
+    count = 0
+    # components with a cycle, by their least vertices
+    heap = [(min(c), c) for c in loops(graph)]
+    heapq.heapify(heap)
+    while heap:
+        start, component = heapq.heappop(heap)
+        subgraph = induced(graph, component)
+        for cycle in circuits(subgraph, start):
+            yield cycle
+            count += 1
+            if limit is not None and count >= limit:
+                return
+        # the other cycles are in the components without start
+        component.remove(start)
+        for c in loops(induced(subgraph, component)):
+            heapq.heappush(heap, (min(c), c))
+
+
+def induced(graph: Graph, vertices: Set[int]) -> Graph:
+    return {v: [w for w in graph[v] if w in vertices] for v in vertices}
+
+
+def circuits(graph: Graph, start: int) -> Iterator[List[int]]:
+    """ elementary cycles through start, graph is strongly connected or the cycles are not through all of it """
+    blocked: Set[int] = {start}
+    blocked_by: Dict[int, Set[int]] = {v: set() for v in graph}
+    path = [start]
+    closed = [False]    # whether a cycle is found from each vertex in the path
+    work: List[tuple] = [(start, iter(graph[start]))]
+    while work:
+        v, successors = work[-1]
+        for w in successors:
+            if w == start:
+                yield path[:]
+                closed[-1] = True
+            elif w not in blocked:
+                path.append(w)
+                closed.append(False)
+                blocked.add(w)
+                work.append((w, iter(graph[w])))
+                break
+        else:
+            work.pop()
+            path.pop()
+            found = closed.pop()
+            if found:
+                unblock(v, blocked, blocked_by)
+                if closed:
+                    closed[-1] = True
+            else:
+                for w in graph[v]:
+                    blocked_by[w].add(v)
+
+
+def unblock(v: int, blocked: Set[int], blocked_by: Dict[int, Set[int]]) -> None:
+    stack = [v]
+    while stack:
+        u = stack.pop()
+        if u in blocked:
+            blocked.remove(u)
+            stack.extend(blocked_by[u])
+            blocked_by[u].clear()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides the include operator of entities, precomputed as sets of numbers.
+
+The include operator of entities in rules.yml is
+    (x.base == y.base and list_gt(y.modset, x.modset)) or (y.entirety == x)
+Class 'EntityInclusion' judges it once on all the inputs and outputs of some requirements.
+Equal entities have the same key, each key gets a number of the table, and each key has the numbers of the keys
+including it, which are few: those of the same base and fewer modifiers, and that of its entirety.
+The include of entity sets and the entity inclusion of 'input output interlock' are then set operations.
+It is built for each detection run unless 'entity_inclusion' of config.py is unset.
+"""
+from typing import Dict, FrozenSet, List, Optional, Set
+
+from FSARC.Requirement import Entity, Req
+
+
+class EntityInclusion:
+    def __init__(self, requirements: List[Req]):
+        """
+        :param requirements: requirements whose inputs and outputs, and those of their conditions, are indexed
+        """
+        # the entities are kept, so their ids are not reused by other entities
+        self.entities   : List[Entity]              = []
+        self.numbers    : Dict[int, int]            = {}    # number of the key of each entity, by its id
+        self.keys       : Dict[int, int]            = {}    # number of each key, by its ID
+        self.includers  : List[FrozenSet[int]]      = []    # numbers of the keys including each key
+        for r in requirements:
+            for t in [r] + r.event:
+                for e in t.input + t.output:
+                    if id(e) not in self.numbers:
+                        self.numbers[id(e)] = self.keys.setdefault(e.eid, len(self.keys))
+                        self.entities.append(e)
+        self.build()
+
+    def build(self) -> None:
+        # entities of the same base and modifiers include the same ones
+        representatives: Dict[int, Entity] = {}
+        by_base: Dict[str, Dict[frozenset, Set[int]]] = {}
+        for e in self.entities:
+            number = self.numbers[id(e)]
+            if number not in representatives:
+                representatives[number] = e
+                by_base.setdefault(e.base, {}).setdefault(e.modset, set()).add(number)
+        included: Dict[tuple, Set[int]] = {}
+        for number in range(len(self.keys)):
+            e = representatives[number]
+            if (numbers := included.get((e.base, e.modset))) is None:
+                numbers = set()
+                for other, other_numbers in by_base[e.base].items():
+                    if other <= e.modset:
+                        numbers |= other_numbers
+                included[(e.base, e.modset)] = numbers
+            if e.entirety is not None and (entirety := self.keys.get(e.entirety.eid)) is not None:
+                numbers = numbers | {entirety}
+            self.includers.append(frozenset(numbers))
+
+    def mask(self, entities: List[Entity]) -> Optional[Set[int]]:
+        """ numbers of the entities, None if some entity is not indexed """
+        numbers = set()
+        for e in entities:
+            if (number := self.numbers.get(id(e))) is None:
+                return None
+            numbers.add(number)
+        return numbers
+
+    def set_include(self, a: List[Entity], b: List[Entity]) -> Optional[bool]:
+        """
+        each entity of b is included by some entity of a, None if some entity is not indexed
+        """
+        if (mask := self.mask(a)) is None:
+            return None
+        for e in b:
+            if (number := self.numbers.get(id(e))) is None:
+                return None
+            if self.includers[number].isdisjoint(mask):
+                return False
+        return True
+
+    def any_include(self, a: List[Entity], b: List[Entity]) -> Optional[bool]:
+        """
+        some entity of a includes some entity of b, None if some entity is not indexed
+        """
+        if (mask := self.mask(a)) is None:
+            return None
+        for e in b:
+            if (number := self.numbers.get(id(e))) is None:
+                return None
+            if not self.includers[number].isdisjoint(mask):
+                return True
+        return False
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides incremental conflict detecting, for requirement files changed by small edits.
+
+Class 'DetectionState' keeps the modelled tuples of each requirement line and the rules satisfied by each pair of them.
+Method 'update' models only the added lines and judges only the pairs with a new requirement,
+the conflicts and the interlock graphs are then rebuilt from the kept results, the same as a full detection.
+"""
+import glob, hashlib, os, pickle
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+from config import dict_yaml, rules_yaml
+from FSARC import modelling
+from FSARC.detection import Detector
+from FSARC.Requirement import Entity, Req
+
+LineKey = Tuple[str, int]       # (requirement line, occurrence of the same line before it)
+ReqKey = Tuple[str, int, int]   # (requirement line, occurrence, index of the tuple in the modelled line)
+EntityTuple = Tuple[Entity, List[Entity], List[Entity]]     # (agent, inputs, outputs)
+
+
+class ModelledLine:
+    def __init__(self, reqs: List[Req], req_used: int, group_used: int):
+        """
+        :param reqs: modelled tuples of the line, numbered from 1
+        :param req_used: count of requirement numbers used by the line
+        :param group_used: count of group numbers used by the line
+        """
+        self.reqs       : List[Req] = reqs
+        self.groups     : List[int] = [r.groupid for r in reqs]
+        self.req_used   : int       = req_used
+        self.group_used : int       = group_used
+        # agent, inputs and outputs of the conditions and the requirement of each tuple, as modelled from the line,
+        # the tuples are given the interned entities of the other lines, which depend on the order of the lines
+        self.entities   : List[List[EntityTuple]] = [[(t.agent, list(t.input), list(t.output)) for t in r.event + [r]]
+                                                     for r in reqs]
+
+
+class DetectionState:
+    version = 5
+
+    def __init__(self):
+        self.digest         : str                                   = state_digest()
+        self.lines          : Dict[LineKey, ModelledLine]           = {}
+        # rules(x, y) which are true, for each ordered pair of requirements judged, pairs without true rules are absent
+        self.verdicts       : Dict[Tuple[ReqKey, ReqKey], FrozenSet[str]] = {}
+        # the interlock graphs of the last detection and their loops
+        self.graphs         : List[tuple]                           = []
+        self.loops          : List[List[Set[int]]]                  = []
+
+    @classmethod
+    def load(cls, path: str) -> 'DetectionState':
+        """
+        load the state saved in path, a new state if there is no such file,
+        or if it is saved by another version, or with other rules, dictionary or code
+        """
+        if os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    state = pickle.load(f)
+            except (pickle.UnpicklingError, AttributeError, EOFError, ImportError, TypeError):
+                # the classes of the pickled tuples are changed
+                state = None
+            if getattr(state, 'version', None) == cls.version and state.digest == state_digest():
+                return state
+        return cls()
+
+    def save(self, path: str) -> None:
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def update(self, lines: List[str], blocking: bool = True) -> List[Tuple[str, List[Req]]]:
+        """
+        detect conflicts in the new version of the requirements
+        :param lines: all requirement lines, as read from the requirement file
+        :param blocking: only judge the rules on requirement pairs which share the keys of the rules
+        :return: conflict results, the same as Detector.detect on all modelled requirements
+        """
+        line_keys = self.line_keys(lines)
+        removed = set(self.lines.keys()) - set(line_keys)
+        for key in removed:
+            del self.lines[key]
+        if len(removed) > 0:
+            self.verdicts = {pair: rules for pair, rules in self.verdicts.items()
+                             if pair[0][:2] not in removed and pair[1][:2] not in removed}
+        added = [(key, line) for key, line in zip(line_keys, lines) if key not in self.lines]
+        print(f'incremental detecting: {len(added)} added, {len(removed)} removed, '
+              f'{len(line_keys) - len(added)} kept')
+        texts = [line for _, line in added]
+        # the entities of a line are kept without those of the other lines, they are shared again in intern_entities
+        for (key, _), (reqs, req_used, group_used) in zip(added, modelling.model_numbered_batch(texts, isolated=True)):
+            self.lines[key] = ModelledLine(reqs, req_used, group_used)
+
+        requirements, req_keys = self.number(line_keys)
+        intern_entities([self.lines[key] for key in line_keys])
+        Detector.initial(len(requirements), blocking)
+        Detector.prepare(requirements)
+        new_lines = set([key for key, _ in added])
+        new_indexes = [i for i, key in enumerate(req_keys) if key[:2] in new_lines]
+        for index in new_indexes:
+            self.judge_row(requirements, req_keys, index, new_lines)
+        self.assemble(requirements, req_keys)
+        Detector.detect_interlock(requirements, self.interlock_loops())
+        return Detector.conflicts
+
+    @classmethod
+    def line_keys(cls, lines: List[str]) -> List[LineKey]:
+        occurrences: Dict[str, int] = {}
+        keys = []
+        for line in lines:
+            text = line[: -1] if line[-1:] == '\n' else line
+            keys.append((text, occurrences.get(text, 0)))
+            occurrences[text] = occurrences.get(text, 0) + 1
+        return keys
+
+    def number(self, line_keys: List[LineKey]) -> Tuple[List[Req], List[ReqKey]]:
+        """
+        number the requirements of the lines in order, as requirement_conflict_detect does
+        """
+        requirements, req_keys = [], []
+        count = 1
+        for key in line_keys:
+            line = self.lines[key]
+            for ordinal, (r, group) in enumerate(zip(line.reqs, line.groups)):
+                r.reqid = count
+                r.groupid = group + modelling.counter.group - 1 if group != 0 else 0
+                count += 1
+                requirements.append(r)
+                req_keys.append(key + (ordinal,))
+            modelling.counter.req += line.req_used
+            modelling.counter.group += line.group_used
+        return requirements, req_keys
+
+    def judge_row(self, requirements: List[Req], req_keys: List[ReqKey], index1: int, new_lines: set) -> None:
+        """
+        judge all rules in both directions on the pairs of requirements[index1] and the others,
+        only on the candidates of the blocker if there is one,
+        pairs of two new requirements are judged once, by the former of them
+        """
+        rule_names = Detector.one_way_rules + Detector.two_way_rules + Detector.edge_rules
+        req1, key1 = requirements[index1], req_keys[index1]
+        forward, backward = {}, {}
+        if Detector.blocker is not None:
+            for rule in rule_names:
+                forward[rule] = Detector.blocker.forward(rule, index1)
+                backward[rule] = Detector.blocker.backward(rule, index1)
+        may_x = lambda rule, i: forward.get(rule) is None or i in forward[rule]
+        may_y = lambda rule, i: backward.get(rule) is None or i in backward[rule]
+        candidates = list(forward.values()) + list(backward.values())
+        if Detector.blocker is not None and None not in candidates:
+            # only the requirements sharing a key with requirements[index1] may satisfy a rule
+            indexes = sorted(set().union(*candidates))
+        else:
+            indexes = range(len(requirements))
+        for index2 in indexes:
+            req2, key2 = requirements[index2], req_keys[index2]
+            if index2 == index1 or (key2[:2] in new_lines and index2 < index1):
+                continue
+            if req1.groupid == req2.groupid != 0:
+                continue
+            rules = frozenset([rule for rule in rule_names if may_x(rule, index2) and Detector.judge(req1, req2, rule)])
+            if len(rules) > 0:
+                self.verdicts[(key1, key2)] = rules
+            rules = frozenset([rule for rule in rule_names if may_y(rule, index2) and Detector.judge(req2, req1, rule)])
+            if len(rules) > 0:
+                self.verdicts[(key2, key1)] = rules
+
+    def assemble(self, requirements: List[Req], req_keys: List[ReqKey]) -> None:
+        """
+        rebuild the conflicts and the interlock graphs of Detector in the order of Detector.traverse_req
+        """
+        positions = {key: i for i, key in enumerate(req_keys)}
+        conflict_rules = Detector.one_way_rules + Detector.two_way_rules
+        found: List[Tuple[int, int, int, int, int]] = []
+        graphs = [Detector.operation_event_graph, Detector.input_output_graph]
+        edges: List[List[Tuple[int, int]]] = [[] for _ in graphs]
+        for (key1, key2), rules in self.verdicts.items():
+            i, j = positions[key1], positions[key2]
+            for rule in rules:
+                if rule in Detector.edge_rules:
+                    edges[Detector.edge_rules.index(rule)].append((i, j))
+                elif i < j or rule in Detector.two_way_rules and rule not in self.verdicts.get((key2, key1), []):
+                    # the rules in one direction are judged on (former, latter),
+                    # the rules in two directions on (latter, former) only if (former, latter) is false
+                    found.append((min(i, j), max(i, j), conflict_rules.index(rule), i, j))
+        for _, _, rule, i, j in sorted(found):
+            Detector.conflicts.append((conflict_rules[rule], [requirements[i], requirements[j]]))
+        # the edges of each requirement are found in the order of the other requirements
+        for graph, graph_edges in zip(graphs, edges):
+            for begin, end in sorted(graph_edges):
+                graph[begin].append(end)
+
+    def interlock_loops(self) -> List[List[Set[int]]]:
+        """
+        loops of the interlock graphs of Detector, the loops of a changed graph are searched again on the whole graph,
+        the loops of the last detection are kept if all edges of the graph are the same
+        """
+        graphs = [Detector.operation_event_graph, Detector.input_output_graph]
+        signatures = [tuple([tuple(graph[i]) for i in range(len(graph))]) for graph in graphs]
+        if len(self.graphs) != len(graphs):
+            self.graphs, self.loops = [None] * len(graphs), [None] * len(graphs)
+        for index, (graph, signature) in enumerate(zip(graphs, signatures)):
+            if self.graphs[index] != signature:
+                self.graphs[index], self.loops[index] = signature, Detector.find_loop(graph)
+        return self.loops
+
+
+def intern_entities(lines: List[ModelledLine]) -> None:
+    """
+    intern the entities modelled from the lines again in the order of the lines,
+    the kept and the new requirements then share the same entity objects as in a full modelling
+    """
+    Entity.reset()
+    interned: Dict[int, Entity] = {}
+
+    def intern(entity: Entity) -> Entity:
+        if entity is None or entity.base == '':
+            return entity
+        if id(entity) not in interned:
+            # the entirety is interned before the entity as in modelling, but not replaced, entities equal by value
+            intern(entity.entirety)
+            interned[id(entity)] = Entity.intern(entity)
+        return interned[id(entity)]
+
+    for line in lines:
+        for r, entities in zip(line.reqs, line.entities):
+            for t, (agent, inputs, outputs) in zip(r.event + [r], entities):
+                t.agent = intern(agent)
+                t.input = [intern(e) for e in inputs]
+                t.output = [intern(e) for e in outputs]
+
+
+def state_digest() -> str:
+    """
+    digest of what the kept lines and verdicts depend on: the rules, the dictionary, the code of FSARC,
+    and the version of the state
+    """
+    digest = hashlib.sha256(str(DetectionState.version).encode())
+    code = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py')))
+    for path in ['..' + os.path.sep + rules_yaml, '..' + os.path.sep + dict_yaml] + code:
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides the binary format of modelled requirement files, which is loaded much faster than the text format.
+
+A binary model file is made of
+    header:     magic, version
+    sections:   arrays of integers, for the records of requirements, tuples and entities, and the string table
+    index:      (name, type code, item size, offset, count) of each section
+    footer:     offset of the index, count of sections, magic
+Strings, entities and tuples shared by several requirements are stored once.
+
+Class 'ModelWriter' writes the requirements of each requirement line into a binary model file.
+Function 'read_model' loads the requirements of each line from a binary model file.
+Function 'is_model_file' tells whether a file is a binary model file.
+"""
+import gc, struct
+from array import array
+from typing import Dict, List, Union
+
+from FSARC.Requirement import Condition, Entity, Operation, Req
+
+MAGIC = b'FSARCMDL'
+VERSION = 1
+HEADER = struct.Struct('<8sI4x')
+INDEX_ENTRY = struct.Struct('<32scBQQ')   # name, type code, item size, offset in bytes, count of items
+FOOTER = struct.Struct('<QI4x8s')          # offset of the index, count of sections, magic
+ABLE, NOT = 1, 2    # flags of operations
+
+# name and type code of each section
+SECTIONS = [
+    # strings, string i is string_data[string_offsets[i]: string_offsets[i + 1]] in UTF-8
+    ('string_offsets', 'I'), ('string_data', 'B'),
+    # entities, with string IDs of their bases and modifiers, and entity ID of their entireties or -1
+    ('entity_base', 'I'), ('entity_all', 'B'), ('entity_entirety', 'i'),
+    ('entity_modifier_offsets', 'I'), ('entity_modifiers', 'I'),
+    # tuples of requirements and conditions
+    ('tuple_agent', 'I'), ('tuple_predicate', 'I'), ('tuple_flags', 'B'),
+    ('tuple_input_offsets', 'I'), ('tuple_inputs', 'I'),
+    ('tuple_output_offsets', 'I'), ('tuple_outputs', 'I'),
+    ('tuple_restriction_offsets', 'I'), ('tuple_restrictions', 'I'),
+    # requirements, with tuple IDs of their own tuples and of their conditions
+    ('req_id', 'i'), ('req_group', 'i'), ('req_tuple', 'I'),
+    ('req_event_offsets', 'I'), ('req_events', 'I'),
+    # requirements of line i are requirements[line_offsets[i]: line_offsets[i + 1]]
+    ('line_offsets', 'I'),
+]
+
+
+def is_model_file(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ModelWriter:
+    def __init__(self, path: str):
+        self.path       : str                   = path
+        self.arrays     : Dict[str, array]      = {name: array(code) for name, code in SECTIONS}
+        self.strings    : Dict[str, int]        = {}
+        self.string_data: bytearray             = bytearray()
+        # IDs of written objects, by the ids of the objects
+        self.entities   : Dict[int, int]        = {}
+        self.tuples     : Dict[int, int]        = {}
+        self.kept       : List[object]          = []    # written objects are kept alive, so their ids are not reused
+        for name in ['string_offsets', 'entity_modifier_offsets', 'tuple_input_offsets', 'tuple_output_offsets',
+                     'tuple_restriction_offsets', 'req_event_offsets', 'line_offsets']:
+            self.arrays[name].append(0)
+
+    def __enter__(self) -> 'ModelWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write_line(self, reqs: List[Req]) -> None:
+        """
+        :param reqs: the modelled requirements of a requirement line
+        """
+        a = self.arrays
+        for r in reqs:
+            a['req_id'].append(r.reqid)
+            a['req_group'].append(r.groupid)
+            a['req_tuple'].append(self.tuple_id(r))
+            a['req_events'].extend([self.tuple_id(c) for c in r.event])
+            a['req_event_offsets'].append(len(a['req_events']))
+        a['line_offsets'].append(len(a['req_id']))
+
+    def close(self) -> None:
+        self.arrays['string_data'] = array('B', bytes(self.string_data))
+        index = []
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION))
+            for name, code in SECTIONS:
+                data = self.arrays[name]
+                index.append(INDEX_ENTRY.pack(name.encode(), code.encode(), data.itemsize, f.tell(), len(data)))
+                data.tofile(f)
+                # sections are aligned for the casts of memory views
+                f.write(b'\0' * (-f.tell() % 8))
+            index_offset = f.tell()
+            f.write(b''.join(index))
+            f.write(FOOTER.pack(index_offset, len(index), MAGIC))
+
+    def string_id(self, s: str) -> int:
+        if (i := self.strings.get(s)) is None:
+            i = self.strings[s] = len(self.strings)
+            self.string_data += s.encode('utf-8')
+            self.arrays['string_offsets'].append(len(self.string_data))
+        return i
+
+    def entity_id(self, entity: Entity) -> int:
+        if entity is None:
+            return -1
+        if (i := self.entities.get(id(entity))) is None:
+            entirety = self.entity_id(entity.entirety)
+            a = self.arrays
+            i = self.entities[id(entity)] = len(a['entity_base'])
+            self.kept.append(entity)
+            a['entity_base'].append(self.string_id(entity.base))
+            a['entity_all'].append(entity.is_all)
+            a['entity_entirety'].append(entirety)
+            a['entity_modifiers'].extend([self.string_id(m) for m in entity.modifier])
+            a['entity_modifier_offsets'].append(len(a['entity_modifiers']))
+        return i
+
+    def tuple_id(self, t: Union[Req, Condition]) -> int:
+        # a requirement is never the condition of another, so they share the ids of tuples
+        if (i := self.tuples.get(id(t))) is None:
+            a = self.arrays
+            agent = self.entity_id(t.agent)
+            inputs, outputs = [self.entity_id(e) for e in t.input], [self.entity_id(e) for e in t.output]
+            i = self.tuples[id(t)] = len(a['tuple_agent'])
+            self.kept.append(t)
+            a['tuple_agent'].append(agent)
+            a['tuple_predicate'].append(self.string_id(t.operation.predicate))
+            a['tuple_flags'].append((ABLE if t.operation.Able else 0) | (NOT if t.operation.Not else 0))
+            for name, items in [('input', inputs), ('output', outputs),
+                                ('restriction', [self.string_id(s) for s in t.restriction])]:
+                a[f'tuple_{name}s'].extend(items)
+                a[f'tuple_{name}_offsets'].append(len(a[f'tuple_{name}s']))
+        return i
+
+
+def read_sections(path: str) -> Dict[str, array]:
+    """ the sections of a binary model file, as arrays of their items, not converted to lists """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version = HEADER.unpack_from(data, 0)
+    index_offset, count, footer_magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+    if magic != MAGIC or footer_magic != MAGIC:
+        raise ValueError(f'{path} is not a binary model file')
+    if version != VERSION:
+        raise ValueError(f'{path} is of version {version}, only version {VERSION} is supported')
+    sections = {}
+    with memoryview(data) as view:
+        for i in range(count):
+            name, code, size, offset, length = INDEX_ENTRY.unpack_from(data, index_offset + i * INDEX_ENTRY.size)
+            name, code = name.rstrip(b'\0').decode(), code.decode()
+            items = sections[name] = array(code)
+            if items.itemsize != size:
+                raise ValueError(f'{path} has items of {size} bytes in section {name}')
+            items.frombytes(view[offset: offset + size * length])
+    return sections
+
+
+def read_model(path: str) -> List[List[Req]]:
+    """
+    :param path: path of the binary model file
+    :return: the modelled requirements of each requirement line
+    """
+    # the garbage collector would scan the new objects again and again, and none of them is garbage
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return build_model(read_sections(path))
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def build_model(s: Dict[str, array]) -> List[List[Req]]:
+    data = s['string_data'].tobytes()
+    offsets = s['string_offsets']
+    strings = [data[offsets[i]: offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+    # the objects are filled directly, the constructors would create default members to be replaced
+    entities: List[Entity] = []
+    modifier_offsets = s['entity_modifier_offsets']
+    modifiers = s['entity_modifiers']
+    for i, (base, is_all, entirety) in enumerate(zip(s['entity_base'], s['entity_all'], s['entity_entirety'])):
+        entity = Entity.__new__(Entity)
+        entity.base, entity.is_all, entity.parts = strings[base], bool(is_all), []
+        entity.modifier = [strings[m] for m in modifiers[modifier_offsets[i]: modifier_offsets[i + 1]]]
+        # entireties are written before the entities including them
+        entity.entirety = entities[entirety] if entirety >= 0 else None
+        entities.append(Entity.intern(entity))
+
+    # fields of the tuples, operations are not changed after modelling, so equal ones are shared
+    operations: Dict[tuple, Operation] = {}
+    for predicate, flags in set(zip(s['tuple_predicate'], s['tuple_flags'])):
+        operation = operations[(predicate, flags)] = Operation.__new__(Operation)
+        operation.predicate, operation.Able, operation.Not = strings[predicate], bool(flags & ABLE), bool(flags & NOT)
+    agents = [entities[i] for i in s['tuple_agent']]
+    tuple_operations = [operations[key] for key in zip(s['tuple_predicate'], s['tuple_flags'])]
+    inputs = flat_lists(s['tuple_inputs'], s['tuple_input_offsets'], entities)
+    outputs = flat_lists(s['tuple_outputs'], s['tuple_output_offsets'], entities)
+    restrictions = flat_lists(s['tuple_restrictions'], s['tuple_restriction_offsets'], strings)
+
+    conditions: Dict[int, Condition] = {}
+    for t in set(s['req_events']):
+        c = conditions[t] = Condition.__new__(Condition)
+        c.agent, c.operation, c.input, c.output = agents[t], tuple_operations[t], inputs[t], outputs[t]
+        c.restriction = restrictions[t]
+    events = flat_lists(s['req_events'], s['req_event_offsets'], conditions)
+
+    reqs: List[Req] = []
+    for reqid, groupid, t, event in zip(s['req_id'], s['req_group'], s['req_tuple'], events):
+        r = Req.__new__(Req)
+        r.reqid, r.groupid, r.event = reqid, groupid, event
+        r.agent, r.operation, r.input, r.output = agents[t], tuple_operations[t], inputs[t], outputs[t]
+        r.restriction = restrictions[t]
+        reqs.append(r)
+
+    line_offsets = s['line_offsets']
+    return [reqs[line_offsets[i]: line_offsets[i + 1]] for i in range(len(line_offsets) - 1)]
+
+
+def flat_lists(items: array, offsets: array, objects) -> List[list]:
+    """ list i is [objects[k] for k in items[offsets[i]: offsets[i + 1]]] """
+    get = objects.__getitem__
+    return [list(map(get, items[begin: end])) if begin != end else []
+            for begin, end in zip(offsets, offsets[1:])]
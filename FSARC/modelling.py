@@ -3,21 +3,40 @@
 This file provides interface to model Natural Language requirements.
 
 Function 'model' is the interface for requirements modelling.
+Function 'model_numbered' models a requirement independently, numbering its tuples from 1.
+Function 'model_batch' models requirements with their sentences parsed in batches.
+Function 'model_parallel' models requirements in worker processes, each using one CoreNLP server of the pool.
+Function 'modelling_pool' starts the worker processes of 'model_parallel', which can be used by many calls.
+Function 'model_async' models requirements in threads while the sentences of the next ones are parsed by asyncio.
 """
-import copy
-from typing import List, Tuple
+import asyncio, contextlib, multiprocessing, multiprocessing.pool
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from config import TYPE_TUPLE
+from config import CoreNLP_batch, TYPE_TUPLE
+from FSARC import nlp
+from FSARC.nlp_async import AsyncCoreNLP
 from FSARC.patterns import *
 from FSARC.Requirement import Req, Entity, Condition, RequirementError
 
-__all__ = ['model']
+__all__ = ['Counter', 'model', 'model_numbered', 'model_batch', 'model_parallel', 'modelling_pool', 'model_async']
 
-req_count   : int = 1
-group_count : int = 1
+class Counter:
+    """ the next numbers of requirement and requirement group """
+    def __init__(self):
+        self.req    : int = 1
+        self.group  : int = 1
 
-def model(text: str, mode: str = 'req') -> List[TYPE_TUPLE]:
-    global req_count, group_count
+counter = Counter()     # numbering of 'model' when no counter is given
+
+def model(text: str, mode: str = 'req', numbering: Counter = None) -> List[TYPE_TUPLE]:
+    """
+    model a requirement, it keeps no state except the numbering, so requirements can be modelled concurrently
+    :param text: the requirement, or a clause of it in modes 'verbs' and 'condition'
+    :param mode: 'req', 'verbs' or 'condition'
+    :param numbering: numbering of the requirements, the module counter by default
+    :return: the modelled tuples
+    """
+    numbering = counter if numbering is None else numbering
     requirement_result = []
     conditions_list = []
     restrictions = []
@@ -26,38 +45,40 @@ def model(text: str, mode: str = 'req') -> List[TYPE_TUPLE]:
     if mode == 'req':
         text, restrictions = preprocess(text)
 
-    NLP_parsing(text)
+    ctx = NLP_parsing(text)
 
     if mode == 'req':
-        main_clause, conditions_list = find_conditions()
-        tuples = Req(req_count)
-        req_count += 1
-        NLP_parsing(main_clause)
+        main_clause, conditions_list = find_conditions(ctx)
+        tuples = Req(numbering.req)
+        numbering.req += 1
+        # the main clause is only parsed again when it differs from the parsed text
+        if main_clause != token2text(ctx):
+            ctx = NLP_parsing(main_clause)
     elif mode == 'verbs':
-        tuples = Req(req_count)
-        req_count += 1
-        tuples.groupid = group_count
+        tuples = Req(numbering.req)
+        numbering.req += 1
+        tuples.groupid = numbering.group
     elif mode == 'condition':
         tuples = Condition()
     else:
         raise AttributeError
 
-    op_index, passive = parse_operation(tuples)
+    op_index, passive = parse_operation(ctx, tuples)
     # object clause
     if mode == 'req':
-        obj_clause = parse_obj_clause(op_index)
+        obj_clause = parse_obj_clause(ctx, op_index)
         if obj_clause != '':
-            NLP_parsing(obj_clause)
-            op_index, passive = parse_operation(tuples)
+            ctx = NLP_parsing(obj_clause)
+            op_index, passive = parse_operation(ctx, tuples)
     # multiple verbs
-    has_multi, sentence_1, sentence_2 = check_multi_verbs(op_index, passive)
+    has_multi, sentence_1, sentence_2 = check_multi_verbs(ctx, op_index, passive)
     # not has multiple verbs
     if not has_multi:
-        parse_agent(tuples, op_index, passive)
-        inputs, outputs = parse_input_output(op_index)
+        parse_agent(ctx, tuples, op_index, passive)
+        inputs, outputs = parse_input_output(ctx, op_index)
         tuples.input += inputs
         tuples.output += outputs
-        tuples.restriction = parse_restriction()
+        tuples.restriction = parse_restriction(ctx)
         if mode != 'req':
             return [tuples]
         tuples.restriction.extend(restrictions)
@@ -66,27 +87,30 @@ def model(text: str, mode: str = 'req') -> List[TYPE_TUPLE]:
         for conditions in conditions_list:
             event = []
             for condition in conditions:
-                c_tuple_list = model(condition, 'condition')
+                c_tuple_list = model(condition, 'condition', numbering)
                 for c_tuple in c_tuple_list:
                     event.append(c_tuple)
-            tuples.event = event
-            replace_agent(tuples)      # change entities of omiited subject in passive condition clause
-            new_req = copy.deepcopy(tuples)
+            # the variant of each condition shares the other tuples
+            new_req = tuples.with_event(event)
+            replace_agent(new_req)     # change entities of omiited subject in passive condition clause
             requirement_result.append(new_req)
         return requirement_result
     # has multiple verbs, only requirement may have multiple verbs
     if has_multi:
-        req_count -= 1
-        group_count += 1
-        r1 = model(sentence_1, 'verbs')[0]
-        r2 = model(sentence_2, 'verbs')[0]
+        numbering.req -= 1
+        numbering.group += 1
+        r1 = model(sentence_1, 'verbs', numbering)[0]
+        r2 = model(sentence_2, 'verbs', numbering)[0]
         for res in restrictions:
             r1.restriction.append(res)
             r2.restriction.append(res)
+        if len(conditions_list) == 0:
+            requirement_result.append(r1)
+            requirement_result.append(r2)
         for conditions in conditions_list:
             event = []
             for condition in conditions:
-                c_tuple_list = model(condition, 'condition')
+                c_tuple_list = model(condition, 'condition', numbering)
                 for c_tuple in c_tuple_list:
                     event.append(c_tuple)
             r1.event = event
@@ -97,6 +121,163 @@ def model(text: str, mode: str = 'req') -> List[TYPE_TUPLE]:
             requirement_result.append(r2)
         return requirement_result
 
+def model_numbered(text: str) -> Tuple[List[TYPE_TUPLE], int, int]:
+    """
+    model a requirement independently of the others, with numbers starting from 1
+    :param text: the requirement
+    :return: the modelled tuples, and the count of requirement and group numbers used by them
+    """
+    numbering = Counter()
+    tuples_list = model(text, numbering=numbering)
+    return tuples_list, numbering.req - 1, numbering.group - 1
+
+def model_batch(texts: List[str]) -> List[List[TYPE_TUPLE]]:
+    result = []
+    for i in range(0, len(texts), CoreNLP_batch):
+        batch = texts[i: i + CoreNLP_batch]
+        # the first parsing of each requirement is done in one request
+        nlp.prefetch([preprocess(normalize(text))[0] for text in batch])
+        result.extend([model(text) for text in batch])
+    return result
+
+def model_parallel(texts: List[str], workers: int, pool: Optional[multiprocessing.pool.Pool] = None) \
+        -> List[List[TYPE_TUPLE]]:
+    """
+    model requirements concurrently, the results and their numbering are the same as modelling them one by one
+    :param texts: requirements to model
+    :param workers: number of worker processes
+    :param pool: workers of modelling_pool, the workers are started for these requirements only if None
+    :return: modelled tuples of each requirement, in the same order
+    """
+    if pool is None:
+        with modelling_pool(workers) as pool:
+            return model_parallel(texts, workers, pool)
+    batches = [texts[i: i + CoreNLP_batch] for i in range(0, len(texts), CoreNLP_batch)]
+    result = []
+    for entities, numbered_batch in pool.imap(model_scoped_batch, batches):
+        share_entities(entities, [tuples_list for tuples_list, _, _ in numbered_batch])
+        for tuples_list, req_used, group_used in numbered_batch:
+            renumber(tuples_list, req_used, group_used)
+            result.append(tuples_list)
+    return result
+
+@contextlib.contextmanager
+def modelling_pool(workers: int, context: Optional[multiprocessing.context.BaseContext] = None) \
+        -> Iterator[multiprocessing.pool.Pool]:
+    """
+    :param workers: number of worker processes
+    :param context: multiprocessing context starting the workers, the default start method if None
+    :return: worker processes for model_parallel, which are terminated on leaving the context
+    """
+    context = multiprocessing.get_context() if context is None else context
+    worker_count = context.Value('i', 0)
+    # the workers connect to the servers in turn, they are given the state of nlp as they may be spawned,
+    # and the servers are launched by this process when a worker first misses the parse cache
+    with nlp.serving_launch(context) as events, \
+            context.Pool(workers, initializer=init_worker, initargs=(worker_count, nlp.worker_state(events))) as pool:
+        yield pool
+
+async def model_async(texts: List[str], client: Optional[AsyncCoreNLP] = None) -> List[List[TYPE_TUPLE]]:
+    """
+    model requirements while the sentences of others are parsed,
+    the results, their numbering and their entities are the same as modelling them one by one
+    :param texts: requirements to model
+    :param client: client sending the parsing requests, a client of config.CoreNLP_concurrency requests by default
+    :return: modelled tuples of each requirement, in the same order
+    """
+    own_client = client is None
+    client = AsyncCoreNLP() if own_client else client
+    # batches parsed or modelled at once, so the parsing results are not all kept before they are modelled
+    pending = asyncio.Semaphore(2 * client.limit)
+
+    def model_scoped(batch: List[str]) -> Tuple[List[Entity], List[Tuple[List[TYPE_TUPLE], int, int]]]:
+        # the threads finish in any order, the entities of each thread are shared in the order of the texts later
+        with Entity.thread_scope() as entities:
+            numbered_batch = [model_numbered(text) for text in batch]
+            return list(entities.values()), numbered_batch
+
+    async def model_scoped_async(batch: List[str]) -> Tuple[List[Entity], List[Tuple[List[TYPE_TUPLE], int, int]]]:
+        async with pending:
+            # the first parsing of each requirement is done by the client, the others by nlp.parse in the thread
+            await client.prefetch([preprocess(normalize(text))[0] for text in batch])
+            return await asyncio.to_thread(model_scoped, batch)
+
+    batches = [texts[i: i + CoreNLP_batch] for i in range(0, len(texts), CoreNLP_batch)]
+    try:
+        scoped_batches = await asyncio.gather(*[model_scoped_async(batch) for batch in batches])
+    finally:
+        if own_client:
+            await client.close()
+    result = []
+    for entities, numbered_batch in scoped_batches:
+        share_entities(entities, [tuples_list for tuples_list, _, _ in numbered_batch])
+        for tuples_list, req_used, group_used in numbered_batch:
+            renumber(tuples_list, req_used, group_used)
+            result.append(tuples_list)
+    return result
+
+def renumber(tuples_list: List[TYPE_TUPLE], req_used: int, group_used: int) -> None:
+    # the numbers of independently modelled tuples start from 1, shift them after the former requirements
+    for tuples in {id(t): t for t in tuples_list}.values():
+        if type(tuples) == Req:
+            tuples.reqid += counter.req - 1
+            if tuples.groupid != 0:
+                tuples.groupid += counter.group - 1
+    counter.req += req_used
+    counter.group += group_used
+
+def init_worker(worker_count, state: tuple) -> None:
+    with worker_count.get_lock():
+        index = worker_count.value
+        worker_count.value += 1
+    nlp.use_server(index, *state)
+
+def model_scoped_batch(texts: List[str]) -> Tuple[List[Entity], List[Tuple[List[TYPE_TUPLE], int, int]]]:
+    """
+    model requirements in a new scope of entities, as the workers of model_parallel do for each batch
+    :return: the entities interned in the scope in the order they are interned, and the result of model_numbered_batch
+    """
+    with Entity.scope():
+        numbered_batch = model_numbered_batch(texts)
+        return list(Entity.entities.values()), numbered_batch
+
+def share_entities(entities: List[Entity], tuples_lists: List[List[TYPE_TUPLE]]) -> None:
+    """
+    intern the entities modelled in another scope in the order they were interned,
+    and give the tuples the interned ones, which are shared with the requirements modelled before as in 'model'
+    """
+    interned: Dict[int, Entity] = {}
+
+    def intern(entity: Entity) -> Entity:
+        if entity is None or entity.base == '':
+            return entity
+        if id(entity) not in interned:
+            entity.entirety = intern(entity.entirety)
+            interned[id(entity)] = Entity.intern(entity)
+        return interned[id(entity)]
+
+    for entity in entities:
+        intern(entity)
+    for tuples_list in tuples_lists:
+        for r in tuples_list:
+            for t in r.event + [r]:
+                t.agent = intern(t.agent)
+                t.input = [intern(e) for e in t.input]
+                t.output = [intern(e) for e in t.output]
+
+def model_numbered_batch(texts: List[str], isolated: bool = False) -> List[Tuple[List[TYPE_TUPLE], int, int]]:
+    """
+    :param isolated: entities are not shared among the requirements, each requirement is modelled in its own scope
+    """
+    nlp.prefetch([preprocess(normalize(text))[0] for text in texts])
+    if isolated:
+        result = []
+        for text in texts:
+            with Entity.scope():
+                result.append(model_numbered(text))
+        return result
+    return [model_numbered(text) for text in texts]
+
 def preprocess(text: str) -> Tuple[str, List[str]]:
     text = remove_stopwords(text)
     text = remove_instances(text)
@@ -104,32 +285,32 @@ def preprocess(text: str) -> Tuple[str, List[str]]:
     return find_restrictions(text)
 
 ########################################## identify tuples ###########################################
-def parse_operation(tuples: TYPE_TUPLE) -> Tuple[int, bool]:
+def parse_operation(ctx: ParseContext, tuples: TYPE_TUPLE) -> Tuple[int, bool]:
     # op_index: the word index of the predicate
     # is_passive: whether the sentence is passive voice
-    op_index, is_passive, tuples.operation.Able = find_op_index(type(tuples) == Req)
+    op_index, is_passive, tuples.operation.Able = find_op_index(ctx, type(tuples) == Req)
     # check up copula structure, and change it to the verb 'do' for parsing
-    op_index, predicate = parse_copula(op_index)
+    op_index, predicate = parse_copula(ctx, op_index)
     if predicate != '':
         tuples.operation.predicate = predicate
     # check up op_index and is_passive again
-    op_index, is_passive, predicate = check_op_index(op_index, is_passive)
+    op_index, is_passive, predicate = check_op_index(ctx, op_index, is_passive)
     # update tuples' operation
     if tuples.operation.predicate == '':
         tuples.operation.predicate = predicate
     # parse open complement (including to do)
-    complements = parse_complement(op_index)
+    complements = parse_complement(ctx, op_index)
     if len(complements) > 0:
         tuples.operation.predicate += complements
     # check up NOT
-    tuples.operation.Not = check_not(op_index)
+    tuples.operation.Not = check_not(ctx, op_index)
     return op_index, is_passive
 
-def parse_agent(tuples: TYPE_TUPLE, op_index: int, passive: bool) -> int:
+def parse_agent(ctx: ParseContext, tuples: TYPE_TUPLE, op_index: int, passive: bool) -> int:
     if passive:
-        agent_index, input_output_index = parse_passive_agent(op_index)
+        agent_index, input_output_index = parse_passive_agent(ctx, op_index)
         if input_output_index != -1:
-            entity = parse_entity(input_output_index)
+            entity = parse_entity(ctx, input_output_index)
             tuples.input.append(entity)
             tuples.output.append(entity)
         if agent_index == -1:
@@ -140,48 +321,50 @@ def parse_agent(tuples: TYPE_TUPLE, op_index: int, passive: bool) -> int:
                 tuples.output.append(Entity('*'))
             else:
                 raise RequirementError('The subject of the clause is missing.',
-                                       token2text(),
+                                       token2text(ctx),
                                        'modelling.py -> _agent')
     else:   # active voice
-        agent_index = parse_active_agent(op_index)
-    tuples.agent = parse_entity(agent_index)
+        agent_index = parse_active_agent(ctx, op_index)
+    tuples.agent = parse_entity(ctx, agent_index)
     return agent_index
 
-def parse_input_output(op_index: int) -> Tuple[List[Entity], List[Entity]]:
-    inputs, outputs = find_input_output(op_index)
-    inputs.extend(find_input())
+def parse_input_output(ctx: ParseContext, op_index: int) -> Tuple[List[Entity], List[Entity]]:
+    inputs, outputs = find_input_output(ctx, op_index)
+    inputs.extend(find_input(ctx))
     return inputs, outputs
 
-def parse_restriction() -> List[str]:
-    restriction = common_restriction()
-    restriction.extend(frequency_restriction())
+def parse_restriction(ctx: ParseContext) -> List[str]:
+    restriction = common_restriction(ctx)
+    restriction.extend(frequency_restriction(ctx))
     if len(restriction) == 1 and restriction[0] == '':
         restriction = []
     return restriction
 
 ########################################### other functions ###########################################
-def find_conditions() -> Tuple[str, List[str]]:
+def find_conditions(ctx: ParseContext) -> Tuple[str, List[List[str]]]:
     # find condition leading words
-    words_indexes = find_condition_words()
+    words_indexes = find_condition_words(ctx)
     # find punctuations after condition leading words
     ranges = []
     for words_index in words_indexes:
-        punc_index = find_in_tokens([',', '.'], words_index)
+        # indexes found by find_in_tokens are counted from its start
+        start = words_index + 1
+        punc_index = find_in_tokens(ctx, [',', '.'], start)
         if len(punc_index) > 0:
-            ranges.append((words_index, punc_index[0]))
+            ranges.append((start, start + punc_index[0]))
         else:
             raise RequirementError(
                 'there is no punctuation after the condition leading words',
-                token2text(),
+                token2text(ctx),
                 'modelling -> find_conditions'
             )
-    conditions = [token2text(start, end) for start, end in ranges]
-    main_clause = token2text()
+    conditions = [token2text(ctx, start, end) for start, end in ranges]
+    main_clause = token2text(ctx)
     for condition in conditions:
-        main_clause.replace(condition, '')
-    main_clause.replace(',', '')
-    main_clause.replace('  ', ' ')
-    return main_clause, conditions
+        main_clause = main_clause.replace(condition, '')
+    main_clause = main_clause.replace(',', '').replace('  ', ' ').strip()
+    # the conditions of a requirement are all in its event
+    return main_clause, [conditions] if len(conditions) > 0 else []
 
 def replace_agent(req: Req) -> None:
     for condition in req.event:
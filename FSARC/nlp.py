@@ -3,17 +3,35 @@
 This file provides interface to using CoreNLP.
 
 Function 'start' should be called before using CoreNLP to initialize it.
+The CoreNLP servers are launched when the first text missing in the parse cache is parsed,
+a server already running on the port is reused instead.
+Function 'use_server' lets a worker process use one server of the pool, with the state of 'worker_state'.
+Function 'serving_launch' launches the servers in this process when a worker process first needs them.
 Function 'close' should be called after using CoreNLP to shut it down.
 Function 'parse' is the interface for CoreNLP parsing.
+Function 'parse_batch' parses many sentences in one CoreNLP request.
+Function 'prefetch' parses sentences in batches ahead of their 'parse' calls.
+FSARC.nlp_async provides the same parsing with many requests in flight.
 """
-from typing import Tuple
-import json, os, psutil, requests, subprocess, time
+from typing import Dict, Iterator, List, Optional, Tuple
+import bisect, contextlib, json, os, psutil, requests, subprocess, threading, time
 
-from config import CoreNLP_path, TYPE_NLP
+from config import CoreNLP_path, CoreNLP_port, CoreNLP_servers, CoreNLP_threads
+from config import CoreNLP_timeout, CoreNLP_warm_up, CoreNLP_batch
+from config import parse_cache_path, parse_cache_size, TYPE_NLP
+from FSARC.cache import ParseCache
 
-process         : subprocess.Popen
-url             : str   = ''
+processes       : List[subprocess.Popen]        = []
+session         : Optional[requests.Session]    = None
+cache           : Optional[ParseCache]          = None
+urls            : List[str] = []    # all servers in the pool
+url             : str   = ''        # the server used by this process
 class_path_dir  : str   = ''
+prefetched      : Dict[str, Tuple[TYPE_NLP, TYPE_NLP]] = {}
+launch_lock     = threading.Lock()  # the servers are launched once, by the first thread needing them
+# in a worker process, the events asking the parent process to launch the servers and telling they are launched
+launch_events   : Optional[tuple]   = None
+worker_index    : int   = 0
 ROOT_token = {'index': 0,
               'word': '_ROOT_',
               'originalText': '',
@@ -26,43 +44,255 @@ ROOT_token = {'index': 0,
 props = {'annotators': 'tokenize, pos, lemma, depparse',
          'pipelineLanguage': 'en',
          'outputFormat': 'json'}
+# texts are sent one per line, each line is split into sentences as a single text, and a line break ends a sentence,
+# so that the results can be split back to the texts
+batch_props = dict(props, **{'ssplit.newlineIsSentenceBreak': 'always'})
 
-def start():
-    global class_path_dir, process, url
-    # New server
+def start(lazy: bool = True):
+    """
+    initialize CoreNLP
+    :param lazy: launch the server when it is needed, a fully cached run never launches it
+    """
+    global cache
+    if parse_cache_path is not None and cache is None:
+        cache = ParseCache(parse_cache_path, parse_cache_size, props)
+    if not lazy:
+        launch()
+
+def pool_urls() -> List[str]:
+    """ urls of the servers of the pool, whether they are launched or not """
+    return ['http://localhost:' + str(CoreNLP_port + i) for i in range(CoreNLP_servers)]
+
+def launch():
+    global class_path_dir, processes, session, urls, url
+    server_urls = pool_urls()
+    # keep-alive connections, reused by all requests to the server
+    session = new_session()
     class_path_dir = os.path.normpath(CoreNLP_path) + os.sep
-    port = 9999
-    # Start native server
-    cmd = "java"
-    java_args = "-Xmx8g"
-    java_class = "edu.stanford.nlp.pipeline.StanfordCoreNLPServer"
-    class_path = f'"{class_path_dir}*"'
-    args = [cmd, java_args, '-cp', class_path, java_class, '-port', str(port)]
-    args = ' '.join(args)
-    with open(os.devnull, 'w') as null_file:
-        out_file = null_file
-        # Server shell PID is self.p.pid
-        process = subprocess.Popen(args, shell=True, stdout=out_file, stderr=subprocess.STDOUT)
-    url = 'http://localhost:' + str(port)
+    # reuse the servers already running on the ports
+    new_urls = [server_url for server_url in server_urls if not ready(server_url)]
+    for server_url in new_urls:
+        # New server
+        port = server_url[server_url.rfind(':') + 1:]
+        # Start native server
+        cmd = "java"
+        java_args = "-Xmx8g"
+        java_class = "edu.stanford.nlp.pipeline.StanfordCoreNLPServer"
+        class_path = f'"{class_path_dir}*"'
+        args = [cmd, java_args, '-cp', class_path, java_class, '-port', port, '-threads', str(CoreNLP_threads)]
+        args = ' '.join(args)
+        with open(os.devnull, 'w') as null_file:
+            out_file = null_file
+            # Server shell PID is self.p.pid
+            processes.append(subprocess.Popen(args, shell=True, stdout=out_file, stderr=subprocess.STDOUT))
+    # the servers load their models in parallel
+    for server_url, process in zip(new_urls, processes[-len(new_urls):]):
+        wait_ready(server_url, process)
+    # the other threads send their requests once url is set, so it is set when the servers are ready
+    urls, url = server_urls, server_urls[0]
+
+def ensure_launched():
+    if url == '':
+        with launch_lock:
+            if url == '':
+                launch() if launch_events is None else request_launch()
+
+def request_launch():
+    """ called in a worker process, wait for the parent process to launch the servers, then use one of them """
+    global url
+    requested, launched = launch_events
+    requested.set()
+    launched.wait()
+    server_url = urls[worker_index % len(urls)]
+    if not ready(server_url):
+        raise RuntimeError(f'CoreNLP server {server_url} is not launched')
+    url = server_url
+
+@contextlib.contextmanager
+def serving_launch(context) -> Iterator[tuple]:
+    """
+    launch the servers in a thread of this process when a worker process asks for them,
+    so that the workers of a fully cached run never launch them
+    :param context: multiprocessing context of the worker processes
+    :return: the events given to the workers by 'worker_state'
+    """
+    requested, launched = context.Event(), context.Event()
+    if url != '':
+        launched.set()
+        yield requested, launched
+        return
+    stopped = threading.Event()
+
+    def serve():
+        requested.wait()
+        if not stopped.is_set():
+            try:
+                ensure_launched()
+            finally:
+                # the workers find the servers not ready if they failed to launch
+                launched.set()
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    try:
+        yield requested, launched
+    finally:
+        stopped.set()
+        requested.set()
+        thread.join()
+
+def wait_ready(server_url: str, process: subprocess.Popen):
     # Wait until server starts
-    time.sleep(1)
+    deadline = time.time() + CoreNLP_timeout
+    while not ready(server_url):
+        if process.poll() is not None:
+            raise RuntimeError(f'CoreNLP server exited with code {process.returncode}')
+        if time.time() > deadline:
+            raise TimeoutError(f'CoreNLP server is not ready in {CoreNLP_timeout} seconds')
+        time.sleep(0.5)
+    # load the annotator models before the first real request
+    if CoreNLP_warm_up:
+        session.post(server_url, params={'properties': str(props)}, data=b'The system shall start.')
 
-def close():
-    global process, class_path_dir
+def ready(server_url: str) -> bool:
     try:
-        parent = psutil.Process(process.pid)
-    except psutil.NoSuchProcess:    # No process
-        return
-    children = parent.children(recursive=True)
-    for p in children:
-        p.kill()
-    parent.kill()
+        return session.get(server_url + '/ready', timeout=1).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+def new_session() -> requests.Session:
+    s = requests.Session()
+    s.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=16))
+    return s
+
+def use_server(index: int, server_urls: List[str], cache_path: Optional[str], cache_size: int, server_props: dict,
+               events: tuple):
+    """
+    called in a worker process, which is forked or spawned and inherits nothing of this module,
+    let the worker send its requests to one server of the pool, with its own connections and parse cache
+    :param index: index of the worker
+    :param server_urls: urls of the servers of the pool
+    :param cache_path: path of the parse cache, no cache if None
+    :param cache_size: maximum number of cached sentences
+    :param server_props: properties of the parsing requests
+    :param events: events of 'serving_launch', the servers are launched by the parent process when they are needed
+    """
+    global session, cache, urls, url, props, batch_props, launch_events, worker_index
+    props = server_props
+    batch_props = dict(props, **{'ssplit.newlineIsSentenceBreak': 'always'})
+    urls, url = server_urls, ''
+    launch_events, worker_index = events, index
+    session = new_session()
+    cache = ParseCache(cache_path, cache_size, props) if cache_path is not None else None
+
+def worker_state(events: tuple) -> Tuple[List[str], Optional[str], int, dict, tuple]:
+    """
+    the arguments of 'use_server' after the index, passed to the worker processes when they start
+    :param events: events of 'serving_launch'
+    """
+    cache_path, cache_size = (cache.path, cache.max_size) if cache is not None else (None, parse_cache_size)
+    return (urls if url != '' else pool_urls()), cache_path, cache_size, props, events
+
+def close():
+    global processes, class_path_dir, session, cache, urls, url
+    prefetched.clear()
+    if cache is not None:
+        cache.close()
+        cache = None
+    if session is not None:
+        session.close()
+        session = None
+    urls, url = [], ''
+    # servers not launched by us are not closed
+    for process in processes:
+        try:
+            parent = psutil.Process(process.pid)
+        except psutil.NoSuchProcess:    # No process
+            continue
+        children = parent.children(recursive=True)
+        for p in children:
+            p.kill()
+        parent.kill()
+    processes = []
 
 def parse(text: str) -> Tuple[TYPE_NLP, TYPE_NLP]:
     global url, ROOT_token, props
-    text = text.encode('utf-8')
-    r = requests.post(url, params={'properties': str(props)}, data=text, headers={'Connection': 'close'})
-    result = (json.loads(r.text))['sentences'][0]
+    # another thread may take the prefetched result at the same time
+    if (parsed := prefetched.pop(text, None)) is not None:
+        return parsed
+    result = cache.get(text) if cache is not None else None
+    if result is None:
+        result = request(text)
+        if cache is not None:
+            cache.put(text, result)
+    return split_result(result)
+
+def request(text: str) -> dict:
+    ensure_launched()
+    r = session.post(url, params={'properties': str(props)}, data=text.encode('utf-8'))
+    return compact_result((json.loads(r.text))['sentences'][0])
+
+def parse_batch(texts: List[str]) -> List[Tuple[TYPE_NLP, TYPE_NLP]]:
+    """
+    parse texts in one CoreNLP request, the first sentence of each text is kept as 'parse' does
+    :param texts: non-empty texts to parse
+    :return: (tokens, dependencies) of each text, in the same order
+    """
+    # the results of batches are parsed with other properties, they are cached apart from those of single texts
+    results = [cache.get(text, batch_props) if cache is not None else None for text in texts]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) > 0:
+        for i, result in zip(missing, request_batch([texts[i] for i in missing])):
+            results[i] = result
+            if cache is not None:
+                cache.put(texts[i], result, batch_props)
+    return [split_result(result) for result in results]
+
+def request_batch(texts: List[str]) -> List[dict]:
+    ensure_launched()
+    lines = batch_lines(texts)
+    r = session.post(url, params={'properties': str(batch_props)}, data='\n'.join(lines).encode('utf-8'))
+    return first_sentences(lines, (json.loads(r.text))['sentences'])
+
+def batch_lines(texts: List[str]) -> List[str]:
+    return [text.replace('\n', ' ') for text in texts]
+
+def first_sentences(lines: List[str], sentences: List[dict]) -> List[dict]:
+    """
+    the first sentence of each line of a batch request, whose offsets are counted from the line as in 'request'
+    """
+    # offsets of CoreNLP are of UTF-16 characters
+    starts, start = [], 0
+    for line in lines:
+        starts.append(start)
+        start += len(line.encode('utf-16-le')) // 2 + 1
+    firsts: List[Optional[dict]] = [None] * len(lines)
+    for sentence in sentences:
+        if len(sentence['tokens']) == 0:
+            continue
+        line = bisect.bisect_right(starts, sentence['tokens'][0]['characterOffsetBegin']) - 1
+        if firsts[line] is None:
+            shift = lambda t: dict(t, characterOffsetBegin=t['characterOffsetBegin'] - starts[line],
+                                   characterOffsetEnd=t['characterOffsetEnd'] - starts[line])
+            firsts[line] = compact_result(dict(sentence, tokens=[shift(t) for t in sentence['tokens']]))
+    if None in firsts:
+        raise ValueError(f'{firsts.count(None)} of {len(lines)} texts are parsed into no sentence')
+    return firsts
+
+def prefetch(texts: List[str]) -> None:
+    """
+    parse texts in batches, the results are consumed by later 'parse' calls of the same texts
+    :param texts: texts which will be parsed
+    """
+    texts = list(dict.fromkeys([text for text in texts if text.strip() != '' and text not in prefetched]))
+    for i in range(0, len(texts), CoreNLP_batch):
+        batch = texts[i: i + CoreNLP_batch]
+        prefetched.update(zip(batch, parse_batch(batch)))
+
+def compact_result(result: dict) -> dict:
+    # only the parts used in modelling are kept, they are also what the parse cache stores
+    return {'tokens': result['tokens'], 'enhancedPlusPlusDependencies': result['enhancedPlusPlusDependencies']}
+
+def split_result(result: dict) -> Tuple[TYPE_NLP, TYPE_NLP]:
     tokens, dependencies = result['tokens'], result['enhancedPlusPlusDependencies']
     # add a special ROOT to tokens to align the index of words
     tokens.insert(0, ROOT_token)
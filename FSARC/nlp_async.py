@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides an asyncio interface to CoreNLP, which keeps many parsing requests in flight.
+
+Class 'AsyncCoreNLP' sends requests over HTTP/1.1 keep-alive connections to the servers of FSARC.nlp,
+at most a given number at once, shared in turn among the servers of the pool.
+It uses the parse cache and the servers of FSARC.nlp, which launches the servers when the first request is sent.
+Method 'parse' and 'parse_batch' are the async versions of those of FSARC.nlp.
+Method 'prefetch' parses sentences in concurrent batches ahead of their 'nlp.parse' calls.
+Method 'close' should be called after using it to close its connections.
+"""
+import asyncio, json, urllib.parse
+from typing import Dict, List, Optional, Tuple
+
+from config import CoreNLP_batch, CoreNLP_concurrency, TYPE_NLP
+from FSARC import nlp
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, body: bytes):
+        super().__init__(f'CoreNLP server replied {status}: {body[:200].decode("utf-8", "replace")}')
+        self.status = status
+
+
+class AsyncCoreNLP:
+    def __init__(self, limit: int = CoreNLP_concurrency):
+        """
+        :param limit: most requests in flight, which is also the most connections kept open
+        """
+        self.limit      : int                               = limit
+        self.semaphore  : asyncio.Semaphore                 = asyncio.Semaphore(limit)
+        self.launching  : asyncio.Lock                      = asyncio.Lock()
+        self.idle       : Dict[str, List[Connection]]       = {}    # open connections not in use, by server url
+        self.turn       : int                               = 0     # the server of the next request
+
+    async def parse(self, text: str) -> Tuple[TYPE_NLP, TYPE_NLP]:
+        if (parsed := nlp.prefetched.pop(text, None)) is not None:
+            return parsed
+        result = (await self.cache_get([text], None))[0]
+        if result is None:
+            result = await self.request(text)
+            await self.cache_put([text], [result], None)
+        return nlp.split_result(result)
+
+    async def parse_batch(self, texts: List[str]) -> List[Tuple[TYPE_NLP, TYPE_NLP]]:
+        """
+        parse texts in one CoreNLP request, the first sentence of each text is kept as 'parse' does
+        :param texts: non-empty texts to parse
+        :return: (tokens, dependencies) of each text, in the same order
+        """
+        results = await self.cache_get(texts, nlp.batch_props)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if len(missing) > 0:
+            for i, result in zip(missing, await self.request_batch([texts[i] for i in missing])):
+                results[i] = result
+            await self.cache_put([texts[i] for i in missing], [results[i] for i in missing], nlp.batch_props)
+        return [nlp.split_result(result) for result in results]
+
+    @staticmethod
+    async def cache_get(texts: List[str], props: Optional[dict]) -> List[Optional[dict]]:
+        """ cached results of texts, None for those not cached, read in a thread so the event loop is not blocked """
+        if nlp.cache is None:
+            return [None] * len(texts)
+        cache = nlp.cache
+        return await asyncio.to_thread(lambda: [cache.get(text, props) for text in texts])
+
+    @staticmethod
+    async def cache_put(texts: List[str], results: List[dict], props: Optional[dict]) -> None:
+        """ cache the results of texts, written in a thread as 'cache_get' reads """
+        if nlp.cache is None:
+            return
+        cache = nlp.cache
+
+        def put() -> None:
+            for text, result in zip(texts, results):
+                cache.put(text, result, props)
+        await asyncio.to_thread(put)
+
+    async def prefetch(self, texts: List[str]) -> None:
+        """
+        parse texts in concurrent batches, the results are consumed by later 'nlp.parse' calls of the same texts
+        :param texts: texts which will be parsed
+        """
+        texts = list(dict.fromkeys([text for text in texts if text.strip() != '' and text not in nlp.prefetched]))
+        batches = [texts[i: i + CoreNLP_batch] for i in range(0, len(texts), CoreNLP_batch)]
+        for batch, results in zip(batches, await asyncio.gather(*[self.parse_batch(batch) for batch in batches])):
+            nlp.prefetched.update(zip(batch, results))
+
+    async def request(self, text: str) -> dict:
+        body = await self.post(nlp.props, text.encode('utf-8'))
+        return nlp.compact_result(json.loads(body)['sentences'][0])
+
+    async def request_batch(self, texts: List[str]) -> List[dict]:
+        lines = nlp.batch_lines(texts)
+        sentences = json.loads(await self.post(nlp.batch_props, '\n'.join(lines).encode('utf-8')))['sentences']
+        return nlp.first_sentences(lines, sentences)
+
+    async def post(self, props: dict, data: bytes) -> bytes:
+        """ send a request to a server of the pool, and return the body of the response """
+        if nlp.url == '':
+            async with self.launching:
+                # the servers are launched in a thread, the other requests wait for them
+                await asyncio.to_thread(nlp.ensure_launched)
+        urls = nlp.urls if len(nlp.urls) > 0 else [nlp.url]
+        server_url = urls[self.turn % len(urls)]
+        self.turn += 1
+        target = '/?' + urllib.parse.urlencode({'properties': str(props)})
+        async with self.semaphore:
+            idle = self.idle.setdefault(server_url, [])
+            reused = len(idle) > 0
+            connection = idle.pop() if reused else await self.connect(server_url)
+            try:
+                try:
+                    status, body, keep_alive = await self.exchange(connection, server_url, target, data)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    # the server may close a connection kept idle, the request is sent again on a new one
+                    connection[1].close()
+                    connection = await self.connect(server_url)
+                    status, body, keep_alive = await self.exchange(connection, server_url, target, data)
+            except BaseException:
+                connection[1].close()
+                raise
+            if keep_alive:
+                idle.append(connection)
+            else:
+                connection[1].close()
+        if status != 200:
+            raise HTTPError(status, body)
+        return body
+
+    @staticmethod
+    async def connect(server_url: str) -> Connection:
+        url = urllib.parse.urlsplit(server_url)
+        return await asyncio.open_connection(url.hostname, url.port or 80)
+
+    @staticmethod
+    async def exchange(connection: Connection, server_url: str, target: str, data: bytes) -> Tuple[int, bytes, bool]:
+        """
+        :return: the status and the body of the response, and whether the connection can be used again
+        """
+        reader, writer = connection
+        head = f'POST {target} HTTP/1.1\r\n' \
+               f'Host: {urllib.parse.urlsplit(server_url).netloc}\r\n' \
+               f'Content-Type: text/plain; charset=utf-8\r\n' \
+               f'Content-Length: {len(data)}\r\n' \
+               f'Connection: keep-alive\r\n\r\n'
+        writer.write(head.encode('latin-1') + data)
+        await writer.drain()
+        status_line = await reader.readline()
+        if status_line == b'':
+            raise ConnectionError('CoreNLP server closed the connection')
+        version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+        headers = {}
+        while (line := await reader.readline()) not in [b'\r\n', b'\n', b'']:
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            body = await AsyncCoreNLP.read_chunked(reader)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            # the body ends with the connection
+            body, keep_alive = await reader.read(), False
+        return int(status), body, keep_alive
+
+    @staticmethod
+    async def read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while (size := int((await reader.readline()).split(b';')[0], 16)) > 0:
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        # trailers end with an empty line
+        while await reader.readline() not in [b'\r\n', b'\n', b'']:
+            pass
+        return b''.join(chunks)
+
+    async def close(self) -> None:
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle = {}
@@ -3,13 +3,14 @@
 This file provide functions to help model Natural Language requirements.
 """
 import os, yaml
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 from config import dict_yaml, TYPE_NLP
 from FSARC.nlp import parse
 from FSARC.Requirement import Entity, RequirementError
 
 __all__ = [
+    'ParseContext',
     'normalize',
     'NLP_parsing',
     'token2text',
@@ -35,11 +36,8 @@ __all__ = [
     'check_multi_verbs',
 ]
 
-tokens: TYPE_NLP
-dependencies: TYPE_NLP
-
 with open('..' + os.path.sep + dict_yaml, encoding='utf-8') as f:
-    dictionary = yaml.load(f.read())
+    dictionary = yaml.load(f.read(), Loader=yaml.SafeLoader)
 stopwords = dictionary['stop words']
 before_instance = dictionary['before instance']
 able_words = dictionary['able words']
@@ -48,24 +46,67 @@ condition_leading_words = dictionary['before condition']
 before_adj_clause = dictionary['before adj clause']
 ignored_type = ['nmod:'+s for s in ['poss', 'of', 'agent', 'by', 'tmod', 'per', 'npmod']]
 
+
+class ParseContext:
+    """
+    CoreNLP parsing result of the sentence being modelled, passed to all pattern functions.
+    The dependencies are indexed by governor and type, each index keeps the order of the dependencies.
+    """
+    def __init__(self, text: str):
+        self.tokens         : TYPE_NLP
+        self.dependencies   : TYPE_NLP
+        self.by_governor    : Dict[int, TYPE_NLP]
+        self.by_type        : Dict[str, TYPE_NLP]
+        self.by_governor_type: Dict[Tuple[int, str], TYPE_NLP]
+        self.by_prefix      : Dict[str, TYPE_NLP]
+        self.parse(text)
+
+    def parse(self, text: str) -> None:
+        """ parse a rewritten sentence in place of the current one """
+        self.tokens, self.dependencies = parse(text)
+        self.by_governor, self.by_type, self.by_governor_type = {}, {}, {}
+        self.by_prefix = {}
+        for d in self.dependencies:
+            self.by_governor.setdefault(d['governor'], []).append(d)
+            self.by_type.setdefault(d['dep'], []).append(d)
+            self.by_governor_type.setdefault((d['governor'], d['dep']), []).append(d)
+
+    def governed(self, governor: int, dep_type: str = None) -> TYPE_NLP:
+        """ dependencies whose governor is the given word, and of the given type if it is given """
+        if dep_type is None:
+            return self.by_governor.get(governor, [])
+        return self.by_governor_type.get((governor, dep_type), [])
+
+    def of_type(self, *dep_types: str) -> TYPE_NLP:
+        """ dependencies of the given types """
+        if len(dep_types) == 1:
+            return self.by_type.get(dep_types[0], [])
+        return [d for d in self.dependencies if d['dep'] in dep_types]
+
+    def of_prefix(self, prefix: str) -> TYPE_NLP:
+        """ dependencies whose type starts with the prefix, such as 'nmod' and 'nsubj' """
+        if prefix not in self.by_prefix:
+            self.by_prefix[prefix] = [d for d in self.dependencies if d['dep'].startswith(prefix)]
+        return self.by_prefix[prefix]
+
+
 def normalize(clause: str) -> str:
     index = len(clause) -1
     while clause[index] in ['!', '?', ';', '\n', ' ', '.']:
         index -= 1
     return clause[: index+1] + '.'
 
-def NLP_parsing(text: str):
-    global tokens, dependencies
-    tokens, dependencies = parse(text)
+def NLP_parsing(text: str) -> ParseContext:
+    return ParseContext(text)
 
-def token2text(start=1, end=0) -> str:
+def token2text(ctx: ParseContext, start=1, end=0) -> str:
     if end == 0:
-        return ' '.join([t['word'] for t in tokens[start:]])
-    return ' '.join([t['word'] for t in tokens[start: end]])
+        return ' '.join([t['word'] for t in ctx.tokens[start:]])
+    return ' '.join([t['word'] for t in ctx.tokens[start: end]])
 
-def find_in_tokens(word_list: List[str], start=1, end=0) -> List[int]:
+def find_in_tokens(ctx: ParseContext, word_list: List[str], start=1, end=0) -> List[int]:
     indexes = []
-    search_tokens = tokens[start: end] if end != 0 else tokens[start:]
+    search_tokens = ctx.tokens[start: end] if end != 0 else ctx.tokens[start:]
     for i, token in enumerate(search_tokens):
         if token['lemma'] in word_list:
             indexes.append(i)
@@ -114,263 +155,240 @@ def find_restrictions(text: str) -> Tuple[str, List[str]]:
             text = text[:l_index] + text[right:-1]
     return text, restrictions
 
-def find_op_index(is_req: bool) -> Tuple[int, bool, bool]:
+def find_op_index(ctx: ParseContext, is_req: bool) -> Tuple[int, bool, bool]:
     # some condition clause omit the subject
-    if tokens[1]['pos'] == 'VBN' and tokens[1]['lemma'] != 'be':
+    if ctx.tokens[1]['pos'] == 'VBN' and ctx.tokens[1]['lemma'] != 'be':
         return 1, True, False
-    if tokens[1]['pos'] == 'VBG':
+    if ctx.tokens[1]['pos'] == 'VBG':
         return 1, False, False
     if is_req:  # Requirement
         # the word after modal verbs is recognized as verb
-        for i, token in enumerate(tokens[:-1]):
+        for i, token in enumerate(ctx.tokens[:-1]):
             if token['lemma'] in modal_verbs:
-                if tokens[i + 1]['lemma'] == 'be':
+                if ctx.tokens[i + 1]['lemma'] == 'be':
                     return i + 2, False, token['lemma'] in ['can', 'may']
                 else:
                     return i + 1, False, token['lemma'] in ['can', 'may']
     else:  # Condition & Object Clause
         # the word that ROOT point to is recognized as verb
-        return dependencies[0]['dependent'], False, False
+        return ctx.dependencies[0]['dependent'], False, False
     return 0, False, False
 
-def parse_copula(op_index: int) -> Tuple[int, str]:
-    for d in dependencies:
-        if d['governor'] == op_index and d['dep'] == 'cop' and tokens[d['dependent']]['lemma'] == 'be':
+def parse_copula(ctx: ParseContext, op_index: int) -> Tuple[int, str]:
+    for d in ctx.governed(op_index, 'cop'):
+        if ctx.tokens[d['dependent']]['lemma'] == 'be':
             be_index = d['dependent']
             copula_index = d['governor']
-            predicate = token2text(be_index, copula_index+1)
-            new_clause = token2text(end=be_index) + ' do ' + token2text(start=copula_index+1)
-            NLP_parsing(new_clause)
+            predicate = token2text(ctx, be_index, copula_index+1)
+            new_clause = token2text(ctx, end=be_index) + ' do ' + token2text(ctx, start=copula_index+1)
+            ctx.parse(new_clause)
             return be_index,predicate
     return op_index, ''
 
-def check_op_index(op_index: int, is_passive: bool) -> Tuple[int, bool, str]:
+def check_op_index(ctx: ParseContext, op_index: int, is_passive: bool) -> Tuple[int, bool, str]:
     # if CoreNLP cannot mark the predicate as a verb, recognize the word follows "shall" as verb
     if op_index == 0:
-        indexes = find_in_tokens(modal_verbs)
+        indexes = find_in_tokens(ctx, modal_verbs)
         if len(indexes) > 0:
             op_index = indexes[0] + 1
     if op_index == 0:
         raise RequirementError(
             'cannot find correct operation word in this sentence',
-            token2text(),
+            token2text(ctx),
             'modelling -> parse_operation'
         )
     # check up passive voice
-    if tokens[op_index - 1]['lemma'] == 'be' and tokens[op_index]['pos'] == 'VBN':
+    if ctx.tokens[op_index - 1]['lemma'] == 'be' and ctx.tokens[op_index]['pos'] == 'VBN':
         is_passive = True
-    return op_index, is_passive, tokens[op_index]['lemma']
+    return op_index, is_passive, ctx.tokens[op_index]['lemma']
 
-def parse_complement(op_index) -> str:
+def parse_complement(ctx: ParseContext, op_index) -> str:
     complements = ''
-    for d in [dep for dep in dependencies if dep['governor'] == op_index and dep['dep'] == 'xcomp']:
+    for d in ctx.governed(op_index, 'xcomp'):
         complement_index = d['dependent']
-        to_indexes = find_in_tokens(['to'], op_index+1, complement_index)
+        to_indexes = find_in_tokens(ctx, ['to'], op_index+1, complement_index)
         if len(to_indexes) > 0:
-            if tokens[complement_index]['lemma'] == tokens[complement_index]['word']:
-                complements += (' to ' + token2text(op_index+1, complement_index))
+            if ctx.tokens[complement_index]['lemma'] == ctx.tokens[complement_index]['word']:
+                complements += (' to ' + token2text(ctx, op_index+1, complement_index))
             else:
-                complements += (' to be ' + token2text(op_index + 1, complement_index))
+                complements += (' to be ' + token2text(ctx, op_index + 1, complement_index))
         else:
-            complements += (' ' + token2text(op_index+1, complement_index))
+            complements += (' ' + token2text(ctx, op_index+1, complement_index))
     return complements
 
-def check_not(op_index: int) -> bool:
-    for d in dependencies:
-        if d['governor'] == op_index and d['dep'] == 'neg':
-            return True
-    return False
+def check_not(ctx: ParseContext, op_index: int) -> bool:
+    return len(ctx.governed(op_index, 'neg')) > 0
 
-def find_condition_words():
-    return find_in_tokens(condition_leading_words)
+def find_condition_words(ctx: ParseContext):
+    return find_in_tokens(ctx, condition_leading_words)
 
-def parse_passive_agent(op_index: int) -> Tuple[int, int]:
+def parse_passive_agent(ctx: ParseContext, op_index: int) -> Tuple[int, int]:
     agent_index, input_output_index = -1, -1
     # find formal subject
-    for dep in dependencies:
-        if dep['governor'] == op_index and dep['dep'] == 'nsubjpass':
-            input_output_index = dep['dependent']
-            break
+    for dep in ctx.governed(op_index, 'nsubjpass'):
+        input_output_index = dep['dependent']
+        break
     # find real subject
-    for dep in dependencies:
-        if dep['dep'] == 'case' and dep['dependentGloss'] == 'by':
+    for dep in ctx.of_type('case'):
+        if dep['dependentGloss'] == 'by':
             agent_index = dep['governor']
             break
     return agent_index, input_output_index
 
-def parse_active_agent(op_index: int) -> int:
-    for dep in dependencies:
-        if dep['governor'] == op_index and dep['dep'][:5] == 'nsubj':
-            return dep['dependent']
-    # copula structure
-    for dep in dependencies:
+def parse_active_agent(ctx: ParseContext, op_index: int) -> int:
+    for dep in ctx.governed(op_index):
         if dep['dep'][:5] == 'nsubj':
             return dep['dependent']
+    # copula structure
+    for dep in ctx.of_prefix('nsubj'):
+        return dep['dependent']
     # CoreNLP can not identity the subject
-    if tokens[dependencies[0]['dependent']]['pos'] == 'NN':
-        return dependencies[0]['dependent']
+    if ctx.tokens[ctx.dependencies[0]['dependent']]['pos'] == 'NN':
+        return ctx.dependencies[0]['dependent']
 
-def parse_entity(entity_index: int) -> Entity:
+def parse_entity(ctx: ParseContext, entity_index: int) -> Entity:
     compound = ''
-    for dep in dependencies:
-        if dep['governor'] == entity_index and dep['dep'] == 'compound':
-            word = dep['dependentGloss'].lower() if dep['dependentGloss'][-1] == 'S' else tokens[dep['dependent']]['lemma'].lower()
-            compound = word if compound == '' else compound + ' ' + word
+    for dep in ctx.governed(entity_index, 'compound'):
+        word = dep['dependentGloss'].lower() if dep['dependentGloss'][-1] == 'S' else ctx.tokens[dep['dependent']]['lemma'].lower()
+        compound = word if compound == '' else compound + ' ' + word
     if compound != '':
         compound += ' '
 
-    temp = tokens[entity_index]
+    temp = ctx.tokens[entity_index]
     word = temp['word'].lower() if temp['word'][-1] == 'S' else temp['lemma'].lower()
 
     base = compound + word
     entity = Entity(base)       # entity to return
 
-    for dependency in dependencies:
-        if dependency['governor'] != entity_index:
-            continue
+    for dependency in ctx.governed(entity_index):
         if dependency['dep'] == 'det' and dependency['dependentGloss'].upper() in ['ALL', 'EACH']:
             entity.is_all = True
         elif dependency['dep'] in ['nummod', 'amod']:
-            if tokens[dependency['dependent'] - 1]['pos'] == 'CD':
+            if ctx.tokens[dependency['dependent'] - 1]['pos'] == 'CD':
                 mod = ''
-                for dep in [dep for dep in dependencies if
-                            dep['dep'] == 'advmod' and dep['governor'] == dependency['dependent']]:
-                    for token in tokens[dep['dependent'] - 1: dep['governor'] - 1]:
+                for dep in ctx.governed(dependency['dependent'], 'advmod'):
+                    for token in ctx.tokens[dep['dependent'] - 1: dep['governor'] - 1]:
                         mod += token['lemma'] + ' '
                 entity.modifier.append(mod + dependency['dependentGloss'])
             else:
                 entity.modifier.append(dependency['dependentGloss'])
         elif dependency['dep'] in ['nmod:poss', 'nmod:of']:
-            entirety = parse_entity(dependency['dependent'])
+            entirety = parse_entity(ctx, dependency['dependent'])
             entity.entirety = entirety
             entirety.parts.append(entity)
         elif dependency['dep'] in ['acl', 'acl:relcl']:
             governor = dependency['governor']
             dependent = dependency['dependent']
-            clause = parse_adj_clause(entity_index, governor, dependent)
+            clause = parse_adj_clause(ctx, entity_index, governor, dependent)
             entity.modifier.append(clause)
-    # if there is already an entity in Entity.entities, use the existing one
-    flag = True
-    for e in Entity.entities:
-        if entity == e:
-            entity = e
-            flag = False
-            break
-    if flag:
-        Entity.entities.append(entity)
-    return entity
+    return Entity.intern(entity)
 
-def parse_adj_clause(obj_index: int, governor: int, dependent: int) -> str:
+def parse_adj_clause(ctx: ParseContext, obj_index: int, governor: int, dependent: int) -> str:
     adj_clause = ''
-    begin, end = 0, len(tokens)
-    for i, token in enumerate(tokens[governor + 1: dependent]):
+    begin, end = 0, len(ctx.tokens)
+    for i, token in enumerate(ctx.tokens[governor + 1: dependent]):
         if token['lemma'] in before_adj_clause:
             begin = i
-            for dep in dependencies:
-                if dep['dep'] == 'case' and dep['governor'] == i:
-                    begin = i - 1
-                    break
+            if len(ctx.governed(i, 'case')) > 0:
+                begin = i - 1
             break
     if begin == 0:
         begin = obj_index + 1
-    for i, token in enumerate(tokens[dependent + 1:]):
+    for i, token in enumerate(ctx.tokens[dependent + 1:]):
         if token['lemma'] in ['.', ',', 'and', 'or']:
             end = i
             break
-    for token in tokens[begin: end - 1]:
+    for token in ctx.tokens[begin: end - 1]:
         adj_clause += token['word'] + ' '
-    adj_clause += tokens[end - 1]['word']
+    adj_clause += ctx.tokens[end - 1]['word']
     return adj_clause
 
-def find_input_output(op_index: int) -> Tuple[List[Entity], List[Entity]]:
+def find_input_output(ctx: ParseContext, op_index: int) -> Tuple[List[Entity], List[Entity]]:
     inputs, outputs = [], []
-    for dep in dependencies:
-        if dep['governor'] == op_index and dep['dep'] == 'dobj':
-            o = parse_entity(dep['dependent'])
-            if o not in inputs:
-                inputs.append(o)
-            if o not in outputs:
-                outputs.append(o)
+    for dep in ctx.governed(op_index, 'dobj'):
+        o = parse_entity(ctx, dep['dependent'])
+        if o not in inputs:
+            inputs.append(o)
+        if o not in outputs:
+            outputs.append(o)
     return inputs, outputs
 
-def find_input() -> List[Entity]:
+def find_input(ctx: ParseContext) -> List[Entity]:
     inputs = []
-    for dep in dependencies:
+    for dep in ctx.dependencies:
         if dep['dep'][:4] == 'nmod':
             if dep['dep'] in ignored_type:
                 pass
             elif dep['dep'] == 'nmod:at' and dep['dependentGloss'] == 'time':
                 pass
-            elif (o := parse_entity(dep['dependent'])) not in inputs:
+            elif (o := parse_entity(ctx, dep['dependent'])) not in inputs:
                 inputs.append(o)
         if dep['dep'] in ['nummod', 'compound']:
-            if (o := parse_entity(dep['governor'])) not in inputs:
+            if (o := parse_entity(ctx, dep['governor'])) not in inputs:
                 inputs.append(o)
     return inputs
 
-def common_restriction():
+def common_restriction(ctx: ParseContext):
     restriction = []
-    for dep in dependencies:
-        if dep['dep'] == 'advmod' and dep['dependentGloss'].lower() not in ['when', 'then']:
+    for dep in ctx.of_type('advmod'):
+        if dep['dependentGloss'].lower() not in ['when', 'then']:
             restriction.append(dep['dependentGloss'].lower())
-    for dep in [dep for dep in dependencies if dep['dep'][:4] == 'nmod']:
+    for dep in ctx.of_prefix('nmod'):
         end_index = dep['dependent']
-        if tokens[end_index]['pos'] == 'NNP' or tokens[end_index]['lemma'] == 'time':
-            for d in [d for d in dependencies if d['dep'] == 'case' and d['governor'] == end_index]:
-                restriction.append(token2text(d['dependent'], end_index + 1))
+        if ctx.tokens[end_index]['pos'] == 'NNP' or ctx.tokens[end_index]['lemma'] == 'time':
+            for d in ctx.governed(end_index, 'case'):
+                restriction.append(token2text(ctx, d['dependent'], end_index + 1))
                 break
     return restriction
 
-def frequency_restriction():
+def frequency_restriction(ctx: ParseContext):
     restriction = []
     # every time
-    for dep in [dep for dep in dependencies if dep['dep'] == 'nmod:tmod']:
+    for dep in ctx.of_type('nmod:tmod'):
         end_index = dep['dependent']
-        for d in dependencies:
-            if d['dep'] == 'det' and d['governor'] == end_index and d['dependentGloss'] == 'every':
-                restriction.append(token2text(d['dependent'], end_index + 1))
+        for d in ctx.governed(end_index, 'det'):
+            if d['dependentGloss'] == 'every':
+                restriction.append(token2text(ctx, d['dependent'], end_index + 1))
                 break
     # 'everyday'
-    for t in tokens:
+    for t in ctx.tokens:
         if t['lemma'] == 'everyday':
             restriction.append('everyday')
     # N time1 per/a time2
-    for dep in [dep for dep in dependencies if dep['dep'] == 'nmod:per' or dep['dep'] == 'nmod:npmod']:
+    for dep in ctx.of_type('nmod:per', 'nmod:npmod'):
         time1 = dep['governor']
         time2 = dep['dependent']
-        for d in [d for d in dependencies if d['dep'] == 'nummod' and d['governor'] == time1]:
-            restriction.append(token2text(d['dependent'], time2 + 1))
+        for d in ctx.governed(time1, 'nummod'):
+            restriction.append(token2text(ctx, d['dependent'], time2 + 1))
             break
     return restriction
 
-def parse_obj_clause(op_index: int) -> str:
+def parse_obj_clause(ctx: ParseContext, op_index: int) -> str:
     flag = False
     obj_clause = ''
-    for dep in dependencies:
-        if dep['governor'] == op_index and dep['dep'] == 'ccomp':
-            index = dep['dependent']
-            for d in dependencies:
-                if d['governor'] == index and d['dep'] == 'mark':
-                    flag = True
-                    for i, token in enumerate(tokens):
-                        if i == op_index + 1 and token['lemma'] != 'that':
-                            obj_clause += token['word'] + ' '
-                        elif i > op_index + 1:
-                            obj_clause += token['word'] + ' '
-                    break
-            if flag:
-                break
+    for dep in ctx.governed(op_index, 'ccomp'):
+        index = dep['dependent']
+        for d in ctx.governed(index, 'mark'):
+            flag = True
+            for i, token in enumerate(ctx.tokens):
+                if i == op_index + 1 and token['lemma'] != 'that':
+                    obj_clause += token['word'] + ' '
+                elif i > op_index + 1:
+                    obj_clause += token['word'] + ' '
+            break
+        if flag:
+            break
     return obj_clause
 
 
-def check_multi_verbs(op_index: int, passive: bool) -> Tuple[bool, str, str]:
-    for dep in dependencies:
-        if dep['governor'] == op_index and dep['dependentGloss'] in ['and', 'or']:
+def check_multi_verbs(ctx: ParseContext, op_index: int, passive: bool) -> Tuple[bool, str, str]:
+    for dep in ctx.governed(op_index):
+        if dep['dependentGloss'] in ['and', 'or']:
             and_index = dep['dependent']
             obj_index = None  # word index of the object
             mutual_obj = True  # whether this two verb has mutual object
             # try to find object after the 2nd verb
-            for i, token in enumerate(tokens[and_index:]):
+            for i, token in enumerate(ctx.tokens[and_index:]):
                 if token['pos'][0] == 'N' or token['pos'] in ['DT', 'JJ']:
                     obj_index = i
                     break
@@ -380,17 +398,17 @@ def check_multi_verbs(op_index: int, passive: bool) -> Tuple[bool, str, str]:
             # if find the mutaul object, try to find an object after the 1st verb,
             # if also find it, certainly not have mutaul object
             else:
-                for token in tokens[op_index: and_index]:
+                for token in ctx.tokens[op_index: and_index]:
                     if token['pos'][0] == 'N' or token['word'] == 'be':
                         mutual_obj = False
                         break
             # split the sentence
-            start_part = token2text(end=op_index)
-            end_part = token2text(start=obj_index)
-            op1 = tokens[op_index]['word'] + ' ' if passive else tokens[op_index]['lemma']
-            op2 = tokens[and_index + 1]['word'] + ' ' if passive else tokens[and_index + 1]['lemma']
-            obj1 = token2text(op_index + 1, and_index)
-            obj2 = token2text(and_index + 1, obj_index)
+            start_part = token2text(ctx, end=op_index)
+            end_part = token2text(ctx, start=obj_index)
+            op1 = ctx.tokens[op_index]['word'] + ' ' if passive else ctx.tokens[op_index]['lemma']
+            op2 = ctx.tokens[and_index + 1]['word'] + ' ' if passive else ctx.tokens[and_index + 1]['lemma']
+            obj1 = token2text(ctx, op_index + 1, and_index)
+            obj2 = token2text(ctx, and_index + 1, obj_index)
             clause_1 = ' '.join([start_part, op1, obj1, end_part])
             if mutual_obj:
                 clause_2 = ' '.join([start_part, op2, obj1, end_part])
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides the profiling of conflict detecting and modelling.
+
+Class 'Profiler' counts the calls, the true results and the time of
+    rule:           each rule judged by Rules.judge, by rule name
+    operator:       each operator of rules.yml, by relation and type, such as 'include entity set'
+    set operator:   the operators on sets of Operators, such as 'entity_set_include'
+    nlp:            CoreNLP parsing by FSARC.nlp.parse and parse_batch
+    model:          modelling.model and the stages of modelling a requirement
+The profiling is off by default, the functions are only wrapped when it is on.
+Times are inclusive, a rule calling other rules and operators also counts their time.
+Callbacks are called with (kind, name, seconds, result) after each profiled call.
+Counts of worker processes are not added to those of the main process.
+"""
+import time
+from typing import Callable, Dict, List, Tuple
+
+Callback = Callable[[str, str, float, object], None]
+
+# stages of modelling a requirement, which are functions of modelling
+MODEL_STAGES = ['model', 'normalize', 'preprocess', 'NLP_parsing', 'find_conditions', 'parse_operation',
+                'parse_obj_clause', 'check_multi_verbs', 'parse_agent', 'parse_input_output', 'parse_restriction']
+SET_OPERATORS = ['condition_set_include', 'entity_set_include', 'entity_any_include', 'condition_contradict']
+
+
+class Record:
+    __slots__ = ('calls', 'true', 'seconds')
+
+    def __init__(self):
+        self.calls      : int   = 0
+        self.true       : int   = 0
+        self.seconds    : float = 0.0
+
+
+class Profiler:
+    enabled     : bool                              = False
+    records     : Dict[Tuple[str, str], Record]     = {}
+    callbacks   : List[Callback]                    = []
+    # (owner, attribute, original value) of the patched functions
+    patched     : List[Tuple[object, str, object]]  = []
+
+    @classmethod
+    def enable(cls, callback: Callback = None) -> None:
+        """
+        turn the profiling on, the rules and the operators are profiled from the next detection
+        :param callback: called after each profiled call
+        """
+        if callback is not None:
+            cls.callbacks.append(callback)
+        if cls.enabled:
+            return
+        cls.enabled = True
+        from FSARC import modelling, nlp, patterns
+        from FSARC.detection import Operators
+        for name in ['parse', 'parse_batch']:
+            wrapped = cls.wrap('nlp', name, getattr(nlp, name))
+            cls.patch(nlp, name, wrapped)
+            if name == 'parse':
+                # patterns imports parse by name
+                cls.patch(patterns, name, wrapped)
+        for name in MODEL_STAGES:
+            cls.patch(modelling, name, cls.wrap('model', name, getattr(modelling, name)))
+        for name in SET_OPERATORS:
+            cls.patch(Operators, name, staticmethod(cls.wrap('set operator', name, getattr(Operators, name))))
+
+    @classmethod
+    def disable(cls) -> None:
+        """ turn the profiling off, the counts are kept until reset """
+        for owner, name, original in reversed(cls.patched):
+            setattr(owner, name, original)
+        cls.patched = []
+        # the wrapped functions share the list
+        cls.callbacks.clear()
+        cls.enabled = False
+
+    @classmethod
+    def reset(cls) -> None:
+        # the records are kept by the wrapped functions, so they are cleared in place
+        for record in cls.records.values():
+            record.calls, record.true, record.seconds = 0, 0, 0.0
+
+    @classmethod
+    def patch(cls, owner: object, name: str, value: object) -> None:
+        # the original of a class attribute is its descriptor, such as a classmethod
+        original = owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)
+        cls.patched.append((owner, name, original))
+        setattr(owner, name, value)
+
+    @classmethod
+    def wrap(cls, kind: str, name: str, func: Callable) -> Callable:
+        """
+        :return: func counting its calls into the record of (kind, name)
+        """
+        record = cls.records.setdefault((kind, name), Record())
+        callbacks = cls.callbacks
+        clock = time.perf_counter
+
+        def profiled(*args, **kwargs):
+            begin = clock()
+            result = func(*args, **kwargs)
+            seconds = clock() - begin
+            record.calls += 1
+            record.seconds += seconds
+            if result is True:
+                record.true += 1
+            for callback in callbacks:
+                callback(kind, name, seconds, result)
+            return result
+
+        profiled.__wrapped__ = func
+        return profiled
+
+    @classmethod
+    def wrap_all(cls, kind: str, functions: Dict[str, Callable], prefix: str = '') -> None:
+        """ wrap the functions of a dict in place, named by prefix and their keys """
+        for name, func in functions.items():
+            functions[name] = cls.wrap(kind, prefix + name, func)
+
+    @classmethod
+    def counters(cls) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """ calls, true results and seconds of each (kind, name) called at least once """
+        return {key: {'calls': r.calls, 'true': r.true, 'seconds': r.seconds}
+                for key, r in cls.records.items() if r.calls > 0}
+
+    @classmethod
+    def report(cls) -> str:
+        """ the counters as a table, the most expensive first in each kind """
+        kinds = ['rule', 'operator', 'set operator', 'nlp', 'model']
+        rows = sorted([(kinds.index(kind) if kind in kinds else len(kinds), -r.seconds, kind, name, r)
+                       for (kind, name), r in cls.records.items() if r.calls > 0])
+        lines = [f'{"kind":<14}{"name":<32}{"calls":>10}{"true":>9}{"seconds":>11}{"us/call":>10}']
+        for _, _, kind, name, r in rows:
+            true = f'{100 * r.true / r.calls:.1f}%' if kind in ['rule', 'operator', 'set operator'] else '-'
+            lines.append(f'{kind:<14}{name:<32}{r.calls:>10}{true:>9}{r.seconds:>11.4f}'
+                         f'{1e6 * r.seconds / r.calls:>10.2f}')
+        return '\n'.join(lines)
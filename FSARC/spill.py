@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides conflict detecting of requirements which do not fit in memory.
+
+Class 'SpilledRequirements' keeps the modelled requirements in memory up to a ceiling,
+beyond it they are written into binary model files of half the ceiling, named blocks, and loaded back when needed.
+Function 'detect_iter' collects the requirements and detects their conflicts,
+in memory by Detector.detect_iter, or by 'detect_spilled' if they are spilled.
+Function 'detect_spilled' detects conflicts by a block nested loop, at most two blocks are loaded at the same time.
+"""
+import bisect, os, shutil, tempfile
+from typing import Iterable, Iterator, List, Tuple
+
+from config import detect_memory, spill_path
+from FSARC.detection import Detector
+from FSARC.modelio import ModelWriter, read_model
+from FSARC.Requirement import Req
+
+
+class SpilledRequirements:
+    def __init__(self, ceiling: int = detect_memory, directory: str = spill_path):
+        """
+        :param ceiling: most requirements kept in memory
+        :param directory: directory of the blocks, the temporary directory if None
+        """
+        self.ceiling    : int           = max(ceiling, 2)
+        self.block_size : int           = self.ceiling // 2
+        self.directory  : str           = directory
+        self.paths      : List[str]     = []
+        # requirements of block i are requirements[offsets[i]: offsets[i + 1]]
+        self.offsets    : List[int]     = [0]
+        self.pending    : List[Req]     = []
+        self.cached     : Tuple[int, List[Req]] = (-1, [])
+
+    def __enter__(self) -> 'SpilledRequirements':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.offsets[-1] + len(self.pending)
+
+    def __getitem__(self, index: int) -> Req:
+        """ a requirement of the blocks, the last loaded block is kept """
+        block = bisect.bisect_right(self.offsets, index) - 1
+        if self.cached[0] != block:
+            self.cached = (block, self.load(block))
+        return self.cached[1][index - self.offsets[block]]
+
+    @property
+    def spilled(self) -> bool:
+        return len(self.paths) > 0
+
+    def append(self, req: Req) -> None:
+        self.pending.append(req)
+        if self.spilled and len(self.pending) == self.block_size:
+            self.spill()
+        elif len(self.pending) > self.ceiling:
+            while len(self.pending) >= self.block_size:
+                self.spill()
+
+    def finish(self) -> None:
+        """ spill the last requirements if the others are spilled """
+        if self.spilled and len(self.pending) > 0:
+            self.spill()
+
+    def spill(self) -> None:
+        if not self.spilled:
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix='FSARC-', dir=self.directory)
+        path = os.path.join(self.directory, f'block{len(self.paths)}.bin')
+        reqs, self.pending = self.pending[: self.block_size], self.pending[self.block_size:]
+        with ModelWriter(path) as writer:
+            writer.write_line(reqs)
+        self.paths.append(path)
+        self.offsets.append(self.offsets[-1] + len(reqs))
+
+    def load(self, block: int) -> List[Req]:
+        return [r for reqs in read_model(self.paths[block]) for r in reqs]
+
+    def close(self) -> None:
+        if self.spilled:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.paths, self.cached = [], (-1, [])
+
+
+def detect_iter(requirements: Iterable[Req], workers: int = 1,
+                ceiling: int = detect_memory) -> Iterator[Tuple[str, List[Req]]]:
+    """
+    conflict detecting of requirements given one by one, such as the requirements being modelled
+    :param workers: number of worker processes sharing the requirement pairs, if the requirements are not spilled
+    :param ceiling: most requirements kept in memory
+    """
+    with SpilledRequirements(ceiling) as spilled:
+        for r in requirements:
+            spilled.append(r)
+        spilled.finish()
+        if spilled.spilled:
+            yield from detect_spilled(spilled)
+        else:
+            yield from Detector.detect_iter(spilled.pending, workers=workers)
+
+
+def detect_spilled(spilled: SpilledRequirements, blocking: bool = True,
+                   cycles: int = 0) -> Iterator[Tuple[str, List[Req]]]:
+    """
+    the conflicts of Detector.detect_iter, the conflicts between two requirements come block pair by block pair
+    :param cycles: if positive, report at most this number of elementary cycles of each interlock graph
+    """
+    print(f'conflict detecting in {len(spilled.paths)} blocks ...')
+    Detector.initial(len(spilled), blocking)
+    offsets = spilled.offsets
+    for a in range(len(spilled.paths)):
+        block_a = spilled.load(a)
+        positions_a = list(range(offsets[a], offsets[a + 1]))
+        yield from Detector.traverse_block(block_a, len(block_a), 0, positions_a)
+        for b in range(a + 1, len(spilled.paths)):
+            block_b = spilled.load(b)
+            yield from Detector.traverse_block(block_a + block_b, len(block_a), len(block_a),
+                                               positions_a + list(range(offsets[b], offsets[b + 1])))
+            del block_b
+    # the edges of each requirement are in the order of the other requirements, as in a detection in memory
+    for chain in [Detector.operation_event_graph, Detector.input_output_graph]:
+        for successors in chain.values():
+            successors.sort()
+    if cycles > 0:
+        yield from Detector.cycle_conflicts(spilled, cycles)
+    else:
+        yield from Detector.interlock_conflicts(spilled)
+    print('conflict detecting finished.')
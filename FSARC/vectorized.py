@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides the screening of requirement pairs with NumPy, an optional alternative of blocking.
+
+Class 'Screen' encodes the agents, operations, groups and events of the requirements and their conditions
+into integer arrays of their IDs, and judges the single rules on agents and operations needed by a rule
+for one requirement and all the others at once.
+Only the pairs passing the screening are judged by the rules in Python.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:     # the screening is not available, Detector uses blocking instead
+    np = None
+
+from FSARC.blocking import Gate, Slot
+from FSARC.Requirement import Req, Symbols
+
+
+class Columns:
+    """ features of tuples, one element for each tuple """
+    def __init__(self, tuples_list: list, owners: List[int]):
+        """
+        :param tuples_list: requirements or conditions
+        :param owners: index of the requirement of each tuple
+        """
+        self.owner      = np.array(owners, dtype=np.int64)
+        self.agent      = np.array([t.agent.agent_id() for t in tuples_list], dtype=np.int64)
+        self.is_all     = np.array([t.agent.is_all for t in tuples_list], dtype=bool)
+        self.predicate  = np.array([t.operation.pid for t in tuples_list], dtype=np.int64)
+        self.able       = np.array([t.operation.Able for t in tuples_list], dtype=bool)
+        self.Not        = np.array([t.operation.Not for t in tuples_list], dtype=bool)
+
+
+class Screen:
+    def __init__(self, rules: dict, rule_names: List[str]):
+        """
+        :param rules: the rules in rules.yml
+        :param rule_names: the rules judged for requirement pairs
+        """
+        if np is None:
+            raise ImportError('NumPy is needed by the screening of requirement pairs')
+        self.atoms      : Dict[str, List[Tuple[str, Slot, Slot, str]]]  = {}
+        self.need_event : Dict[str, Set[str]]                           = {}
+        for rule_name in rule_names:
+            if rule_name != 'input output interlock':
+                atoms, self.need_event[rule_name] = Gate.atoms(rules, rule_name)
+                # single rules on the tuples of one requirement do not screen pairs
+                self.atoms[rule_name] = [atom for atom in atoms if atom[1][0] != atom[2][0]]
+
+    def build(self, requirements: List[Req]) -> None:
+        conditions = [(c, i) for i, r in enumerate(requirements) for c in r.event]
+        self.requirements   : Columns = Columns(requirements, list(range(len(requirements))))
+        self.conditions     : Columns = Columns([c for c, _ in conditions], [i for _, i in conditions])
+        # conditions of requirements[i] are conditions[begin[i]: begin[i + 1]]
+        self.begin          = np.searchsorted(self.conditions.owner, np.arange(len(requirements) + 1))
+        self.group          = np.array([r.groupid for r in requirements], dtype=np.int64)
+        self.has_event      = np.array([len(r.event) > 0 for r in requirements], dtype=bool)
+        # bases of output entities, and of input entities and their entireties
+        base_id = lambda e: Symbols.id(e.base)
+        outputs = [(base_id(e), i) for i, r in enumerate(requirements) for e in r.output]
+        inputs = [(base_id(e), i) for i, r in enumerate(requirements) for e in r.input]
+        inputs += [(base_id(e.entirety), i) for i, r in enumerate(requirements) for e in r.input
+                   if e.entirety is not None]
+        self.output_base, self.output_owner = [np.array([p[k] for p in outputs], dtype=np.int64) for k in [0, 1]]
+        self.input_base, self.input_owner = [np.array([p[k] for p in inputs], dtype=np.int64) for k in [0, 1]]
+
+    def forward(self, rule_name: str, index: int) -> Optional[Set[int]]:
+        """ indexes j such that rule(requirements[index], requirements[j]) may be true, None for all """
+        return self.find(rule_name, index, 'x')
+
+    def backward(self, rule_name: str, index: int) -> Optional[Set[int]]:
+        """ indexes j such that rule(requirements[j], requirements[index]) may be true, None for all """
+        return self.find(rule_name, index, 'y')
+
+    def find(self, rule_name: str, index: int, side: str) -> Optional[Set[int]]:
+        if rule_name == 'input output interlock':
+            mask = self.entity_mask(index, side)
+        elif len(self.atoms[rule_name]) == 0:
+            return None
+        else:
+            mask = self.rule_mask(rule_name, index, side)
+        # requirements of the same group are not compared
+        mask &= (self.group != self.group[index]) | (self.group == 0)
+        return set(np.flatnonzero(mask).tolist())
+
+    def rule_mask(self, rule_name: str, index: int, side: str) -> 'np.ndarray':
+        """
+        requirements which satisfy the single rules needed by the rule, when requirements[index] is on side
+        """
+        n = len(self.group)
+        mask = np.ones(n, dtype=bool)
+        need_event = self.need_event[rule_name]
+        if side in need_event and not self.has_event[index]:
+            return np.zeros(n, dtype=bool)
+        if ('y' if side == 'x' else 'x') in need_event:
+            mask &= self.has_event
+        # the single rules on the same pair of slots are satisfied by the same pair of tuples
+        groups: Dict[tuple, list] = {}
+        for atom in self.atoms[rule_name]:
+            own, other = (atom[1], atom[2]) if atom[1][0] == side else (atom[2], atom[1])
+            groups.setdefault((own, other), []).append(atom)
+        for (own, other), atoms in groups.items():
+            own_columns, own_tuples = self.slot_tuples(own, index)
+            other_columns = self.requirements if other[1] is None else self.conditions
+            tuple_mask = np.zeros(len(other_columns.owner), dtype=bool)
+            for t in own_tuples:
+                pair_mask = np.ones(len(other_columns.owner), dtype=bool)
+                for field, slot1, slot2, relation in atoms:
+                    if slot1 == own:
+                        x, y = self.scalar(own_columns, t), other_columns
+                    else:
+                        x, y = other_columns, self.scalar(own_columns, t)
+                    pair_mask &= self.atom_mask(field, relation, x, y)
+                tuple_mask |= pair_mask
+            if other[1] is None:
+                mask &= tuple_mask
+            else:
+                owners = np.zeros(n, dtype=bool)
+                owners[other_columns.owner[tuple_mask]] = True
+                mask &= owners
+        return mask
+
+    def slot_tuples(self, slot: Slot, index: int) -> Tuple[Columns, range]:
+        if slot[1] is None:
+            return self.requirements, range(index, index + 1)
+        return self.conditions, range(self.begin[index], self.begin[index + 1])
+
+    @classmethod
+    def scalar(cls, columns: Columns, t: int) -> Dict[str, object]:
+        return {'agent': columns.agent[t], 'is_all': columns.is_all[t], 'predicate': columns.predicate[t],
+                'able': columns.able[t], 'Not': columns.Not[t]}
+
+    @classmethod
+    def atom_mask(cls, field: str, relation: str, x, y) -> 'np.ndarray':
+        """
+        the operators of rules.yml on agents and operations, x and y are Columns or the scalars of a tuple
+        """
+        get = lambda c, name: c[name] if type(c) == dict else getattr(c, name)
+        if field == 'agent':
+            # equal
+            return (get(x, 'agent') == get(y, 'agent')) | (get(x, 'is_all') & ~get(y, 'is_all'))
+        same = (get(x, 'predicate') == get(y, 'predicate'))
+        same_flags = (get(x, 'able') == get(y, 'able')) & (get(x, 'Not') == get(y, 'Not'))
+        if relation == 'equal':
+            return same & same_flags
+        elif relation == 'include':
+            return same & (same_flags | (~get(x, 'able') & get(y, 'able')))
+        else:
+            # contradict
+            return same & ~get(x, 'able') & ~get(y, 'able')
+
+    def entity_mask(self, index: int, side: str) -> 'np.ndarray':
+        """
+        requirements whose output entities may include an input entity of requirements[index] or the reverse,
+        the including entity has the base of the included one or of its entirety
+        """
+        n = len(self.group)
+        if side == 'x':
+            own = self.output_base[self.output_owner == index]
+            bases, owners = self.input_base, self.input_owner
+        else:
+            own = self.input_base[self.input_owner == index]
+            bases, owners = self.output_base, self.output_owner
+        mask = np.zeros(n, dtype=bool)
+        mask[owners[np.isin(bases, own)]] = True
+        return mask
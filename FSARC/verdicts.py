@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides the cache of rule results shared by requirements of the same structure.
+
+Requirements often differ only in their IDs, such as the variants of a requirement for each alternative condition,
+or the requirements copied in a specification.
+Class 'Signatures' numbers the structures of requirements, IDs excluded.
+Class 'VerdictCache' keeps the results of rules by (signature 1, signature 2, rule), the least recently used are evicted.
+"""
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from FSARC.Requirement import Req
+
+
+class Signatures:
+    def __init__(self):
+        self.ids: Dict[tuple, int] = {}
+
+    def index(self, requirements: List[Req]) -> Dict[int, int]:
+        """
+        :return: signature number of each requirement, by the id of the requirement,
+                 -1 - number for a signature of only one requirement, whose pairs are not cached
+        """
+        numbers = [self.ids.setdefault(r.signature(), len(self.ids)) for r in requirements]
+        counts = Counter(numbers)
+        return {id(r): n if counts[n] > 1 else -1 - n for r, n in zip(requirements, numbers)}
+
+
+class VerdictCache:
+    def __init__(self, max_size: int):
+        """
+        :param max_size: maximum number of cached results
+        """
+        self.max_size   : int                                   = max_size
+        self.verdicts   : OrderedDict[Tuple[int, int, str], bool] = OrderedDict()
+        self.hits       : int                                   = 0
+        self.misses     : int                                   = 0
+
+    def get(self, key: Tuple[int, int, str]) -> Optional[bool]:
+        verdict = self.verdicts.get(key)
+        if verdict is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.verdicts.move_to_end(key)
+        return verdict
+
+    def put(self, key: Tuple[int, int, str], verdict: bool) -> bool:
+        self.verdicts[key] = verdict
+        if len(self.verdicts) > self.max_size:
+            self.verdicts.popitem(last=False)
+        return verdict
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+This file benchmarks the stages of FSARC on synthetic requirement corpora, without a real CoreNLP server.
+
+The requirements are generated by corpus.py, and parsed by the stand-in server of fake_corenlp.py,
+from recorded fixtures or from results synthesized for the templates.
+The stages are
+    parse:      CoreNLP requests of the requirements, as modelling.model_batch sends them
+    model:      modelling.model of each requirement
+    str2Req:    Req.str2Req of the text of each modelled requirement
+    rules:      compilation of the rules in rules.yml
+    detect:     Detector.detect of the modelled requirements
+    async:      modelling.model_async of the requirements, parsed with many requests in flight
+The time, the number of items, the peak traced memory and the peak resident memory of each stage
+are written into a JSON file, so the results of different versions can be compared.
+
+    python bench.py --sizes 100 1000 10000 --output results.json
+"""
+import argparse, asyncio, contextlib, datetime, io, json, os, platform, sys, time, tracemalloc
+from typing import Dict, Iterator, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKING_DIR = os.getcwd()
+sys.path.insert(0, os.path.join(HERE, '..'))
+# the rules and the dictionary are loaded from the parent of the working directory
+os.chdir(HERE)
+
+import config
+# the parse cache would hide the parsing, only the stand-in server is used
+config.parse_cache_path = None
+config.CoreNLP_servers = 1
+
+import corpus
+from fake_corenlp import FixtureServer, load_fixtures
+
+STAGES = ['parse', 'model', 'str2Req', 'rules', 'detect', 'async']
+
+try:
+    import resource
+except ImportError:     # not on Unix, the resident memory is not reported
+    resource = None
+
+
+def max_rss() -> int:
+    """ peak resident memory of the process in KB """
+    if resource is None:
+        return -1
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB on Linux
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class Stage:
+    def __init__(self, name: str):
+        self.name       : str   = name
+        self.seconds    : float = 0.0
+        self.count      : int   = 0
+        self.peak       : int   = 0
+        self.error      : str   = ''
+
+    @contextlib.contextmanager
+    def measure(self, count: int = 1) -> Iterator[None]:
+        """ time a part of the stage, the parts of a stage may be interleaved with those of another """
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        begin = time.perf_counter()
+        try:
+            yield
+            self.count += count
+        except Exception as e:
+            self.error = f'{type(e).__name__}: {e}'
+        finally:
+            self.seconds += time.perf_counter() - begin
+            if tracemalloc.is_tracing():
+                self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+
+    def result(self) -> Dict[str, object]:
+        result = {'seconds': round(self.seconds, 6), 'count': self.count,
+                  'per_second': round(self.count / self.seconds, 3) if self.seconds > 0 else None,
+                  'peak_traced_bytes': self.peak if tracemalloc.is_tracing() else None,
+                  'max_rss_kb': max_rss()}
+        if self.error != '':
+            result['error'] = self.error
+        return result
+
+
+def run(size: int, seed: int, stages: List[str]) -> Dict[str, object]:
+    from FSARC import modelling, nlp
+    from FSARC.detection import Detector, Operators, Rules
+    from FSARC.patterns import normalize
+    from FSARC.Requirement import Entity, Req
+
+    texts = list(corpus.generate(size, seed))
+    Entity.reset()
+    modelling.counter.req = modelling.counter.group = 1
+    measured = {name: Stage(name) for name in STAGES}
+    reqs = []
+    if 'parse' in stages or 'model' in stages:
+        for i in range(0, len(texts), config.CoreNLP_batch):
+            batch = texts[i: i + config.CoreNLP_batch]
+            with measured['parse'].measure(len(batch)):
+                nlp.prefetch([modelling.preprocess(normalize(text))[0] for text in batch])
+            if 'model' not in stages:
+                nlp.prefetched.clear()
+                continue
+            for text in batch:
+                with measured['model'].measure():
+                    reqs.extend(modelling.model(text))
+    for count, r in enumerate(reqs, 1):
+        r.reqid = count
+
+    if 'str2Req' in stages:
+        lines = [str(r) for r in reqs]
+        with measured['str2Req'].measure(len(lines)):
+            for line in lines:
+                Req.str2Req(line.strip())
+    if 'rules' in stages:
+        with measured['rules'].measure():
+            Operators.initial()
+            Rules.initial()
+    if 'detect' in stages:
+        with measured['detect'].measure(len(reqs)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                conflicts = Detector.detect(reqs)
+    if 'async' in stages:
+        # modelled again from scratch, the entities and the numbering of the former stages are kept
+        req, group = modelling.counter.req, modelling.counter.group
+        modelling.counter.req = modelling.counter.group = 1
+        with Entity.scope(), measured['async'].measure(len(texts)):
+            asyncio.run(modelling.model_async(texts))
+        modelling.counter.req, modelling.counter.group = req, group
+    return {'size': size, 'requirements': len(reqs),
+            'conflicts': len(conflicts) if 'detect' in stages and measured['detect'].error == '' else None,
+            'stages': {name: measured[name].result() for name in STAGES if name in stages}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the stages of FSARC on synthetic requirements')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000], help='numbers of requirements')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated requirements')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--fixtures', help='recorded fixtures, results of the other texts are synthesized')
+    parser.add_argument('--port', type=int, default=config.CoreNLP_port, help='port of the stand-in server')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='trace the peak memory of each stage by tracemalloc, which slows the stages down')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file of the results')
+    args = parser.parse_args()
+
+    config.CoreNLP_port = args.port
+    from FSARC import nlp
+    fixtures = os.path.join(WORKING_DIR, args.fixtures) if args.fixtures is not None else None
+    server = FixtureServer(args.port, load_fixtures(fixtures), synthesize=corpus.annotate)
+    server.start()
+    nlp.start()
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        runs = []
+        for size in args.sizes:
+            print(f'benchmarking {size} requirements ...')
+            runs.append(run(size, args.seed, args.stages))
+            for name, stage in runs[-1]['stages'].items():
+                print(f'    {name:8} {stage["seconds"]:10.3f} s {stage["count"]:10} items'
+                      + (f'    {stage["error"]}' if 'error' in stage else ''))
+    finally:
+        tracemalloc.stop()
+        nlp.close()
+        server.shutdown()
+        server.server_close()
+    results = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'trace_memory': args.trace_memory,
+        'fixtures': args.fixtures,
+        'parse_requests': server.requests,
+        'synthesized': server.missing,
+        'runs': runs,
+    }
+    output = os.path.join(WORKING_DIR, args.output)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'results: {output}')
+
+
+if __name__ == '__main__':
+    main()
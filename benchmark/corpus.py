@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides synthetic requirement corpora for the benchmark.
+
+Function 'generate' generates requirements of any number from templates, in a fixed order for a given seed.
+Function 'annotate' synthesizes the CoreNLP result of a template requirement,
+with the tokens and the dependencies of such simple sentences that the modelling reads.
+Function 'write_fixtures' saves the results of requirements as fixtures replayed by fake_corenlp.py.
+"""
+import json, random
+from typing import Dict, Iterator, List
+
+AGENTS = ['flight controller', 'ground station', 'operator', 'system', 'remote operator', 'UAV', 'vehicle core',
+          'mission planner', 'safety monitor', 'route planner']
+VERBS = {'send': 'sends', 'receive': 'receives', 'store': 'stores', 'display': 'displays', 'update': 'updates',
+         'record': 'records', 'delete': 'deletes', 'check': 'checks', 'start': 'starts', 'stop': 'stops'}
+OBJECTS = ['position data', 'mission plan', 'map', 'flight plan', 'battery level', 'event', 'message', 'route',
+           'telemetry', 'camera image', 'waypoint', 'status report']
+ADJECTIVES = ['valid', 'new', 'current', 'secure', 'remote', 'local']
+MODALS = ['shall', 'shall', 'shall', 'must', 'can', 'may']
+TEMPLATES = [
+    # weight, template
+    (4, '{The} {agent} {modal} {verb} the {object}.'),
+    (1, '{The} {agent} {modal} {verb} and {verb2} the {object}.'),
+    (1, '{The} {agent} {modal} {verb} the {object} and the {object2}.'),
+    # requirements with an event, the conditions are led by 'when' and 'if'
+    (1, 'When the {agent2} {verbs3} the {object2}, {the} {agent} {modal} {verb} the {object}.'),
+    (1, 'If the {agent2} {verbs3} the {object2}, {the} {agent} {modal} {verb} the {object}.'),
+]
+
+DETERMINERS = {'the', 'a', 'an', 'each', 'all', 'every'}
+MODAL_WORDS = {'shall', 'can', 'must', 'should', 'may'}
+INFLECTED = {inflected: verb for verb, inflected in VERBS.items()}
+
+
+def generate(count: int, seed: int = 0) -> Iterator[str]:
+    """
+    :param count: number of requirements
+    :param seed: seed of the random choices, the same seed gives the same requirements
+    """
+    rng = random.Random(seed)
+    weights, templates = zip(*TEMPLATES)
+    phrase = lambda: ' '.join(rng.sample(ADJECTIVES, rng.choice([0, 0, 1, 2])) + [rng.choice(OBJECTS)])
+    for _ in range(count):
+        verb, verb2, verb3 = rng.sample(list(VERBS), 3)
+        the = 'all' if rng.random() < 0.1 else 'the'
+        yield rng.choices(templates, weights)[0].format(
+            The=the.capitalize(), the=the, agent=rng.choice(AGENTS), agent2=rng.choice(AGENTS),
+            modal=rng.choice(MODALS), verb=verb, verb2=verb2, verbs3=VERBS[verb3],
+            object=phrase(), object2=phrase())
+
+
+def token(index: int, word: str, lemma: str, pos: str, begin: int) -> Dict[str, object]:
+    return {'index': index, 'word': word, 'originalText': word, 'lemma': lemma, 'characterOffsetBegin': begin,
+            'characterOffsetEnd': begin + len(word), 'pos': pos, 'before': ' ' if begin > 0 else '', 'after': ' '}
+
+
+def dependency(dep: str, governor: Dict[str, object], dependent: Dict[str, object]) -> Dict[str, object]:
+    return {'dep': dep, 'governor': governor['index'], 'governorGloss': governor['word'],
+            'dependent': dependent['index'], 'dependentGloss': dependent['word']}
+
+
+def tag(word: str) -> (str, str):
+    """ lemma and part of speech of a word of the templates """
+    lower = word.lower()
+    if lower in DETERMINERS:
+        return lower, 'DT'
+    if lower in MODAL_WORDS:
+        return lower, 'MD'
+    if lower == 'not':
+        return lower, 'RB'
+    if lower == 'when':
+        return lower, 'WRB'
+    if lower == 'if':
+        return lower, 'IN'
+    if lower in [',', '.']:
+        return lower, lower
+    if lower == 'and':
+        return lower, 'CC'
+    if lower in VERBS:
+        return lower, 'VB'
+    if lower in INFLECTED:
+        return INFLECTED[lower], 'VBZ'
+    if lower in ADJECTIVES:
+        return lower, 'JJ'
+    return lower, 'NN'
+
+
+def annotate(text: str) -> Dict[str, list]:
+    """
+    the CoreNLP result of a template requirement, in the form kept by nlp.compact_result
+    """
+    tokens, begin = [], 0
+    for index, word in enumerate(text.replace(',', ' ,').replace('.', ' .').split(), 1):
+        begin = text.find(word, begin)
+        tokens.append(token(index, word, *tag(word), begin))
+        begin += len(word)
+    at = [None] + tokens
+    verbs = [t['index'] for t in tokens if t['pos'] in ['VB', 'VBZ']]
+    modal_verbs = [v for v in verbs if any([at[k]['pos'] == 'MD' for k in range(max(1, v - 3), v)])]
+    root = (modal_verbs + verbs + [1])[0]
+    dependencies = [dependency('ROOT', {'index': 0, 'word': 'ROOT'}, at[root])]
+    # noun phrases: determiners, adjectives and nouns, the last noun is the head
+    phrases, i = [], 1
+    while i <= len(tokens):
+        if at[i]['pos'] not in ['DT', 'JJ', 'NN']:
+            i += 1
+            continue
+        j = i
+        while j <= len(tokens) and at[j]['pos'] in ['DT', 'JJ', 'NN']:
+            j += 1
+        nouns = [k for k in range(i, j) if at[k]['pos'] == 'NN']
+        if len(nouns) > 0:
+            phrases.append((i, j, nouns[-1]))
+            for k in range(i, j):
+                if k != nouns[-1]:
+                    dep = {'DT': 'det', 'JJ': 'amod', 'NN': 'compound'}[at[k]['pos']]
+                    dependencies.append(dependency(dep, at[nouns[-1]], at[k]))
+        i = j
+    for v in verbs:
+        before = [p for p in phrases if p[1] <= v]
+        after = [p for p in phrases if p[0] > v]
+        if v != root:
+            dependencies.append(dependency('advcl' if v < root else 'conj:and', at[root], at[v]))
+        if len(before) > 0:
+            dependencies.append(dependency('nsubj', at[v], at[before[-1][2]]))
+        if len(after) > 0:
+            dependencies.append(dependency('dobj', at[v], at[after[0][2]]))
+        for k in range(max(1, v - 3), v):
+            dep = {'MD': 'aux', 'RB': 'neg', 'WRB': 'advmod', 'IN': 'mark'}.get(at[k]['pos'])
+            if dep is not None:
+                dependencies.append(dependency(dep, at[v], at[k]))
+    for t in tokens:
+        if t['pos'] == 'CC' and at[t['index'] - 1]['pos'] in ['VB', 'VBZ']:
+            dependencies.append(dependency('cc', at[t['index'] - 1], t))
+        if t['pos'] in [',', '.']:
+            dependencies.append(dependency('punct', at[root], t))
+    return {'tokens': tokens, 'enhancedPlusPlusDependencies': dependencies}
+
+
+def write_fixtures(texts: List[str], path: str) -> None:
+    """
+    save the synthesized results of the texts, one JSON object of text and result per line
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for text in dict.fromkeys(texts):
+            f.write(json.dumps({'text': text, 'result': annotate(text)}) + '\n')
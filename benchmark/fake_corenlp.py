@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+This file provides a local stand-in of the CoreNLP server, which replays recorded parsing results.
+
+Class 'FixtureServer' answers the requests of FSARC.nlp from fixtures, which are JSON lines of text and result.
+Texts missing in the fixtures are given to a fallback, which is a real CoreNLP server to record its results,
+or a function synthesizing the results, otherwise the request fails.
+Function 'load_fixtures' loads a fixture file.
+Function 'split_sentences' splits the text of a request into sentences as CoreNLP does with the given properties.
+
+Run this file to serve a fixture file on the port of config.py:
+    python fake_corenlp.py fixtures.jsonl [--upstream http://localhost:9000]
+"""
+import argparse, ast, json, os, re, sys, threading, urllib.parse, urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def load_fixtures(path: str) -> Dict[str, dict]:
+    fixtures = {}
+    if path is not None and os.path.isfile(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip() != '':
+                    fixture = json.loads(line)
+                    fixtures[fixture['text']] = fixture['result']
+    return fixtures
+
+
+def split_sentences(data: str, props: dict) -> List[Tuple[int, str]]:
+    """
+    sentences of a request and their offsets in UTF-16 characters, split as CoreNLP splits the template requirements:
+    at the end of each line with 'ssplit.eolonly', otherwise after '.', '!' and '?',
+    and at each line break with 'ssplit.newlineIsSentenceBreak' of 'always'
+    """
+    option = lambda name, default: str(props.get(name, default)).lower()
+    if option('ssplit.eolonly', 'false') == 'true':
+        pattern = r'[^\n]+'
+    elif option('ssplit.newlineIsSentenceBreak', 'never') == 'always':
+        pattern = r'[^\n]+?(?:[.!?](?=\s|$)|(?=\n)|$)'
+    else:
+        pattern = r'.+?(?:[.!?](?=\s|$)|$)'
+    sentences = []
+    for match in re.finditer(pattern, data, re.DOTALL):
+        text = match.group()
+        if text.strip() != '':
+            start = match.start() + len(text) - len(text.lstrip())
+            sentences.append((len(data[:start].encode('utf-16-le')) // 2, text.strip()))
+    return sentences
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, fixtures: Dict[str, dict], upstream: str = None,
+                 synthesize: Callable[[str], dict] = None, record_path: str = None):
+        """
+        :param port: port to listen on localhost
+        :param fixtures: CoreNLP results of texts, in the form kept by nlp.compact_result
+        :param upstream: url of a real CoreNLP server, which parses the texts missing in the fixtures
+        :param synthesize: function giving the result of a text missing in the fixtures, if there is no upstream
+        :param record_path: fixture file where the results of the upstream server are appended
+        """
+        super().__init__(('localhost', port), FixtureHandler)
+        self.fixtures   : Dict[str, dict]                   = fixtures
+        self.upstream   : Optional[str]                     = upstream
+        self.synthesize : Optional[Callable[[str], dict]]   = synthesize
+        self.record_path: Optional[str]                     = record_path
+        self.lock       : threading.Lock                    = threading.Lock()
+        self.requests   : int                               = 0
+        self.missing    : int                               = 0
+
+    def start(self) -> threading.Thread:
+        """ serve in a daemon thread """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def results(self, texts: List[str], props: str) -> List[dict]:
+        with self.lock:
+            self.requests += 1
+        results = []
+        for text in texts:
+            if (result := self.fixtures.get(text)) is None:
+                result = self.fallback(text, props)
+            results.append(result)
+        return results
+
+    def fallback(self, text: str, props: str) -> dict:
+        with self.lock:
+            self.missing += 1
+        if self.upstream is not None:
+            url = f'{self.upstream}/?{urllib.parse.urlencode({"properties": props})}'
+            with urllib.request.urlopen(url, data=text.encode('utf-8')) as response:
+                sentence = json.loads(response.read().decode('utf-8'))['sentences'][0]
+            result = {'tokens': sentence['tokens'],
+                      'enhancedPlusPlusDependencies': sentence['enhancedPlusPlusDependencies']}
+            with self.lock:
+                self.fixtures[text] = result
+                if self.record_path is not None:
+                    with open(self.record_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps({'text': text, 'result': result}) + '\n')
+            return result
+        if self.synthesize is not None:
+            return self.synthesize(text)
+        raise KeyError(f'no fixture of the text: {text}')
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'     # keep-alive, as the CoreNLP server
+
+    def do_GET(self):
+        if self.path.startswith('/ready'):
+            self.reply(200, b'ready\n', 'text/plain')
+        else:
+            self.reply(404, b'not found\n', 'text/plain')
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        props = query.get('properties', ['{}'])[0]
+        # FSARC.nlp sends the properties as a Python dict
+        starts, texts = zip(*split_sentences(data, ast.literal_eval(props)))
+        try:
+            results = self.server.results(list(texts), props)
+        except Exception as e:
+            self.reply(500, f'{type(e).__name__}: {e}\n'.encode('utf-8'), 'text/plain')
+            return
+        # the offsets of the results are counted from their sentences
+        shift = lambda t, start: dict(t, characterOffsetBegin=t['characterOffsetBegin'] + start,
+                                      characterOffsetEnd=t['characterOffsetEnd'] + start)
+        sentences = [dict(result, index=i, tokens=[shift(t, start) for t in result['tokens']])
+                     for i, (start, result) in enumerate(zip(starts, results))]
+        self.reply(200, json.dumps({'sentences': sentences}).encode('utf-8'), 'application/json')
+
+    def reply(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    from config import CoreNLP_port
+    parser = argparse.ArgumentParser(description='replay recorded CoreNLP results')
+    parser.add_argument('fixtures', help='fixture file, JSON lines of text and result')
+    parser.add_argument('--port', type=int, default=CoreNLP_port)
+    parser.add_argument('--upstream', help='url of a real CoreNLP server, its results of missing texts are recorded')
+    parser.add_argument('--synthesize', action='store_true',
+                        help='synthesize the results of missing texts, for the template requirements of corpus.py')
+    args = parser.parse_args()
+    synthesize = None
+    if args.synthesize:
+        from corpus import annotate
+        synthesize = annotate
+    server = FixtureServer(args.port, load_fixtures(args.fixtures), args.upstream, synthesize,
+                           args.fixtures if args.upstream is not None else None)
+    print(f'serving {len(server.fixtures)} fixtures on port {args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,35 @@ CoreNLP_path = r'CoreNLP'
 dict_yaml = r'dict.yml'
 rules_yaml = r'rules.yml'
 
+# CoreNLP server
+CoreNLP_port = 9999    # port of the first server, the others use the following ports
+CoreNLP_servers = 1    # number of servers in the pool
+CoreNLP_threads = 4    # number of threads of each server
+CoreNLP_timeout = 120  # seconds to wait for the server to be ready
+CoreNLP_warm_up = True # annotate a sentence to load the models when the server starts
+CoreNLP_batch = 64     # number of sentences in one batch request
+CoreNLP_concurrency = 8    # most requests in flight of FSARC.nlp_async
+
+# parse cache, set path to None to disable it
+parse_cache_path = r'parse_cache.sqlite'
+parse_cache_size = 1000000     # maximum number of cached sentences
+parse_cache_timeout = 30       # seconds to wait for the parse cache locked by another process
+
+# conflict output
+conflict_flush = 100   # number of conflicts written between two flushes of the conflict file
+
+# conflict detecting
+detect_memory = 200000 # most modelled requirements kept in memory, the others are spilled to disk
+spill_path = None      # directory of the spilled requirements, the temporary directory if None
+rule_order = 'adaptive'   # order of the branches of 'and'/'or' rules: 'authored', 'estimated' or 'adaptive'
+rule_sample = 5000     # rules judged before they are compiled again in the adaptive order
+verdict_cache_size = 1000000   # most rule results of requirements with the same structure cached, 0 to disable
+condition_memo_size = 1000000  # most rule results of condition pairs memoized, the memo is cleared when it is full
+entity_inclusion = True    # precompute the include operator of the entities of each detection run or block pair
+loop_mode = 'components'   # interlock loops reported: 'components' for the strongly connected components,
+                           # which merge overlapping loops, or 'traced' for the loops FSARC reported before,
+                           # traced from each requirement, which takes a search from every requirement
+
 # type definations
 TYPE_NLP   = List[Dict[str, Union[str, int]]]
 TYPE_TUPLE = Union[Req, Condition]
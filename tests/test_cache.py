@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of FSARC.cache, the results read from the parse cache are compared with those written into it.
+"""
+import os, sys, tempfile, unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..'), os.path.join(HERE, '..', 'benchmark')]
+
+import corpus
+from FSARC.cache import ParseCache
+
+CONFIG = {'annotators': 'tokenize, pos, lemma, depparse'}
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'parse.sqlite')
+        self.cache = ParseCache(self.path, 4, CONFIG)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_hit_and_miss(self):
+        text = 'The system shall store the map.'
+        self.assertIsNone(self.cache.get(text))
+        self.cache.put(text, corpus.annotate(text))
+        self.assertEqual(self.cache.get(text), corpus.annotate(text))
+        # the spaces of a text are normalized
+        self.assertEqual(self.cache.get('  The system shall  store the map. '), corpus.annotate(text))
+        self.assertIsNone(self.cache.get('The system shall store the route.'))
+        # results of other properties are cached apart
+        self.assertIsNone(self.cache.get(text, dict(CONFIG, **{'ssplit.newlineIsSentenceBreak': 'always'})))
+
+    def test_eviction(self):
+        texts = list(dict.fromkeys(corpus.generate(40, 29)))[:6]
+        for text in texts[:4]:
+            self.cache.put(text, corpus.annotate(text))
+        # the first text is used again, so the second one is the least recently used
+        self.assertIsNotNone(self.cache.get(texts[0]))
+        self.cache.put(texts[4], corpus.annotate(texts[4]))
+        self.assertIsNone(self.cache.get(texts[1]))
+        self.assertIsNotNone(self.cache.get(texts[0]))
+
+    def test_shared_file(self):
+        # another process opening the file reads the results written, and writes its own
+        other = ParseCache(self.path, 4, CONFIG)
+        try:
+            text = 'The operator shall send the route.'
+            self.cache.put(text, corpus.annotate(text))
+            self.assertEqual(other.get(text), corpus.annotate(text))
+            other.put('The operator shall stop.', corpus.annotate('The operator shall stop.'))
+            self.assertEqual(self.cache.get('The operator shall stop.'), corpus.annotate('The operator shall stop.'))
+        finally:
+            other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
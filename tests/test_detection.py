@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of FSARC.detection, the conflicts found with each option of the detection are compared with those found
+with the rules built from lambdas on all requirement pairs, without blocking, entity inclusion or verdict cache.
+The requirements are generated by benchmark/corpus.py, whose parsing results are synthesized without CoreNLP.
+"""
+import contextlib, io, os, sys, tempfile, unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..'), os.path.join(HERE, '..', 'benchmark')]
+# the rules and the dictionary are loaded from the parent of the working directory
+os.chdir(HERE)
+
+import config
+config.parse_cache_path = None
+
+import corpus
+from FSARC import API, detection, modelling, nlp, spill, vectorized
+from FSARC.detection import Detector, Operators, Rules
+from FSARC.profiling import Profiler
+from FSARC.Requirement import Entity
+
+
+rules_initial = Rules.initial.__func__
+
+
+def conflict_strings(conflicts):
+    return [(name, [str(r) for r in rs]) for name, rs in conflicts]
+
+
+def corpus_slice():
+    """ generated requirements, with variants of them which conflict with them """
+    lines = list(corpus.generate(60, 23))
+    lines += [line.replace(' the ', ' the valid ', 1) for line in lines[::2]]
+    lines += ['If the operator sends the route, ' + line[0].lower() + line[1:]
+              for line in lines[1::3] if not line.startswith(('If', 'When'))]
+    lines += [line.replace(' shall ', ' can ', 1) for line in lines[::3]]
+    return lines
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def rules(compiled: bool, order: str = 'authored'):
+    """ the rules of the next detections are built this way """
+    return mock.patch.object(Rules, 'initial', lambda: rules_initial(Rules, compiled, order))
+
+
+def plain():
+    """ the options of the reference detection, besides blocking """
+    stack = contextlib.ExitStack()
+    stack.enter_context(rules(False))
+    stack.enter_context(mock.patch.object(detection, 'entity_inclusion', False))
+    stack.enter_context(mock.patch.object(detection, 'verdict_cache_size', 0))
+    return stack
+
+
+class DetectionTest(unittest.TestCase):
+    requirements = []
+    expected = []
+
+    @classmethod
+    def setUpClass(cls):
+        request, request_batch, cache = nlp.request, nlp.request_batch, nlp.cache
+        nlp.request = corpus.annotate
+        nlp.request_batch = lambda texts: [corpus.annotate(text) for text in texts]
+        nlp.cache = None
+        try:
+            modelling.counter.req = modelling.counter.group = 1
+            Entity.reset()
+            lines = quiet(modelling.model_batch, corpus_slice())
+        finally:
+            nlp.request, nlp.request_batch, nlp.cache = request, request_batch, cache
+        cls.requirements = [r for reqs in lines for r in reqs]
+        for count, r in enumerate(cls.requirements, 1):
+            r.reqid = count
+        with plain():
+            cls.expected = cls.detect(blocking=False)
+
+    @classmethod
+    def detect(cls, **options):
+        return conflict_strings(quiet(Detector.detect, cls.requirements, **options))
+
+    def test_conflicts(self):
+        # the slice has conflicts of several rules and interlock conflicts
+        names = {name for name, _ in self.expected}
+        self.assertTrue({'operation inconsistency', 'operation inclusion', 'event inclusion'} <= names)
+        self.assertIn('input output interlock', names)
+
+    def test_default(self):
+        self.assertEqual(self.detect(), self.expected)
+
+    def test_workers(self):
+        self.assertEqual(self.detect(workers=3), self.expected)
+        with plain():
+            self.assertEqual(self.detect(blocking=False, workers=3), self.expected)
+
+    def test_blocking(self):
+        with plain():
+            self.assertEqual(self.detect(blocking=True), self.expected)
+
+    def test_condition_memo(self):
+        # the memos of condition pairs are cleared again and again
+        with mock.patch.object(detection, 'condition_memo_size', 2):
+            self.assertEqual(self.detect(), self.expected)
+
+    def test_compiled_rules(self):
+        with plain(), rules(True, 'authored'):
+            self.assertEqual(self.detect(blocking=False), self.expected)
+
+    def test_rule_orders(self):
+        for order in ['authored', 'estimated', 'adaptive']:
+            with self.subTest(order=order), rules(True, order):
+                self.assertEqual(self.detect(), self.expected)
+
+    def test_adapted_rules(self):
+        # the rules are compiled again after a few judgements, in the middle of the detection
+        with rules(True, 'adaptive'), mock.patch.object(detection, 'rule_sample', 50), \
+                mock.patch.object(Rules, 'adapt', wraps=Rules.adapt) as adapt:
+            self.assertEqual(self.detect(), self.expected)
+        self.assertTrue(adapt.called)
+
+    def test_verdict_cache(self):
+        for size in [1000000, 5]:
+            with self.subTest(size=size), rules(False), mock.patch.object(detection, 'entity_inclusion', False), \
+                    mock.patch.object(detection, 'verdict_cache_size', size):
+                self.assertEqual(self.detect(), self.expected)
+                self.assertGreater(Detector.verdicts.hits, 0)
+
+    def test_entity_inclusion(self):
+        with rules(False), mock.patch.object(detection, 'verdict_cache_size', 0), \
+                mock.patch.object(detection, 'entity_inclusion', True):
+            self.assertEqual(self.detect(), self.expected)
+
+    @unittest.skipIf(vectorized.np is None, 'NumPy is not installed')
+    def test_screening(self):
+        self.assertEqual(self.detect(screening=True), self.expected)
+        self.assertIsInstance(Detector.blocker, vectorized.Screen)
+        with plain():
+            self.assertEqual(self.detect(screening=True), self.expected)
+        self.assertEqual(self.detect(screening=True, workers=3), self.expected)
+
+    def test_detect_iter(self):
+        self.assertEqual(conflict_strings(quiet(list, Detector.detect_iter(self.requirements))), self.expected)
+
+    def test_written_conflicts(self):
+        # each conflict is in the file before the next one is found
+        path = os.path.join(tempfile.mkdtemp(), 'conflicts.txt')
+        written = []
+
+        def conflicts():
+            for conflict in Detector.detect_iter(self.requirements):
+                if os.path.exists(path):
+                    with open(path, encoding='UTF-8') as f:
+                        written.append(f.read().count('\n\n'))
+                yield conflict
+        with mock.patch.object(API, 'conflict_flush', 1):
+            quiet(API.ConflictDetector.write_conflicts, conflicts(), path)
+        self.assertEqual(written, list(range(len(self.expected))))
+        with open(path, encoding='UTF-8') as f:
+            self.assertEqual(f.read(), ''.join(f'{name}\n{"".join(rs)}\n' for name, rs in self.expected))
+
+    def test_spilled(self):
+        # the conflicts between two requirements come block pair by block pair, then the interlock conflicts
+        spilled = conflict_strings(quiet(list, spill.detect_iter(iter(self.requirements), ceiling=40)))
+        interlocks = [c for c in self.expected if 'interlock' in c[0]]
+        self.assertEqual(sorted(spilled), sorted(self.expected))
+        self.assertEqual(spilled[len(spilled) - len(interlocks):], interlocks)
+
+    def test_profiling(self):
+        calls = []
+        Profiler.enable(lambda kind, name, seconds, result: calls.append(kind))
+        try:
+            self.assertEqual(self.detect(), self.expected)
+            counters = Detector.counters()
+        finally:
+            Profiler.disable()
+            Profiler.reset()
+        self.assertGreater(counters[('rule', 'operation inclusion')]['calls'], 0)
+        self.assertGreater(counters[('set operator', 'entity_set_include')]['calls'], 0)
+        self.assertEqual(len(calls), sum(counter['calls'] for counter in counters.values()))
+        # the functions are restored, and the counts are not kept by the next detection
+        self.assertFalse(hasattr(Operators.entity_set_include, '__wrapped__'))
+        self.assertEqual(self.detect(), self.expected)
+        self.assertEqual(Detector.counters(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of FSARC.graph, the loops are compared with those of the recursive find_loop FSARC had before.
+"""
+import os, random, sys, unittest
+from typing import Dict, List, Set
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from FSARC import graph
+
+
+def find_loop(chain: Dict[int, List[int]]) -> List[Set[int]]:
+    """ Detector.find_loop before the loops were found iteratively """
+    n = len(chain.keys())
+    visited = [False] * n
+    trace = []
+    result = []
+
+    def findCycle(v):
+        if visited[v]:
+            if v in trace:
+                j = trace.index(v)
+                s = set(trace[j:])
+                flag = True
+                for r in result:
+                    if len(r & s) == len(s):
+                        flag = False
+                        break
+                if flag:
+                    for r in result:
+                        if len(r & s) == len(r):
+                            result.remove(r)
+                    result.append(s)
+                return
+            return
+        visited[v] = True
+        trace.append(v)
+        for i in chain[v]:
+            findCycle(i)
+        if len(trace) > 0:
+            trace.pop()
+
+    for now in range(n):
+        visited = [False] * n
+        trace = []
+        findCycle(now)
+    return result
+
+
+def random_graph(rng: random.Random, n: int, degree: float) -> Dict[int, List[int]]:
+    return {v: [w for w in range(n) if rng.random() < degree / n] for v in range(n)}
+
+
+class TracedLoopsTest(unittest.TestCase):
+    def test_same_as_find_loop(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            chain = random_graph(rng, rng.randint(1, 30), rng.choice([0.5, 1, 1.5, 2, 3]))
+            self.assertEqual(graph.traced_loops(chain), find_loop(chain), chain)
+        for _ in range(20):
+            chain = random_graph(rng, rng.randint(50, 100), rng.choice([1, 1.5, 2]))
+            self.assertEqual(graph.traced_loops(chain), find_loop(chain))
+
+    def test_chains_of_loops(self):
+        # loops joined by edges, and a long path without a loop
+        chain = {v: [v + 1] for v in range(400)}
+        chain[400] = []
+        for v in range(0, 60, 6):
+            chain[v + 5] = [v, v + 6]
+        self.assertEqual(graph.traced_loops(chain), find_loop(chain))
+
+    def test_components(self):
+        chain = {0: [1], 1: [0, 2], 2: [3], 3: [2, 4], 4: [4], 5: [0]}
+        self.assertEqual(graph.loops(chain), [{0, 1}, {2, 3}, {4}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of FSARC.incremental, the conflicts of each update are compared with those of a full detection.
+The requirements are generated by benchmark/corpus.py, whose parsing results are synthesized without CoreNLP.
+"""
+import contextlib, io, os, random, shutil, sys, tempfile, unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..'), os.path.join(HERE, '..', 'benchmark')]
+# the rules and the dictionary are loaded from the parent of the working directory
+os.chdir(HERE)
+
+import config
+config.parse_cache_path = None
+
+import corpus
+from FSARC import modelling, nlp
+from FSARC.detection import Detector
+from FSARC.incremental import DetectionState
+from FSARC.Requirement import Entity
+
+nlp.cache = None
+
+
+def conflict_strings(conflicts):
+    return [(name, [str(r) for r in rs]) for name, rs in conflicts]
+
+
+def full_detect(lines):
+    modelling.counter.req = modelling.counter.group = 1
+    Entity.reset()
+    requirements = [r for tuples in modelling.model_batch(lines) for r in tuples]
+    for count, r in enumerate(requirements, 1):
+        r.reqid = count
+    return conflict_strings(Detector.detect(requirements))
+
+
+def incremental_detect(lines, path):
+    modelling.counter.req = modelling.counter.group = 1
+    Entity.reset()
+    state = DetectionState.load(path)
+    conflicts = conflict_strings(state.update(lines))
+    state.save(path)
+    return conflicts
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'state.pickle')
+        self.request, self.request_batch = nlp.request, nlp.request_batch
+        nlp.request = corpus.annotate
+        nlp.request_batch = lambda texts: [corpus.annotate(text) for text in texts]
+
+    def tearDown(self):
+        nlp.request, nlp.request_batch = self.request, self.request_batch
+
+    def assertSameAsFull(self, lines):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(incremental_detect(lines, self.path), full_detect(lines))
+
+    def test_edits(self):
+        rng = random.Random(3)
+        lines = list(corpus.generate(80, 3))
+        for _ in range(4):
+            self.assertSameAsFull(lines)
+            for _ in range(3):
+                index = rng.randrange(len(lines))
+                lines.insert(index, next(corpus.generate(1, rng.randrange(1000))))
+                del lines[rng.randrange(len(lines))]
+
+    def test_reorder(self):
+        # equal entities with modifiers in other orders are written as the first one modelled
+        lines = ['The operator shall send the remote local map.',
+                 'The system shall delete the local remote map.',
+                 'The operator shall store the local remote map.'] + list(corpus.generate(40, 5))
+        self.assertSameAsFull(lines)
+        lines.reverse()
+        self.assertSameAsFull(lines)
+        random.Random(5).shuffle(lines)
+        self.assertSameAsFull(lines)
+
+    def test_dictionary_changed(self):
+        # the rules and the dictionary are read from the parent of the working directory, as copied here
+        root = tempfile.mkdtemp()
+        for name in [config.rules_yaml, config.dict_yaml]:
+            shutil.copy(os.path.join(HERE, '..', name), root)
+        os.mkdir(os.path.join(root, 'work'))
+        os.chdir(os.path.join(root, 'work'))
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                incremental_detect(list(corpus.generate(20, 7)), self.path)
+            self.assertTrue(DetectionState.load(self.path).lines)
+            with open(os.path.join(root, config.dict_yaml), 'a', encoding='utf-8') as f:
+                f.write('\n# changed\n')
+            self.assertFalse(DetectionState.load(self.path).lines)
+        finally:
+            os.chdir(HERE)
+
+
+if __name__ == '__main__':
+    unittest.main()
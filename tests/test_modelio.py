@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of FSARC.modelio, the requirements read from a binary model file are compared with those written into it.
+The requirements are generated by benchmark/corpus.py, whose parsing results are synthesized without CoreNLP.
+"""
+import contextlib, io, os, sys, tempfile, unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..'), os.path.join(HERE, '..', 'benchmark')]
+# the rules and the dictionary are loaded from the parent of the working directory
+os.chdir(HERE)
+
+import config
+config.parse_cache_path = None
+
+import corpus
+from FSARC import modelling, nlp
+from FSARC.modelio import ModelWriter, is_model_file, read_model
+from FSARC.Requirement import Entity
+
+
+def line_strings(lines):
+    """ the requirements of each line with their conditions, numbers and entities """
+    return [[(repr(r), r.reqid, r.groupid, [repr(c) for c in r.event],
+              [(str(e), str(e.entirety)) for t in [r] + r.event for e in [t.agent] + t.input + t.output])
+             for r in reqs] for reqs in lines]
+
+
+class ModelIOTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'model.bin')
+        self.request, self.request_batch, self.cache = nlp.request, nlp.request_batch, nlp.cache
+        nlp.request = corpus.annotate
+        nlp.request_batch = lambda texts: [corpus.annotate(text) for text in texts]
+        nlp.cache = None
+
+    def tearDown(self):
+        nlp.request, nlp.request_batch, nlp.cache = self.request, self.request_batch, self.cache
+
+    def test_round_trip(self):
+        texts = ['The operator shall send the remote local map.',
+                 'If the system receives the route, the system shall store the route.'] + list(corpus.generate(80, 19))
+        modelling.counter.req = modelling.counter.group = 1
+        with Entity.scope(), contextlib.redirect_stdout(io.StringIO()):
+            lines = modelling.model_batch(texts) + [[]]
+            with ModelWriter(self.path) as writer:
+                for reqs in lines:
+                    writer.write_line(reqs)
+            expected = line_strings(lines)
+            entity_count = len({id(e) for reqs in lines for r in reqs for e in r.input + r.output})
+        self.assertTrue(is_model_file(self.path))
+        with Entity.scope():
+            read = read_model(self.path)
+            self.assertEqual(line_strings(read), expected)
+            # entities shared by several tuples are read as one object
+            self.assertEqual(len({id(e) for reqs in read for r in reqs for e in r.input + r.output}), entity_count)
+
+    def test_not_model_file(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('The system shall start.\n' * 4)
+        self.assertFalse(is_model_file(self.path))
+        with self.assertRaises(ValueError):
+            read_model(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
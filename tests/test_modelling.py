@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of FSARC.modelling, the requirements modelled in batches or in worker processes are compared with those
+modelled one by one.
+The requirements are generated by benchmark/corpus.py, and parsed by the stand-in server of fake_corenlp.py.
+"""
+import asyncio, contextlib, io, multiprocessing, os, sys, tempfile, unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..'), os.path.join(HERE, '..', 'benchmark')]
+# the rules and the dictionary are loaded from the parent of the working directory
+os.chdir(HERE)
+
+import config
+config.parse_cache_path = None
+
+import corpus
+from fake_corenlp import FixtureServer
+from FSARC import modelling, nlp
+from FSARC.cache import ParseCache
+from FSARC.Requirement import Entity
+
+
+def modelled_strings(model):
+    modelling.counter.req = modelling.counter.group = 1
+    with Entity.scope(), contextlib.redirect_stdout(io.StringIO()):
+        return [[repr(t) for t in tuples_list] for tuples_list in model()]
+
+
+class ModellingTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FixtureServer(0, {}, synthesize=corpus.annotate)
+        self.server.start()
+        self.port, nlp.CoreNLP_port = nlp.CoreNLP_port, self.server.server_address[1]
+        nlp.cache = None
+
+    def tearDown(self):
+        nlp.close()
+        nlp.CoreNLP_port = self.port
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_spawned_workers(self):
+        # spawned workers inherit nothing of FSARC.nlp, the servers and the cache are given to them
+        texts = list(corpus.generate(150, 11))
+        expected = modelled_strings(lambda: modelling.model_batch(texts))
+        with modelling.modelling_pool(2, multiprocessing.get_context('spawn')) as pool:
+            self.assertEqual(modelled_strings(lambda: modelling.model_parallel(texts, 2, pool)), expected)
+
+    def test_launched_when_needed(self):
+        # the workers ask this process to launch the servers, which a fully cached run does not
+        texts = list(corpus.generate(100, 17))
+        path = os.path.join(tempfile.mkdtemp(), 'parse.sqlite')
+        nlp.cache = ParseCache(path, 1000, nlp.props)
+        with modelling.modelling_pool(2) as pool:
+            cold = modelled_strings(lambda: modelling.model_parallel(texts, 2, pool))
+        self.assertNotEqual(nlp.url, '')
+        nlp.close()
+        nlp.cache = ParseCache(path, 1000, nlp.props)
+        with modelling.modelling_pool(2) as pool:
+            warm = modelled_strings(lambda: modelling.model_parallel(texts, 2, pool))
+        self.assertEqual(nlp.url, '')
+        self.assertEqual(warm, cold)
+        self.assertEqual(modelled_strings(lambda: modelling.model_batch(texts)), cold)
+
+    def test_two_sentences(self):
+        # the first sentence of a text is modelled, whether the text is parsed alone or in a batch
+        texts = ['The operator shall stop. The system shall delete the map.',
+                 'The system shall store the route.  The operator shall check the route.']
+        texts += list(corpus.generate(20, 2))
+        expected = modelled_strings(lambda: [modelling.model(text) for text in texts])
+        self.assertEqual(modelled_strings(lambda: modelling.model_batch(texts)), expected)
+
+    def test_async_cached(self):
+        # the client parses the texts once, then reads them from the cache without any server
+        texts = list(corpus.generate(60, 13))
+        expected = modelled_strings(lambda: modelling.model_batch(texts))
+        nlp.cache = ParseCache(os.path.join(tempfile.mkdtemp(), 'parse.sqlite'), 1000, nlp.props)
+        self.assertEqual(modelled_strings(lambda: asyncio.run(modelling.model_async(texts))), expected)
+        self.server.shutdown()
+        self.assertEqual(modelled_strings(lambda: asyncio.run(modelling.model_async(texts))), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
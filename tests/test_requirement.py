@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the modelling of single requirements, and of Req.str2Req reading back the modelled requirements.
+The parsing results are synthesized by benchmark/corpus.py without CoreNLP.
+"""
+import contextlib, io, os, sys, unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..'), os.path.join(HERE, '..', 'benchmark')]
+# the rules and the dictionary are loaded from the parent of the working directory
+os.chdir(HERE)
+
+import config
+config.parse_cache_path = None
+
+import corpus
+from FSARC import modelling, nlp
+from FSARC.Requirement import Entity, Req
+
+nlp.cache = None
+
+
+def model(text: str):
+    modelling.counter.req = modelling.counter.group = 1
+    with contextlib.redirect_stdout(io.StringIO()):
+        return modelling.model(text)
+
+
+class RequirementTest(unittest.TestCase):
+    def setUp(self):
+        self.request = nlp.request
+        nlp.request = corpus.annotate
+        self.scope = Entity.scope()
+        self.scope.__enter__()
+
+    def tearDown(self):
+        self.scope.__exit__(None, None, None)
+        nlp.request = self.request
+
+    def test_condition(self):
+        # the condition is modelled as the event, and removed from the main clause
+        requirements = model('When the operator sends the map, the system shall store the route.')
+        self.assertEqual([str(r) for r in requirements],
+                         ['(1) , (0) , ({(operator) , (send) , (map) , (map) , (*void*)}) , '
+                          '(system) , (store) , (route) , (route) , (*void*)\n'])
+
+    def test_two_verbs(self):
+        # each verb of a requirement without conditions is a requirement of the group
+        requirements = model('The system shall send and store the map.')
+        self.assertEqual([(r.reqid, r.operation.predicate) for r in requirements], [(1, 'send'), (2, 'store')])
+        self.assertNotEqual(requirements[0].groupid, 0)
+        self.assertEqual(requirements[0].groupid, requirements[1].groupid)
+
+    def test_str2Req(self):
+        texts = ['(1) , (0) , (*always*) , (system) , (ABLE NOT send) , (map) , (map) , (*void*)\n',
+                 '(2) , (0) , ({(operator) , (NOT send) , (map) , (map) , (*void*)}) , '
+                 '(system) , (ABLE store) , (route) , (route) , (*void*)\n']
+        texts += [str(r) for text in corpus.generate(100, 4) for r in model(text)]
+        self.assertEqual([str(Req.str2Req(text.strip())) for text in texts], texts)
+
+
+if __name__ == '__main__':
+    unittest.main()